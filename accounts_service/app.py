@@ -2,7 +2,11 @@ import argparse
 import logging
 
 import uvicorn
+from core.auth import token_verifier
+from core.identity import user_ids
+from core.providers import provider_catalog
 from fastapi import FastAPI
+from models.database import async_engine
 from routes.v1.accounts import router as accounts_router
 
 logging.basicConfig(
@@ -25,6 +29,15 @@ async def root():
     return {"message": "Accounts Service"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "identity_cache": user_ids.cache.stats(),
+        "provider_catalog": provider_catalog.stats(),
+        "token_verifier": token_verifier.stats(),
+    }
+
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Accounts Service starting up...")
@@ -33,6 +46,7 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Accounts Service shutting down...")
+    await async_engine.dispose()
 
 
 if __name__ == "__main__":
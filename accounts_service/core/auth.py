@@ -0,0 +1,64 @@
+import os
+from typing import Set
+
+import jwt
+
+KEYCLOAK_BASE_URL = os.getenv("KEYCLOAK_BASE_URL", "http://keycloak:8080")
+KEYCLOAK_REALM = os.getenv("KEYCLOAK_REALM", "master")
+KEYCLOAK_ISSUER = os.getenv("KEYCLOAK_ISSUER", f"{KEYCLOAK_BASE_URL}/realms/{KEYCLOAK_REALM}")
+KEYCLOAK_AUDIENCE = os.getenv("KEYCLOAK_AUDIENCE", "account")
+KEYCLOAK_JWKS_TTL = float(os.getenv("KEYCLOAK_JWKS_TTL", "300"))
+KEYCLOAK_TIMEOUT = int(os.getenv("KEYCLOAK_TIMEOUT", "5"))
+
+
+class TokenVerifier:
+    """Verifies Keycloak access tokens before any of their claims are trusted.
+
+    Signing keys come from the realm's JWKS endpoint and are cached for
+    ``jwks_ttl`` seconds; an unknown key id refetches them, so key rotation
+    needs no restart. Signature, expiry, issuer and audience are checked.
+    Fetching keys blocks, so ``decode`` belongs in sync dependencies, which
+    FastAPI runs in the threadpool.
+    """
+
+    def __init__(self, base_url: str, realm: str, issuer: str, audience: str, jwks_ttl: float, timeout: int):
+        self.issuer = issuer
+        self.audience = audience
+        self.rejected = 0
+        self._jwks = jwt.PyJWKClient(
+            f"{base_url}/realms/{realm}/protocol/openid-connect/certs",
+            lifespan=jwks_ttl,
+            timeout=timeout,
+        )
+
+    def decode(self, token: str) -> dict:
+        """Returns the verified claims; raises ``jwt.PyJWTError`` otherwise."""
+        try:
+            key = self._jwks.get_signing_key_from_jwt(token)
+            return jwt.decode(
+                token,
+                key.key,
+                algorithms=["RS256"],
+                audience=self.audience,
+                issuer=self.issuer,
+                options={"require": ["exp", "sub"]},
+            )
+        except jwt.PyJWTError:
+            self.rejected += 1
+            raise
+
+    def stats(self) -> dict:
+        return {"issuer": self.issuer, "audience": self.audience, "rejected": self.rejected}
+
+
+def token_roles(payload: dict) -> Set[str]:
+    """Realm roles together with the roles of every client in the token."""
+    roles = set(payload.get("realm_access", {}).get("roles", []))
+    for client in payload.get("resource_access", {}).values():
+        roles.update(client.get("roles", []))
+    return roles
+
+
+token_verifier = TokenVerifier(
+    KEYCLOAK_BASE_URL, KEYCLOAK_REALM, KEYCLOAK_ISSUER, KEYCLOAK_AUDIENCE, KEYCLOAK_JWKS_TTL, KEYCLOAK_TIMEOUT
+)
@@ -0,0 +1,32 @@
+import os
+from typing import Optional
+
+from core.cache import TTLCache
+from models.database import User
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "10000"))
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "3600"))
+
+
+class UserIdResolver:
+    """Maps a Keycloak subject (JWT ``sub``) to the internal ``users.id``."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize, ttl)
+
+    async def resolve(self, db: AsyncSession, keycloak_id: str) -> Optional[int]:
+        user_id = self.cache.get(keycloak_id)
+        if user_id is not None:
+            return user_id
+
+        user_id = await db.scalar(
+            select(User.id).where(User.keycloack_id == keycloak_id).limit(1)
+        )
+        if user_id is not None:
+            self.cache.set(keycloak_id, user_id)
+        return user_id
+
+
+user_ids = UserIdResolver(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
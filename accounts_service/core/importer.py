@@ -0,0 +1,238 @@
+import csv
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from core.providers import provider_catalog
+from models.queries import ACTIVATE_FIRST_ACCOUNT, INSERT_ACCOUNTS, UPSERT_ADDRESSES
+from models.requests import AccountCreate
+from models.responses import AccountImportReport, ImportRowResult
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger("accounts_service.importer")
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+
+CSV_COLUMNS = (
+    "account_number",
+    "provider_id",
+    "region",
+    "city",
+    "street",
+    "house",
+    "apartment",
+    "residents_count",
+    "area",
+)
+
+AddressKey = Tuple[str, str, str, str, str]
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in stream:
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+def format_errors(exc: ValidationError) -> str:
+    messages = []
+    for error in exc.errors():
+        location = ".".join(str(part) for part in error["loc"])
+        messages.append(f"{location}: {error['msg']}" if location else error["msg"])
+    return "; ".join(messages)
+
+
+def parse_ndjson_row(line: bytes) -> AccountCreate:
+    return AccountCreate.model_validate_json(line)
+
+
+def parse_csv_row(header: List[str], line: str) -> AccountCreate:
+    values = next(csv.reader([line]))
+    if len(values) != len(header):
+        raise ValueError(f"Expected {len(header)} columns, got {len(values)}")
+    row = dict(zip(header, values))
+    return AccountCreate.model_validate({
+        "account_number": row["account_number"],
+        "provider_id": row["provider_id"],
+        "address": {
+            "region": row["region"],
+            "city": row["city"],
+            "street": row["street"],
+            "house": row["house"],
+            "apartment": row["apartment"],
+            "residents_count": row["residents_count"],
+            "area": row["area"],
+        },
+    })
+
+
+class AccountImporter:
+    """Streams AccountCreate rows into the database in chunked transactions."""
+
+    def __init__(self, db: AsyncSession, user_id: int, batch_size: int = IMPORT_BATCH_SIZE):
+        self.db = db
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.address_ids: Dict[AddressKey, int] = {}
+        self.seen_numbers: Set[str] = set()
+        self.provider_ids: Optional[Set[int]] = None
+        self.unknown_provider_ids: Set[int] = set()
+        self.results: List[ImportRowResult] = []
+
+    async def run(self, lines: AsyncIterator[bytes], fmt: str) -> AccountImportReport:
+        started = time.perf_counter()
+        await provider_catalog.ensure_loaded(self.db)
+        self.provider_ids = set(provider_catalog.providers)
+
+        batch: List[Tuple[int, AccountCreate]] = []
+        header: Optional[List[str]] = None
+        row_number = 0
+        async for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if fmt == "csv" and header is None:
+                header = [name.strip() for name in next(csv.reader([line.decode("utf-8-sig")]))]
+                missing = [name for name in CSV_COLUMNS if name not in header]
+                if missing:
+                    raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+                continue
+
+            row_number += 1
+            try:
+                if fmt == "csv":
+                    account = parse_csv_row(header, line.decode("utf-8"))
+                else:
+                    account = parse_ndjson_row(line)
+            except ValidationError as e:
+                self.results.append(ImportRowResult(row=row_number, status="invalid", error=format_errors(e)))
+                continue
+            except (ValueError, UnicodeDecodeError) as e:
+                self.results.append(ImportRowResult(row=row_number, status="invalid", error=str(e)))
+                continue
+
+            batch.append((row_number, account))
+            if len(batch) >= self.batch_size:
+                await self.write_batch(batch)
+                batch = []
+
+        if batch:
+            await self.write_batch(batch)
+
+        await self.db.execute(ACTIVATE_FIRST_ACCOUNT, {"user_id": self.user_id})
+        await self.db.commit()
+
+        return self.build_report(row_number, time.perf_counter() - started)
+
+    async def known_provider(self, provider_id: int) -> bool:
+        if provider_id in self.provider_ids:
+            return True
+        if provider_id in self.unknown_provider_ids:
+            return False
+        if await provider_catalog.lookup(self.db, provider_id) is None:
+            self.unknown_provider_ids.add(provider_id)
+            return False
+        self.provider_ids = set(provider_catalog.providers)
+        return True
+
+    async def write_batch(self, batch: List[Tuple[int, AccountCreate]]) -> None:
+        pending: List[Tuple[int, AccountCreate, AddressKey]] = []
+        new_addresses: Dict[AddressKey, AccountCreate] = {}
+        for row_number, account in batch:
+            if not await self.known_provider(account.provider_id):
+                self.results.append(ImportRowResult(
+                    row=row_number,
+                    account_number=account.account_number,
+                    status="invalid",
+                    error=f"provider_id: Provider {account.provider_id} not found",
+                ))
+                continue
+            if account.account_number in self.seen_numbers:
+                self.results.append(ImportRowResult(
+                    row=row_number, account_number=account.account_number, status="duplicate"
+                ))
+                continue
+            self.seen_numbers.add(account.account_number)
+
+            address = account.address
+            key = (address.region, address.city, address.street, address.house, address.apartment)
+            if key not in self.address_ids and key not in new_addresses:
+                new_addresses[key] = account
+            pending.append((row_number, account, key))
+
+        if not pending:
+            return
+
+        try:
+            if new_addresses:
+                keys = list(new_addresses)
+                addresses = [account.address for account in new_addresses.values()]
+                rows = await self.db.execute(UPSERT_ADDRESSES, {
+                    "user_id": self.user_id,
+                    "regions": [a.region for a in addresses],
+                    "cities": [a.city for a in addresses],
+                    "streets": [a.street for a in addresses],
+                    "houses": [a.house for a in addresses],
+                    "flats": [a.apartment for a in addresses],
+                    "residents_counts": [a.residents_count for a in addresses],
+                    "areas": [a.area for a in addresses],
+                })
+                for row in rows:
+                    self.address_ids[keys[row.row_index - 1]] = row.id
+
+            rows = await self.db.execute(INSERT_ACCOUNTS, {
+                "user_id": self.user_id,
+                "account_numbers": [account.account_number for _, account, _ in pending],
+                "address_ids": [self.address_ids[key] for _, _, key in pending],
+                "provider_ids": [account.provider_id for _, account, _ in pending],
+            })
+            created = {row.account_number: row.id for row in rows}
+            await self.db.commit()
+        except SQLAlchemyError as e:
+            await self.db.rollback()
+            for key in new_addresses:
+                self.address_ids.pop(key, None)
+            logger.error(f"Import batch of {len(pending)} rows failed: {e}")
+            for row_number, account, _ in pending:
+                self.results.append(ImportRowResult(
+                    row=row_number,
+                    account_number=account.account_number,
+                    status="failed",
+                    error="Database error",
+                ))
+            return
+
+        for row_number, account, _ in pending:
+            account_id = created.get(account.account_number)
+            self.results.append(ImportRowResult(
+                row=row_number,
+                account_number=account.account_number,
+                status="created" if account_id is not None else "duplicate",
+                account_id=account_id,
+            ))
+        logger.info(f"Imported batch: {len(created)} created, {len(pending) - len(created)} duplicates")
+
+    def build_report(self, total: int, elapsed: float) -> AccountImportReport:
+        self.results.sort(key=lambda result: result.row)
+        counts = {"created": 0, "duplicate": 0, "invalid": 0, "failed": 0}
+        for result in self.results:
+            counts[result.status] += 1
+        return AccountImportReport(
+            total=total,
+            created=counts["created"],
+            duplicates=counts["duplicate"],
+            invalid=counts["invalid"],
+            failed=counts["failed"],
+            elapsed_seconds=round(elapsed, 3),
+            rows_per_second=round(total / elapsed, 1) if elapsed else 0.0,
+            results=self.results,
+        )
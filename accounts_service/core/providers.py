@@ -0,0 +1,157 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from models.database import Provider
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+PROVIDER_CATALOG_TTL = float(os.getenv("PROVIDER_CATALOG_TTL", "300"))
+PROVIDER_FETCH_SIZE = int(os.getenv("PROVIDER_FETCH_SIZE", "500"))
+PROVIDER_NEGATIVE_TTL = float(os.getenv("PROVIDER_NEGATIVE_TTL", "60"))
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or etag is None:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def encode_providers(providers: List[dict]) -> bytes:
+    return json.dumps(
+        jsonable_encoder(providers), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class ProviderCatalog:
+    """In-process copy of the providers table with a pre-serialized payload.
+
+    The catalog reloads after ``ttl`` seconds or after ``invalidate()``;
+    ``version`` is bumped whenever a reload changes the content. Ids still
+    unknown after a reload are remembered for ``negative_ttl`` seconds so
+    they do not trigger another one.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.version = 0
+        self.etag: Optional[str] = None
+        self.payload = b"[]"
+        self.providers: Dict[int, dict] = {}
+        self.ordered: List[dict] = []
+        self._keys: List[Tuple[datetime, int]] = []
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._loaded_at: Optional[float] = None
+        self._unknown: Dict[int, float] = {}
+        self._lock = asyncio.Lock()
+
+    def is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    async def ensure_loaded(self, db: AsyncSession) -> None:
+        if self.is_fresh():
+            self.hits += 1
+            return
+        async with self._lock:
+            if self.is_fresh():
+                self.hits += 1
+                return
+            self.misses += 1
+            await self.load(db)
+
+    async def load(self, db: AsyncSession) -> None:
+        rows = await db.stream_scalars(
+            select(Provider)
+            .order_by(Provider.created_at, Provider.id)
+            .execution_options(yield_per=PROVIDER_FETCH_SIZE)
+        )
+        ordered = [
+            {
+                "id": provider.id,
+                "name": provider.name,
+                "inn": provider.inn,
+                "ogrn": provider.ogrn,
+                "created_at": provider.created_at,
+            }
+            async for provider in rows
+        ]
+        payload = encode_providers(ordered)
+        etag = f'"{hashlib.sha1(payload).hexdigest()}"'
+        if etag != self.etag:
+            self.version += 1
+        self.providers = {provider["id"]: provider for provider in ordered}
+        self.ordered = ordered
+        self._keys = [(provider["created_at"], provider["id"]) for provider in ordered]
+        self.payload = payload
+        self.etag = etag
+        self._unknown = {}
+        self._loaded_at = time.monotonic()
+
+    def get(self, provider_id: int) -> Optional[dict]:
+        return self.providers.get(provider_id)
+
+    async def lookup(self, db: AsyncSession, provider_id: int) -> Optional[dict]:
+        """Returns the provider, reloading once if it is not in the catalog yet.
+
+        A provider created by another instance is missing until the next
+        reload; concurrent misses share one reload instead of each running it,
+        and an id still missing afterwards does not reload again for
+        ``negative_ttl`` seconds.
+        """
+        await self.ensure_loaded(db)
+        provider = self.providers.get(provider_id)
+        if provider is not None or self._unknown.get(provider_id, 0) > time.monotonic():
+            return provider
+        loaded_at = self._loaded_at
+        async with self._lock:
+            if self._loaded_at == loaded_at:
+                self.misses += 1
+                await self.load(db)
+        provider = self.providers.get(provider_id)
+        if provider is None:
+            self._unknown.setdefault(provider_id, time.monotonic() + self.negative_ttl)
+        return provider
+
+    def page(
+        self, after: Optional[Tuple[datetime, int]], limit: int
+    ) -> Tuple[List[dict], Optional[Tuple[datetime, int]]]:
+        start = bisect.bisect_right(self._keys, after) if after is not None else 0
+        items = self.ordered[start:start + limit]
+        if start + limit < len(self.ordered):
+            return items, self._keys[start + limit - 1]
+        return items, None
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "size": len(self.providers),
+            "ttl": self.ttl,
+            "fresh": self.is_fresh(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "unknown": len(self._unknown),
+        }
+
+
+provider_catalog = ProviderCatalog(PROVIDER_CATALOG_TTL, PROVIDER_NEGATIVE_TTL)
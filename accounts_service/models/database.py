@@ -1,7 +1,8 @@
 import os
 from datetime import datetime, timezone
 
-from sqlalchemy import Boolean, Column, DateTime, Float, Integer, String, create_engine, Date
+from sqlalchemy import Boolean, Column, Computed, DateTime, Float, Integer, String, create_engine, Date
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -10,22 +11,38 @@ DATABASE_PASSWORD = os.getenv("DATABASE_PASSWORD", "postgres")
 DATABASE_HOST = os.getenv("DATABASE_HOST", "localhost")
 DATABASE_PORT = os.getenv("DATABASE_PORT", "5432")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "10"))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "20"))
+DATABASE_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
 
 DATABASE_URL = f"postgresql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
+
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DATABASE_POOL_SIZE,
+    max_overflow=DATABASE_MAX_OVERFLOW,
+    pool_timeout=DATABASE_POOL_TIMEOUT,
+    pool_pre_ping=True,
+)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
 Base = declarative_base()
 
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
-    keycloack_id = Column(String, nullable=False)
+    keycloack_id = Column(String, unique=True, index=True, nullable=False)
 
 class Account(Base):
     __tablename__ = "accounts"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False, index=True)
     account_number = Column(String(10), unique=True, index=True, nullable=False)
     address_id = Column(Integer, nullable=False)
     provider_id = Column(Integer, nullable=False)
@@ -57,6 +74,35 @@ class UserAddress(Base):
     residents_counts = Column(Integer, nullable=False)
     area = Column(Float, nullable=False)
     created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    address_key = Column(
+        String,
+        Computed('md5(normalize_address(region, city, street, house, flat))', persisted=True),
+        unique=True,
+    )
+    address_search = Column(
+        String,
+        Computed(
+            "normalize_address_text(region || ' ' || city || ' ' || street || ' ' || house || ' ' || flat)",
+            persisted=True,
+        ),
+    )
+
+
+class AccountSummary(Base):
+    __tablename__ = "account_summaries"
+
+    id = Column("account_id", Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    account_number = Column(String, nullable=False)
+    address_id = Column(Integer, nullable=False, index=True)
+    provider_id = Column(Integer, nullable=False, index=True)
+    address = Column(String, nullable=False)
+    owner_name = Column(String, nullable=False)
+    area = Column(Float, nullable=False)
+    residents_count = Column(Integer, nullable=False)
+    management_company = Column(String, nullable=False)
+    is_active = Column(Boolean, nullable=False)
+    created_at = Column(DateTime, nullable=False)
 
 
 class Provider(Base):
@@ -77,3 +123,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
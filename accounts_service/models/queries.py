@@ -0,0 +1,157 @@
+from sqlalchemy import text
+
+# Creates an account in a single round trip: skips duplicates of the user's
+# live accounts, upserts the address on its normalized key, makes the
+# first live account active and returns the response fields (the provider
+# name comes from the provider catalog).
+CREATE_ACCOUNT = text("""
+WITH duplicate AS (
+    SELECT 1
+    FROM accounts
+    WHERE account_number = :account_number
+      AND user_id = :user_id
+      AND is_deleted = false
+),
+address AS (
+    INSERT INTO user_addresses (
+        user_id, region, city, street, house, flat, residents_counts, area, created_at
+    )
+    SELECT
+        CAST(:user_id AS bigint),
+        CAST(:region AS text),
+        CAST(:city AS text),
+        CAST(:street AS text),
+        CAST(:house AS text),
+        CAST(:flat AS text),
+        CAST(:residents_count AS integer),
+        CAST(:area AS double precision),
+        now() AT TIME ZONE 'utc'
+    WHERE NOT EXISTS (SELECT 1 FROM duplicate)
+    ON CONFLICT (address_key)
+        DO UPDATE SET region = user_addresses.region
+    RETURNING id, city, street, house, flat, residents_counts, area
+),
+account AS (
+    INSERT INTO accounts (
+        user_id, account_number, address_id, provider_id, is_active, is_deleted, created_at
+    )
+    SELECT
+        CAST(:user_id AS bigint),
+        CAST(:account_number AS text),
+        address.id,
+        CAST(:provider_id AS bigint),
+        NOT EXISTS (
+            SELECT 1
+            FROM accounts
+            WHERE user_id = :user_id AND is_deleted = false
+        ),
+        false,
+        now() AT TIME ZONE 'utc'
+    FROM address
+    RETURNING id, account_number, is_active, created_at
+)
+SELECT
+    account.id,
+    account.account_number,
+    account.is_active,
+    account.created_at,
+    address.city,
+    address.street,
+    address.house,
+    address.flat,
+    address.area,
+    address.residents_counts,
+    concat_ws(' ', profile.last_name, profile.first_name, profile.middle_name) AS owner_name
+FROM account
+CROSS JOIN address
+LEFT JOIN user_profiles AS profile ON profile.user_id = :user_id
+""")
+
+# Multi-row address upsert for bulk import. Spellings that normalize to the
+# same address_key are collapsed before the insert (ON CONFLICT cannot touch
+# a row twice in one statement); every input position gets its address id.
+UPSERT_ADDRESSES = text("""
+WITH src AS (
+    SELECT
+        raw.*,
+        md5(normalize_address(raw.region, raw.city, raw.street, raw.house, raw.flat)) AS address_key
+    FROM unnest(
+        CAST(:regions AS text[]),
+        CAST(:cities AS text[]),
+        CAST(:streets AS text[]),
+        CAST(:houses AS text[]),
+        CAST(:flats AS text[]),
+        CAST(:residents_counts AS integer[]),
+        CAST(:areas AS double precision[])
+    ) WITH ORDINALITY AS raw(region, city, street, house, flat, residents_counts, area, row_index)
+),
+upserted AS (
+    INSERT INTO user_addresses (
+        user_id, region, city, street, house, flat, residents_counts, area, created_at
+    )
+    SELECT DISTINCT ON (address_key)
+        CAST(:user_id AS bigint),
+        region,
+        city,
+        street,
+        house,
+        flat,
+        residents_counts,
+        area,
+        now() AT TIME ZONE 'utc'
+    FROM src
+    ORDER BY address_key, row_index
+    ON CONFLICT (address_key)
+        DO UPDATE SET region = user_addresses.region
+    RETURNING id, address_key
+)
+SELECT src.row_index, upserted.id
+FROM src
+JOIN upserted ON upserted.address_key = src.address_key
+""")
+
+# Multi-row account insert for bulk import, skipping numbers the user already
+# holds. Only inserted rows are returned.
+INSERT_ACCOUNTS = text("""
+INSERT INTO accounts (
+    user_id, account_number, address_id, provider_id, is_active, is_deleted, created_at
+)
+SELECT
+    CAST(:user_id AS bigint),
+    src.account_number,
+    src.address_id,
+    src.provider_id,
+    false,
+    false,
+    now() AT TIME ZONE 'utc'
+FROM unnest(
+    CAST(:account_numbers AS text[]),
+    CAST(:address_ids AS bigint[]),
+    CAST(:provider_ids AS bigint[])
+) AS src(account_number, address_id, provider_id)
+WHERE NOT EXISTS (
+    SELECT 1
+    FROM accounts
+    WHERE accounts.account_number = src.account_number
+      AND accounts.user_id = :user_id
+      AND accounts.is_deleted = false
+)
+RETURNING id, account_number
+""")
+
+# Makes the user's oldest live account active unless one already is.
+ACTIVATE_FIRST_ACCOUNT = text("""
+UPDATE accounts
+SET is_active = true
+WHERE id = (
+    SELECT min(id)
+    FROM accounts
+    WHERE user_id = :user_id AND is_deleted = false
+)
+AND NOT EXISTS (
+    SELECT 1
+    FROM accounts
+    WHERE user_id = :user_id AND is_deleted = false AND is_active = true
+)
+""")
+
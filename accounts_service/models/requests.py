@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseModel, Field, validator
 
 class Address(BaseModel):
@@ -33,4 +35,9 @@ class AccountCreate(BaseModel):
         return v
 
 class SetActiveRequest(BaseModel):
-    account_id: int 
+    account_id: int
+
+
+class AccessCheckRequest(BaseModel):
+    account_ids: List[int] = Field(default_factory=list, max_length=1000)
+    account_numbers: List[str] = Field(default_factory=list, max_length=1000)
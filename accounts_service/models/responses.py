@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -16,3 +17,39 @@ class AccountResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class AddressSearchResult(BaseModel):
+    id: int
+    region: str
+    city: str
+    street: str
+    house: str
+    flat: str
+
+    class Config:
+        from_attributes = True
+
+
+class AccessCheckResponse(BaseModel):
+    allowed_ids: List[int]
+    allowed_numbers: List[str]
+
+
+class ImportRowResult(BaseModel):
+    row: int
+    account_number: Optional[str] = None
+    status: str
+    account_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class AccountImportReport(BaseModel):
+    total: int
+    created: int
+    duplicates: int
+    invalid: int
+    failed: int
+    elapsed_seconds: float
+    rows_per_second: float
+    results: List[ImportRowResult]
@@ -1,18 +1,31 @@
 from typing import List, Optional
 
+import os
+
 import jwt
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from models.database import Account, User, UserAddress, Provider, UserProfile, get_db
-from models.requests import AccountCreate, SetActiveRequest
-from models.responses import AccountResponse
-from sqlalchemy.orm import Session
+from core.auth import token_roles, token_verifier
+from core.identity import user_ids
+from core.importer import AccountImporter, iter_lines
+from core.pagination import decode_cursor, encode_cursor
+from core.providers import encode_providers, etag_matches, provider_catalog
+from models.database import Account, AccountSummary, UserAddress, get_async_db
+from models.queries import CREATE_ACCOUNT
+from models.requests import AccessCheckRequest, AccountCreate, SetActiveRequest
+from models.responses import AccessCheckResponse, AccountImportReport, AccountResponse, AddressSearchResult
+from sqlalchemy import String, func, literal, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
 logger = logging.getLogger("accounts_service.routes")
 router = APIRouter()
 security = HTTPBearer()
 
+ACCOUNTS_FETCH_SIZE = 200
+ADDRESS_SEARCH_MAX_TERMS = 6
+PROVIDER_ADMIN_ROLE = os.getenv("PROVIDER_ADMIN_ROLE", "admin")
+
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
@@ -27,161 +40,177 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
+def get_verified_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Claims of a token whose signature, expiry, issuer and audience were checked."""
+    try:
+        return token_verifier.decode(credentials.credentials)
+    except jwt.PyJWTError as e:
+        logger.warning(f"Rejected token: {e}")
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def require_role(role: str):
+    def dependency(payload: dict = Depends(get_verified_token)):
+        if role not in token_roles(payload):
+            raise HTTPException(status_code=403, detail="Access denied")
+
+    return dependency
+
+
+async def get_current_user_id(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_user),
+) -> Optional[int]:
+    return await user_ids.resolve(db, current_user)
+
+
 @router.post("/", response_model=AccountResponse)
 async def add_account(
     account: AccountCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: str = Depends(get_current_user),
+    user_id: Optional[int] = Depends(get_current_user_id),
 ):
     logger.info(f"Creating account for user {current_user}")
-    
-    existing = (
-        db.query(Account)
-        .join(User, Account.user_id == User.id)
-        .filter(
-            Account.account_number == account.account_number,
-            User.keycloack_id == current_user,
-            Account.is_deleted == False,
+
+    if user_id is None:
+        logger.error(f"User not found: {current_user}")
+        raise HTTPException(status_code=404, detail="User not found")
+
+    provider = await provider_catalog.lookup(db, account.provider_id)
+    if provider is None:
+        logger.error(f"Provider not found: {account.provider_id}")
+        raise HTTPException(status_code=404, detail="Provider not found")
+
+    address_data = account.address
+    created = (
+        await db.execute(
+            CREATE_ACCOUNT,
+            {
+                "user_id": user_id,
+                "account_number": account.account_number,
+                "provider_id": account.provider_id,
+                "region": address_data.region,
+                "city": address_data.city,
+                "street": address_data.street,
+                "house": address_data.house,
+                "flat": address_data.apartment,
+                "residents_count": address_data.residents_count,
+                "area": address_data.area,
+            },
         )
-        .first()
-    )
+    ).first()
 
-    if existing:
+    if created is None:
+        await db.rollback()
         logger.error(f"Account with this number already exists: {account.account_number}")
         raise HTTPException(
             status_code=409, detail="Account with this number already exists"
         )
-    
-    user = db.query(User).filter(User.keycloack_id == current_user).first()
-    if not user:
-        logger.error(f"User not found: {current_user}")
-        raise HTTPException(status_code=404, detail="User not found")
-    user_id = user.id
-    
-    address_data = account.address
-    new_address = UserAddress(
-        user_id=user_id,
-        region=address_data.region,
-        city=address_data.city,
-        street=address_data.street,
-        house=address_data.house,
-        flat=address_data.apartment,
-        residents_counts=address_data.residents_count,
-        area=address_data.area,
-    )
-    address_existing = db.query(UserAddress).filter(
-        UserAddress.region == address_data.region,
-        UserAddress.city == address_data.city,
-        UserAddress.street == address_data.street,
-        UserAddress.house == address_data.house,
-        UserAddress.flat == address_data.apartment
-    ).first()
-    
-    if not address_existing:
-        logger.info(f"Adding new address to db {address_data.street}")
-        db.add(new_address)
-        db.flush()
-        address_id = new_address.id
-    else:
-        address_id = address_existing.id
-
-    user_accounts_count = (
-        db.query(Account).filter(Account.user_id == user_id, Account.is_deleted == False).count()
-    )
-    is_first_account = user_accounts_count == 0
-
-    db_account = Account(
-        account_number=account.account_number,
-        user_id=user_id,
-        address_id=address_id,
-        provider_id=account.provider_id,
-        is_active=is_first_account,
-        is_deleted=False,
-    )
+    await db.commit()
+
+    logger.info(f"Account created successfully: {created.account_number}")
+    address_str = f"{created.city}, {created.street}, {created.house}, кв. {created.flat}"
 
-    db.add(db_account)
-    db.commit()
-    db.refresh(db_account)
-
-    logger.info(f"Account created successfully: {db_account.account_number}")
-    account_data = (
-        db.query(Account, UserAddress, UserProfile, Provider)
-        .join(UserAddress, Account.address_id == UserAddress.id)
-        .join(UserProfile, Account.user_id == UserProfile.user_id)
-        .join(Provider, Account.provider_id == Provider.id)
-        .filter(Account.id == db_account.id, Account.is_deleted == False)
-        .first()
-    )
-    
-    account, address, profile, provider = account_data
-    address_str = f"{address.city}, {address.street}, {address.house}, кв. {address.flat}"
-    owner_name = f"{profile.last_name} {profile.first_name} {profile.middle_name}"
-    
     return AccountResponse(
-        id=account.id,
-        account_number=account.account_number,
+        id=created.id,
+        account_number=created.account_number,
         address=address_str,
-        owner_name=owner_name,
-        area=address.area,
-        residents_count=address.residents_counts,
-        management_company=provider.name,
-        is_active=account.is_active,
-        created_at=account.created_at
+        owner_name=created.owner_name,
+        area=created.area,
+        residents_count=created.residents_counts,
+        management_company=provider["name"],
+        is_active=created.is_active,
+        created_at=created.created_at
     )
 
 
+@router.post("/import", response_model=AccountImportReport)
+async def import_accounts(
+    request: Request,
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(ndjson|csv)$"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_user),
+    user_id: Optional[int] = Depends(get_current_user_id),
+):
+    if user_id is None:
+        logger.error(f"User not found: {current_user}")
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if fmt is None:
+        fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    logger.info(f"Importing accounts ({fmt}) for user {current_user}")
+
+    importer = AccountImporter(db, user_id)
+    try:
+        report = await importer.run(iter_lines(request.stream()), fmt)
+    except ValueError as e:
+        logger.error(f"Account import rejected: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(
+        f"Imported {report.created} of {report.total} accounts for user {current_user} "
+        f"in {report.elapsed_seconds}s ({report.rows_per_second} rows/s)"
+    )
+    return report
+
+
 @router.get("/", response_model=List[AccountResponse])
 async def get_accounts(
-    db: Session = Depends(get_db), 
-    current_user: str = Depends(get_current_user)
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: str = Depends(get_current_user),
+    user_id: Optional[int] = Depends(get_current_user_id),
 ):
     logger.info(f"Getting accounts for user {current_user}")
-    
-    accounts_data = (
-        db.query(Account, UserAddress, UserProfile, Provider)
-        .join(UserAddress, Account.address_id == UserAddress.id)
-        .join(UserProfile, Account.user_id == UserProfile.user_id)
-        .join(Provider, Account.provider_id == Provider.id)
-        .join(User, Account.user_id == User.id)
-        .filter(User.keycloack_id == current_user, Account.is_deleted == False)
-        .all()
-    )
-    
-    result = []
-    for account, address, profile, provider in accounts_data:
-        address_str = f"{address.city}, {address.street}, {address.house}, кв. {address.flat}"
-        owner_name = f"{profile.last_name} {profile.first_name} {profile.middle_name}"
-        
-        result.append(AccountResponse(
-            id=account.id,
-            account_number=account.account_number,
-            address=address_str,
-            owner_name=owner_name,
-            area=address.area,
-            residents_count=address.residents_counts,
-            management_company=provider.name,
-            is_active=account.is_active,
-            created_at=account.created_at
-        ))
-    
-    logger.info(f"Found {len(result)} accounts for user {current_user}")
-    return result
+
+    if user_id is None:
+        logger.info(f"Found 0 accounts for user {current_user}")
+        return []
+
+    query = select(AccountSummary).where(AccountSummary.user_id == user_id)
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(tuple_(AccountSummary.created_at, AccountSummary.id) > tuple_(*after))
+
+    # Without limit or cursor every account is returned, as before pagination.
+    query = query.order_by(AccountSummary.created_at, AccountSummary.id)
+    if limit is not None or cursor is not None:
+        limit = limit or 100
+        query = query.limit(limit + 1)
+
+    rows = await db.stream_scalars(query.execution_options(yield_per=ACCOUNTS_FETCH_SIZE))
+    summaries = []
+    async for summary in rows:
+        if len(summaries) == limit:
+            last = summaries[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+            break
+        summaries.append(summary)
+    await rows.close()
+
+    logger.info(f"Found {len(summaries)} accounts for user {current_user}")
+    return summaries
 
 
 @router.delete("/{account_id}")
 async def delete_account(
     account_id: int,
-    db: Session = Depends(get_db),
-    current_user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user_id: Optional[int] = Depends(get_current_user_id),
 ):
-    account = (
-        db.query(Account)
-        .join(User, Account.user_id == User.id)
-        .filter(Account.id == account_id, 
-                User.keycloack_id == current_user,
-                Account.is_deleted == False
-                )
-        .first()
+    account = await db.scalar(
+        select(Account)
+        .where(Account.id == account_id, 
+               Account.user_id == user_id,
+               Account.is_deleted == False
+               )
+        .limit(1)
     )
 
     if not account:
@@ -194,17 +223,17 @@ async def delete_account(
     account.is_active = False
 
     if was_active:
-        other_account = (
-            db.query(Account)
-            .filter(Account.user_id == account.user_id, 
+        other_account = await db.scalar(
+            select(Account)
+            .where(Account.user_id == account.user_id, 
                    Account.id != account_id,
                    Account.is_deleted == False)
-            .first()
+            .limit(1)
         )
         if other_account:
             other_account.is_active = True
 
-    db.commit()
+    await db.commit()
     logger.info(f"Account {account_id} deleted successfully")
     return {"message": "Account deleted successfully"}
 
@@ -212,85 +241,156 @@ async def delete_account(
 @router.put("/set-active")
 async def set_active_account(
     request: SetActiveRequest,
-    db: Session = Depends(get_db),
-    current_user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user_id: Optional[int] = Depends(get_current_user_id),
 ):
     logger.info(f"Setting account {request.account_id} active")
-    new_active = (
-        db.query(Account).
-        join(User, Account.user_id == User.id)
-        .filter(Account.id == request.account_id, 
-               User.keycloack_id == current_user,
+    new_active = await db.scalar(
+        select(Account)
+        .where(Account.id == request.account_id, 
+               Account.user_id == user_id,
                Account.is_deleted == False)
-        .first()
+        .limit(1)
     )
 
     if not new_active:
         raise HTTPException(status_code=404, detail="Account not found")
 
-    db.query(Account).filter(Account.user_id == new_active.user_id, Account.is_deleted == False).update(
-        {"is_active": False}
+    await db.execute(
+        update(Account)
+        .where(Account.user_id == new_active.user_id, Account.is_deleted == False)
+        .values(is_active=False)
     )
 
     new_active.is_active = True
-    db.commit()
+    await db.commit()
 
     return {"message": "Active account updated successfully"}
 
 
 @router.get("/active", response_model=Optional[AccountResponse])
 async def get_active_account(
-    db: Session = Depends(get_db), current_user: str = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db), user_id: Optional[int] = Depends(get_current_user_id)
 ):
-    account_data = (
-        db.query(Account, UserAddress, UserProfile, Provider)
-        .join(UserAddress, Account.address_id == UserAddress.id)
-        .join(UserProfile, Account.user_id == UserProfile.user_id)
-        .join(Provider, Account.provider_id == Provider.id)
-        .join(User, Account.user_id == User.id)
-        .filter(User.keycloack_id == current_user, Account.is_active == True, Account.is_deleted == False)
-        .first()
-    )
-
-    if not account_data:
+    if user_id is None:
         return None
-        
-    account, address, profile, provider = account_data
-    address_str = f"{address.city}, {address.street}, {address.house}, кв. {address.flat}"
-    owner_name = f"{profile.last_name} {profile.first_name} {profile.middle_name}"
-    
-    return AccountResponse(
-        id=account.id,
-        account_number=account.account_number,
-        address=address_str,
-        owner_name=owner_name,
-        area=address.area,
-        residents_count=address.residents_counts,
-        management_company=provider.name,
-        is_active=account.is_active,
-        created_at=account.created_at
+
+    return await db.scalar(
+        select(AccountSummary)
+        .where(AccountSummary.user_id == user_id, AccountSummary.is_active == True)
+        .limit(1)
     )
 
 @router.get('/providers')
 async def get_providers(
-    db: Session = Depends(get_db),
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: str = Depends(get_current_user)
 ):
-    providers = db.query(Provider).all()
-    return providers
+    await provider_catalog.ensure_loaded(db)
+
+    if limit is not None or cursor is not None:
+        try:
+            after = decode_cursor(cursor) if cursor is not None else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        providers, last_key = provider_catalog.page(after, limit or 100)
+        headers = {"X-Next-Cursor": encode_cursor(*last_key)} if last_key else None
+        return Response(content=encode_providers(providers), media_type="application/json", headers=headers)
+
+    headers = {"ETag": provider_catalog.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), provider_catalog.etag):
+        provider_catalog.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=provider_catalog.payload, media_type="application/json", headers=headers)
+
+
+@router.post('/providers/invalidate', dependencies=[Depends(require_role(PROVIDER_ADMIN_ROLE))])
+async def invalidate_providers(
+    db: AsyncSession = Depends(get_async_db),
+    token: dict = Depends(get_verified_token)
+):
+    logger.info(f"Provider catalog invalidated by user {token['sub']}")
+    provider_catalog.invalidate()
+    await provider_catalog.ensure_loaded(db)
+    return {"version": provider_catalog.version}
+
+
+@router.get('/addresses/search', response_model=List[AddressSearchResult])
+async def search_addresses(
+    q: str = Query(..., min_length=3, max_length=200),
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db),
+    user_id: Optional[int] = Depends(get_current_user_id)
+):
+    terms = q.split()[:ADDRESS_SEARCH_MAX_TERMS]
+    if user_id is None or not terms:
+        return []
+
+    # Addresses are shared between users, so only those behind the caller's own
+    # accounts are searched; the candidates come from accounts_user_id_index
+    # and are few enough to filter and rank by trigram distance directly.
+    query = select(UserAddress).where(
+        UserAddress.id.in_(
+            select(Account.address_id).where(Account.user_id == user_id, Account.is_deleted == False)
+        )
+    )
+    for term in terms:
+        pattern = literal("%", String).concat(func.normalize_address_text(term, type_=String)).concat("%")
+        query = query.where(UserAddress.address_search.like(pattern))
+    query = query.order_by(
+        UserAddress.address_search.op("<->")(func.normalize_address_text(q)),
+        UserAddress.id,
+    ).limit(limit)
+
+    return (await db.scalars(query)).all()
 
 
 @router.get('/has-access')
 async def has_access_to_account(
     account_id: int,
-    db: Session = Depends(get_db),
-    current_user: str = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    user_id: Optional[int] = Depends(get_current_user_id)
 ):
-    account = db.query(Account).join(User, Account.user_id == User.id).filter(
-        Account.id == account_id, 
-        User.keycloack_id == current_user,
-        Account.is_deleted == False
-    ).first()
+    account = await db.scalar(
+        select(Account).where(
+            Account.id == account_id, 
+            Account.user_id == user_id,
+            Account.is_deleted == False
+        ).limit(1)
+    )
     if account is None:
         raise HTTPException(status_code=403, detail="Access denied")
-    return {"has_access": True}
\ No newline at end of file
+    return {"has_access": True}
+
+
+@router.post('/access-check', response_model=AccessCheckResponse)
+async def check_access_to_accounts(
+    request: AccessCheckRequest,
+    db: AsyncSession = Depends(get_async_db),
+    user_id: Optional[int] = Depends(get_current_user_id)
+):
+    if user_id is None or not (request.account_ids or request.account_numbers):
+        return AccessCheckResponse(allowed_ids=[], allowed_numbers=[])
+
+    rows = (
+        await db.execute(
+            select(Account.id, Account.account_number).where(
+                Account.user_id == user_id,
+                Account.is_deleted == False,
+                or_(
+                    Account.id.in_(request.account_ids),
+                    Account.account_number.in_(request.account_numbers),
+                ),
+            )
+        )
+    ).all()
+
+    requested_ids = set(request.account_ids)
+    requested_numbers = set(request.account_numbers)
+    return AccessCheckResponse(
+        allowed_ids=[row.id for row in rows if row.id in requested_ids],
+        allowed_numbers=[row.account_number for row in rows if row.account_number in requested_numbers],
+    )
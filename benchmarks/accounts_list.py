@@ -0,0 +1,106 @@
+"""Concurrent load test for GET /api/v1/accounts/.
+
+Runs the same workload against one or more deployments of accounts_service and
+prints throughput and latency percentiles side by side, e.g. the previous build
+(sync sessions) against the current one (async sessions):
+
+    python benchmarks/accounts_list.py \
+        --target before=http://localhost:8011 \
+        --target after=http://localhost:8001 \
+        --concurrency 100 --requests 5000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+import jwt
+
+
+def make_token(sub: str) -> str:
+    return jwt.encode({"sub": sub}, "benchmark", algorithm="HS256")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run_target(url, path, token, concurrency, total):
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+        headers = {"Authorization": f"Bearer {token}"}
+
+        async def worker():
+            nonlocal errors
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path, headers=headers)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed if elapsed else 0.0,
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--target", action="append", required=True,
+        help="label=base_url, may be repeated",
+    )
+    parser.add_argument("--path", type=str, default="/api/v1/accounts/")
+    parser.add_argument("--sub", type=str, default="test_user_123")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    args = parser.parse_args()
+
+    token = make_token(args.sub)
+    results = []
+    for target in args.target:
+        label, sep, url = target.partition("=")
+        if not sep:
+            label, url = target, target
+        await run_target(url, args.path, token, args.concurrency, args.warmup)
+        results.append((label, await run_target(url, args.path, token, args.concurrency, args.requests)))
+
+    print(f"{'target':<12}{'req/s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for label, r in results:
+        print(
+            f"{label:<12}{r['rps']:>10.1f}{r['mean']:>10.1f}{r['p50']:>10.1f}"
+            f"{r['p95']:>10.1f}{r['p99']:>10.1f}{r['errors']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""What payment_service's gateway client reports for scripted gateway failures.
+
+Each scenario answers the client's attempts in order through an in-process
+transport, so no gateway is needed, and the outcome the caller sees is
+compared with the expected one:
+
+    python benchmarks/gateway_outcomes.py
+
+    answered NNN  the gateway's answer, handled as charged or declined
+    not sent      no attempt reached the gateway; the payment can be failed
+    unknown       an attempt may have charged the card; the payment stays
+                  processing until jobs/reconcile.py settles it
+
+Exits non-zero if any scenario ends differently, e.g. a 503 on a retry being
+returned as a decline after a read timeout may have charged the card.
+"""
+import asyncio
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "payment_service"))
+
+from core.gateway import ChargeOutcomeUnknown, PaymentGatewayClient, charge_not_sent  # noqa: E402
+from core.resilience import CircuitBreaker, RetryBudget  # noqa: E402
+
+PAYMENT = {"amount": 177.5, "inn_receiver": "770100123456"}
+
+# (name, idempotency key, answers to successive attempts, expected outcome)
+SCENARIOS = [
+    ("success", "payment-1", [200], "answered 200"),
+    ("503, then success", "payment-2", [503, 200], "answered 200"),
+    ("connect errors only", "payment-3", [httpx.ConnectError] * 3, "not sent"),
+    ("503 without idempotency key", None, [503], "answered 503"),
+    ("read timeout without idempotency key", None, [httpx.ReadTimeout], "unknown"),
+    ("slow gateway: read timeout, then 503", "payment-4", [httpx.ReadTimeout, 503, 503], "unknown"),
+    ("read timeout, then connect errors", "payment-5", [httpx.ReadTimeout] + [httpx.ConnectError] * 2, "unknown"),
+    ("503 on every attempt", "payment-6", [503] * 3, "unknown"),
+]
+
+
+def make_client(answers) -> PaymentGatewayClient:
+    answers = iter(answers)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        answer = next(answers)
+        if isinstance(answer, int):
+            return httpx.Response(answer, json={"status": "success"}, request=request)
+        raise answer("scripted failure", request=request)
+
+    client = PaymentGatewayClient(
+        "http://gateway",
+        connect_timeout=1,
+        read_timeout=1,
+        max_connections=1,
+        max_keepalive=1,
+        http2=False,
+        deadline=5,
+        max_attempts=3,
+        backoff_base=0.0,
+        backoff_max=0.0,
+        breaker=CircuitBreaker(failure_threshold=100, reset_timeout=30, half_open_calls=1),
+        retry_budget=RetryBudget(ratio=1.0, min_per_second=10, capacity=10),
+    )
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    return client
+
+
+async def outcome(key, answers) -> str:
+    client = make_client(answers)
+    try:
+        response = await client.charge(PAYMENT, key)
+        return f"answered {response.status_code}"
+    except ChargeOutcomeUnknown:
+        return "unknown"
+    except httpx.HTTPError as e:
+        return "not sent" if charge_not_sent(e) else "unknown"
+    finally:
+        await client.close()
+
+
+async def main() -> int:
+    failures = 0
+    for name, key, answers, expected in SCENARIOS:
+        got = await outcome(key, answers)
+        ok = got == expected
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':<5}{name:<42}{got:<15}expected {expected}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
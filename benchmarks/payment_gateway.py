@@ -0,0 +1,105 @@
+"""Payments/sec against payment_mock_service with the old and the pooled client.
+
+    blocking  what create_payment used to do: a blocking requests.post with a
+              fresh connection per payment, called from the event loop
+    pooled    the shared httpx.AsyncClient used by payment_service now
+
+    python benchmarks/payment_gateway.py --url http://localhost:8004 \
+        --concurrency 100 --requests 5000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+import requests
+
+PAYMENT = {
+    "amount": 177.5,
+    "card_number": "4111111111111111",
+    "card_holder": "IVAN PETROV",
+    "card_expiration_date": "2030-12-31",
+    "card_cvv": "123",
+    "inn_receiver": "770100123456",
+}
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run_mode(mode, url, concurrency, total, http2):
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0, http2=http2) as client:
+
+        async def pay():
+            if mode == "blocking":
+                return requests.post(f"{url}/api/v1/payments/", json=PAYMENT).status_code
+            return (await client.post("/api/v1/payments/", json=PAYMENT)).status_code
+
+        async def worker():
+            nonlocal errors
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                started = time.perf_counter()
+                try:
+                    if await pay() != 200:
+                        errors += 1
+                except (httpx.HTTPError, requests.RequestException):
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "payments": total,
+        "errors": errors,
+        "pps": total / elapsed if elapsed else 0.0,
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", type=str, default="http://localhost:8004")
+    parser.add_argument("--mode", choices=["blocking", "pooled"], action="append")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--http2", action="store_true")
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.mode or ["blocking", "pooled"]:
+        await run_mode(mode, args.url, args.concurrency, args.warmup, args.http2)
+        results.append((mode, await run_mode(mode, args.url, args.concurrency, args.requests, args.http2)))
+
+    print(f"{'mode':<12}{'pay/s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for mode, r in results:
+        print(
+            f"{mode:<12}{r['pps']:>10.1f}{r['mean']:>10.1f}{r['p50']:>10.1f}"
+            f"{r['p95']:>10.1f}{r['p99']:>10.1f}{r['errors']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
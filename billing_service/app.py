@@ -2,6 +2,10 @@ import argparse
 import logging
 
 import uvicorn
+from core.access import access_client
+from core.auth import token_verifier
+from core.statistics import statistics_cache
+from core.tariffs import tariff_cache
 from fastapi import FastAPI
 from routes.v1.bills import router as bills_router
 
@@ -25,14 +29,28 @@ async def root():
     return {"message": "Billing Service"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "access_cache": access_client.stats(),
+        "token_verifier": token_verifier.stats(),
+        "tariff_cache": tariff_cache.stats(),
+        "statistics_cache": statistics_cache.stats(),
+    }
+
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Billing Service starting up...")
+    await access_client.start()
+    await tariff_cache.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Billing Service shutting down...")
+    await access_client.close()
+    await tariff_cache.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+import os
+from typing import Iterable, Optional, Set
+
+import httpx
+from core.cache import TTLCache
+
+ACCOUNTS_SERVICE_URL = os.getenv("ACCOUNTS_SERVICE_URL", "http://accounts-service:8000")
+ACCESS_CACHE_SIZE = int(os.getenv("ACCESS_CACHE_SIZE", "50000"))
+ACCESS_CACHE_TTL = float(os.getenv("ACCESS_CACHE_TTL", "60"))
+ACCESS_NEGATIVE_CACHE_TTL = float(os.getenv("ACCESS_NEGATIVE_CACHE_TTL", "10"))
+ACCESS_TIMEOUT = float(os.getenv("ACCESS_TIMEOUT", "2"))
+
+
+class AccountAccessClient:
+    """Asks accounts_service which accounts a user may see and caches the answer.
+
+    Grants are cached for ``ttl`` seconds and denials for ``negative_ttl``
+    seconds, keyed by (JWT subject, account number).
+    """
+
+    def __init__(self, base_url: str, maxsize: int, ttl: float, negative_ttl: float, timeout: float):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(maxsize, ttl)
+        self.requests = 0
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def allowed_numbers(self, token: str, subject: str, account_numbers: Iterable[str]) -> Set[str]:
+        allowed = set()
+        missing = []
+        for account_number in set(account_numbers):
+            cached = self.cache.get((subject, account_number))
+            if cached is None:
+                missing.append(account_number)
+            elif cached:
+                allowed.add(account_number)
+
+        if missing:
+            if self._client is None:
+                await self.start()
+            self.requests += 1
+            response = await self._client.post(
+                "/api/v1/accounts/access-check",
+                json={"account_numbers": missing},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            response.raise_for_status()
+            granted = set(response.json()["allowed_numbers"])
+            for account_number in missing:
+                if account_number in granted:
+                    self.cache.set((subject, account_number), True)
+                    allowed.add(account_number)
+                else:
+                    self.cache.set((subject, account_number), False, ttl=self.negative_ttl)
+        return allowed
+
+    async def has_access(self, token: str, subject: str, account_number: str) -> bool:
+        return account_number in await self.allowed_numbers(token, subject, [account_number])
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "negative_ttl": self.negative_ttl, "remote_checks": self.requests}
+
+
+access_client = AccountAccessClient(
+    ACCOUNTS_SERVICE_URL,
+    ACCESS_CACHE_SIZE,
+    ACCESS_CACHE_TTL,
+    ACCESS_NEGATIVE_CACHE_TTL,
+    ACCESS_TIMEOUT,
+)
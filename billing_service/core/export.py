@@ -0,0 +1,157 @@
+import csv
+import io
+import json
+import logging
+import os
+import zlib
+from datetime import date
+from typing import Iterator, List, Optional
+
+from core.tariffs import tariff_cache
+from models.database import Account, Bill, SessionLocal
+from sqlalchemy import func, select
+
+logger = logging.getLogger("billing_service.export")
+
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "5000"))
+
+EXPORT_COLUMNS = (
+    "bill_id",
+    "account_number",
+    "period",
+    "service_id",
+    "service_name",
+    "provider_id",
+    "cost_per_unit",
+    "units",
+    "amount",
+    "status",
+    "last_data",
+)
+
+
+class BillExport:
+    """Streams bill history as CSV or NDJSON chunks, optionally gzip-compressed.
+
+    Rows are read through a server-side cursor ``fetch_size`` at a time with a
+    session owned by the generator, so memory stays flat for any row count and
+    the session lives exactly as long as the response body. Rows come in
+    ``bills_account_id_period_service_id_unique`` order, so the partitions are
+    merged from their indexes and the first chunk streams without a full sort.
+    Tariffs are reloaded when the export starts: the provider filter and the
+    service columns must not depend on whether the cache was loaded already.
+    """
+
+    def __init__(
+        self,
+        fmt: str,
+        compress: bool,
+        provider_id: Optional[int] = None,
+        account_from: Optional[str] = None,
+        account_to: Optional[str] = None,
+        period_start: Optional[date] = None,
+        period_end: Optional[date] = None,
+        fetch_size: int = EXPORT_FETCH_SIZE,
+    ):
+        self.fmt = fmt
+        self.compress = compress
+        self.provider_id = provider_id
+        self.account_from = account_from
+        self.account_to = account_to
+        self.period_start = period_start
+        self.period_end = period_end
+        self.fetch_size = fetch_size
+        self.rows = 0
+
+    @property
+    def filename(self) -> str:
+        return f"bills.{self.fmt}" + (".gz" if self.compress else "")
+
+    @property
+    def media_type(self) -> str:
+        if self.compress:
+            return "application/gzip"
+        return "text/csv; charset=utf-8" if self.fmt == "csv" else "application/x-ndjson"
+
+    def query(self):
+        query = (
+            select(
+                Bill.id,
+                Account.account_number,
+                func.to_char(Bill.period, "YYYY-MM").label("period"),
+                Bill.service_id,
+                Bill.units,
+                Bill.amount,
+                Bill.status_type,
+                Bill.last_data,
+            )
+            .join(Account, Account.id == Bill.account_id)
+            .order_by(Bill.account_id, Bill.period, Bill.service_id)
+        )
+        if self.provider_id is not None:
+            service_ids = [s.id for s in tariff_cache.services.values() if s.provider_id == self.provider_id]
+            query = query.where(Bill.service_id.in_(service_ids))
+        if self.account_from is not None:
+            query = query.where(Account.account_number >= self.account_from)
+        if self.account_to is not None:
+            query = query.where(Account.account_number <= self.account_to)
+        if self.period_start is not None:
+            query = query.where(Bill.period >= self.period_start)
+        if self.period_end is not None:
+            query = query.where(Bill.period < self.period_end)
+        return query.execution_options(yield_per=self.fetch_size)
+
+    def serialize(self, rows: List) -> str:
+        records = []
+        for row in rows:
+            service = tariff_cache.services.get(row.service_id)
+            records.append((
+                row.id,
+                row.account_number,
+                row.period,
+                row.service_id,
+                service.service_name if service else None,
+                service.provider_id if service else None,
+                service.cost_per_unit if service else None,
+                row.units,
+                float(row.amount),
+                row.status_type,
+                row.last_data,
+            ))
+        if self.fmt == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator="\n").writerows(records)
+            return buffer.getvalue()
+        return "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, record)), ensure_ascii=False) + "\n" for record in records
+        )
+
+    def chunks(self) -> Iterator[bytes]:
+        if self.fmt == "csv":
+            chunks = self._text_chunks(",".join(EXPORT_COLUMNS) + "\n")
+        else:
+            chunks = self._text_chunks("")
+        if not self.compress:
+            yield from chunks
+            return
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    def _text_chunks(self, header: str) -> Iterator[bytes]:
+        if header:
+            yield header.encode("utf-8")
+        tariff_cache.load()
+        db = SessionLocal()
+        try:
+            result = db.execute(self.query())
+            for rows in result.partitions():
+                self.rows += len(rows)
+                yield self.serialize(rows).encode("utf-8")
+        finally:
+            db.close()
+            logger.info(f"Exported {self.rows} bill rows as {self.filename}")
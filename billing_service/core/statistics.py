@@ -0,0 +1,107 @@
+import os
+from itertools import groupby
+from typing import Optional, Tuple
+
+from core.cache import TTLCache
+from core.tariffs import tariff_cache
+from models.database import Account, AccountUsage, AccountUsageVersion
+from models.responses import MonthlyUsage, ServiceStatistics, StatisticsResponse
+from sqlalchemy import Date, cast, func, select
+from sqlalchemy.orm import Session, aliased
+
+STATISTICS_CACHE_SIZE = int(os.getenv("STATISTICS_CACHE_SIZE", "10000"))
+STATISTICS_CACHE_TTL = float(os.getenv("STATISTICS_CACHE_TTL", "600"))
+
+statistics_cache = TTLCache(STATISTICS_CACHE_SIZE, STATISTICS_CACHE_TTL)
+
+
+def statistics_key(db: Session, account_number: str, months: int) -> Optional[Tuple[int, int, int]]:
+    """Cache key of the account's statistics, or None if there is no such account.
+
+    The key includes the account's account_usage_versions row, which the
+    rollup triggers bump on every change, so paying a bill retires the
+    cached statistics instead of serving them until the TTL runs out.
+    """
+    row = (
+        db.query(Account.id, AccountUsageVersion.version)
+        .outerjoin(AccountUsageVersion, AccountUsageVersion.account_id == Account.id)
+        .filter(Account.account_number == account_number)
+        .first()
+    )
+    if row is None:
+        return None
+    return row.id, months, row.version or 0
+
+
+async def build_statistics(db: Session, account_id: int, account_number: str, months: int) -> StatisticsResponse:
+    """Per-service usage for the account's last ``months`` billed months.
+
+    Reads the account_usage_monthly rollup only: year-over-year deltas come
+    from a self-join on the same month a year earlier and the per-service
+    totals and averages from window functions.
+    """
+    latest = (
+        select(func.max(AccountUsage.period)).where(AccountUsage.account_id == account_id).scalar_subquery()
+    )
+    previous = aliased(AccountUsage)
+    per_service = {"partition_by": AccountUsage.service_id}
+
+    rows = (
+        db.query(
+            AccountUsage.service_id,
+            func.to_char(AccountUsage.period, "YYYY-MM").label("period"),
+            AccountUsage.units,
+            AccountUsage.amount,
+            AccountUsage.paid_amount,
+            (AccountUsage.units - previous.units).label("units_yoy_delta"),
+            (AccountUsage.amount - previous.amount).label("amount_yoy_delta"),
+            func.sum(AccountUsage.units).over(**per_service).label("total_units"),
+            func.sum(AccountUsage.amount).over(**per_service).label("total_amount"),
+            func.avg(AccountUsage.units).over(**per_service).label("average_units"),
+            func.avg(AccountUsage.amount).over(**per_service).label("average_amount"),
+        )
+        .outerjoin(
+            previous,
+            (previous.account_id == AccountUsage.account_id)
+            & (previous.service_id == AccountUsage.service_id)
+            & (previous.period == cast(AccountUsage.period - func.make_interval(1), Date)),
+        )
+        .filter(
+            AccountUsage.account_id == account_id,
+            AccountUsage.period > cast(latest - func.make_interval(0, months), Date),
+        )
+        .order_by(AccountUsage.service_id, AccountUsage.period)
+        .all()
+    )
+
+    services = await tariff_cache.get_many(row.service_id for row in rows)
+    statistics = []
+    for service_id, lines in groupby(rows, key=lambda row: row.service_id):
+        lines = list(lines)
+        statistics.append(ServiceStatistics(
+            service_id=service_id,
+            service_name=services[service_id].service_name,
+            total_units=lines[0].total_units,
+            total_amount=lines[0].total_amount,
+            average_units=round(lines[0].average_units, 3),
+            average_amount=round(lines[0].average_amount, 2),
+            months=[
+                MonthlyUsage(
+                    period=line.period,
+                    units=line.units,
+                    amount=line.amount,
+                    paid_amount=line.paid_amount,
+                    units_yoy_delta=line.units_yoy_delta,
+                    amount_yoy_delta=line.amount_yoy_delta,
+                )
+                for line in lines
+            ],
+        ))
+
+    periods = [row.period for row in rows]
+    return StatisticsResponse(
+        account_number=account_number,
+        period_from=min(periods) if periods else None,
+        period_to=max(periods) if periods else None,
+        services=statistics,
+    )
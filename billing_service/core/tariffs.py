@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set
+
+from models.database import Service, SessionLocal
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("billing_service.tariffs")
+
+TARIFF_REFRESH_INTERVAL = float(os.getenv("TARIFF_REFRESH_INTERVAL", "300"))
+TARIFF_NEGATIVE_TTL = float(os.getenv("TARIFF_NEGATIVE_TTL", "60"))
+
+
+class UnknownTariffError(LookupError):
+    def __init__(self, service_ids: Set[int]):
+        super().__init__(f"Unknown tariffs: {sorted(service_ids)}")
+        self.service_ids = service_ids
+
+
+class TariffCache:
+    """In-process copy of the services (tariff) table keyed by service id.
+
+    The table is loaded at startup and reloaded every ``refresh_interval``
+    seconds by a background task, or immediately after ``invalidate()``.
+    ``version`` is bumped whenever a reload changes the content. Ids still
+    unknown after a reload are remembered for ``negative_ttl`` seconds so
+    they do not trigger another one.
+    """
+
+    def __init__(self, refresh_interval: float, negative_ttl: float):
+        self.refresh_interval = refresh_interval
+        self.negative_ttl = negative_ttl
+        self.version = 0
+        self.services: Dict[int, Service] = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._signature: Optional[tuple] = None
+        self._loaded_at: Optional[float] = None
+        self._unknown: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._reload_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self) -> None:
+        db = SessionLocal()
+        try:
+            rows = db.query(Service).order_by(Service.id).all()
+            db.expunge_all()
+        finally:
+            db.close()
+
+        signature = tuple(
+            (s.id, s.service_name, s.provider_id, s.cost_per_unit, s.calculation_method) for s in rows
+        )
+        with self._lock:
+            if signature != self._signature:
+                self.version += 1
+                self._signature = signature
+            self.services = {service.id: service for service in rows}
+            self._unknown = {}
+            self._loaded_at = time.monotonic()
+            self.reloads += 1
+            self.last_error = None
+        logger.info(f"Loaded {len(rows)} tariffs, version {self.version}")
+
+    def get(self, service_id: int) -> Optional[Service]:
+        service = self.services.get(service_id)
+        if service is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return service
+
+    async def get_many(self, service_ids: Iterable[int]) -> Dict[int, Service]:
+        """Return the requested tariffs, reloading once if any id is unknown.
+
+        The reload runs in the threadpool and concurrent misses share it.
+        Raises ``UnknownTariffError`` for ids the table does not have.
+        """
+        service_ids = set(service_ids)
+        missing = service_ids.difference(self.services)
+        if not missing:
+            self.hits += 1
+            return {service_id: self.services[service_id] for service_id in service_ids}
+
+        self.misses += 1
+        now = time.monotonic()
+        if any(self._unknown.get(service_id, 0) <= now for service_id in missing):
+            reloads = self.reloads
+            async with self._reload_lock:
+                if self.reloads == reloads:
+                    await run_in_threadpool(self.load)
+            missing = service_ids.difference(self.services)
+            expires_at = time.monotonic() + self.negative_ttl
+            for service_id in missing:
+                self._unknown.setdefault(service_id, expires_at)
+        if missing:
+            raise UnknownTariffError(missing)
+        return {service_id: self.services[service_id] for service_id in service_ids}
+
+    async def invalidate(self) -> None:
+        await run_in_threadpool(self.load)
+
+    async def start(self) -> None:
+        try:
+            await run_in_threadpool(self.load)
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Initial tariff load failed: {e}")
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await run_in_threadpool(self.load)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Tariff refresh failed: {e}")
+
+    def stats(self) -> dict:
+        age = time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+        return {
+            "version": self.version,
+            "size": len(self.services),
+            "refresh_interval": self.refresh_interval,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "stale": age is None or age > self.refresh_interval * 2,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "unknown": len(self._unknown),
+            "last_error": self.last_error,
+        }
+
+
+tariff_cache = TariffCache(TARIFF_REFRESH_INTERVAL, TARIFF_NEGATIVE_TTL)
@@ -0,0 +1,286 @@
+"""Monthly billing run: generates one period of bills for every active account.
+
+    python -m jobs.billing_run --period 2024-10 --readings readings.csv
+    python -m jobs.billing_run --period 2024-10 --dry-run
+
+Each account that is not deleted is billed for every service of its
+provider. The previous line comes from the latest bill within the lookback
+window. Units per line depend on the service's calculation_method:
+
+    metered    reading from --readings minus the previous last_data; the
+               previous volume is carried over when no reading was submitted
+    area       UserAddress.area
+    residents  UserAddress.residents_counts
+    fixed      the previous period's volume
+
+A line with no bill in the lookback window (a new, imported or long idle
+account) has no previous line. A metered service then takes the submitted
+reading as its starting point and bills zero units. A fixed service bills
+one unit.
+
+Inputs are read in bulk with COPY ... TO STDOUT, every line item is computed
+with NumPy, and the bills are written back with COPY ... FROM STDIN in chunks
+of --chunk-size rows, each committed separately. Lines that already exist for
+the period are skipped, so an interrupted run can simply be started again.
+
+The readings file is a CSV with an "account_id,service_id,reading" header.
+"""
+import argparse
+import io
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from core.tariffs import tariff_cache
+from models.database import engine
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("billing_service.billing_run")
+
+BILLING_RUN_CHUNK_SIZE = int(os.getenv("BILLING_RUN_CHUNK_SIZE", "100000"))
+BILLING_RUN_LOOKBACK_MONTHS = int(os.getenv("BILLING_RUN_LOOKBACK_MONTHS", "12"))
+
+METHODS = ("metered", "area", "residents", "fixed")
+METERED, AREA, RESIDENTS, FIXED = range(len(METHODS))
+
+# Every (account, service) pair of the account's provider with the address
+# figures used by area/residents services, and the latest line billed within
+# the lookback window; NaN marks pairs without one.
+PLAN_QUERY = """
+SELECT a.id, s.id, coalesce(b.last_data, 'NaN'), coalesce(b.units, 'NaN'), ad.area, ad.residents_counts
+FROM accounts a
+JOIN services s ON s.provider_id = a.provider_id
+JOIN user_addresses ad ON ad.id = a.address_id
+LEFT JOIN (
+    SELECT DISTINCT ON (account_id, service_id) account_id, service_id, last_data, units
+    FROM bills
+    WHERE period < DATE '{period}' AND period >= DATE '{period}' - INTERVAL '{lookback} months'
+    ORDER BY account_id, service_id, period DESC
+) b ON b.account_id = a.id AND b.service_id = s.id
+WHERE a.is_deleted = false
+  AND NOT EXISTS (
+      SELECT 1 FROM bills c
+      WHERE c.account_id = a.id AND c.service_id = s.id AND c.period = DATE '{period}'
+  )
+ORDER BY a.id, s.id
+"""
+
+COPY_BILLS = (
+    "COPY bills (account_id, service_id, period, amount, status_type, last_data, units) "
+    "FROM STDIN WITH (FORMAT csv)"
+)
+
+
+class Stage:
+    def __init__(self, name: str, rows: Optional[int] = None):
+        self.name = name
+        self.rows = rows
+        self.elapsed = 0.0
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages: List[Stage] = []
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None):
+        stage = Stage(name, rows)
+        started = time.perf_counter()
+        yield stage
+        stage.elapsed = time.perf_counter() - started
+        self.stages.append(stage)
+
+    def report(self) -> str:
+        lines = [f"{'stage':<12}{'seconds':>10}{'rows':>12}{'rows/s':>14}"]
+        for stage in self.stages:
+            rows = stage.rows if stage.rows is not None else ""
+            rate = f"{stage.rows / stage.elapsed:.0f}" if stage.rows and stage.elapsed else ""
+            lines.append(f"{stage.name:<12}{stage.elapsed:>10.2f}{rows:>12}{rate:>14}")
+        lines.append(f"{'total':<12}{sum(stage.elapsed for stage in self.stages):>10.2f}")
+        return "\n".join(lines)
+
+
+def parse_period(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+def copy_out(cursor, query: str, columns: int) -> np.ndarray:
+    buffer = io.StringIO()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", buffer)
+    buffer.seek(0)
+    if not buffer.getvalue():
+        return np.empty((0, columns))
+    return np.loadtxt(buffer, delimiter=",", ndmin=2)
+
+
+def load_tariffs() -> Tuple[np.ndarray, np.ndarray]:
+    """Return cost and method lookup arrays indexed by service id."""
+    tariff_cache.load()
+    size = max(tariff_cache.services, default=0) + 1
+    cost = np.full(size, np.nan)
+    method = np.full(size, -1, dtype=np.int8)
+    for service in tariff_cache.services.values():
+        cost[service.id] = service.cost_per_unit
+        method[service.id] = METHODS.index(service.calculation_method)
+    return cost, method
+
+
+def load_readings(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (sorted account/service keys, readings) from a readings CSV."""
+    data = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+    keys = line_keys(data[:, 0], data[:, 1])
+    order = np.argsort(keys, kind="stable")
+    return keys[order], data[order, 2]
+
+
+def line_keys(account_ids: np.ndarray, service_ids: np.ndarray) -> np.ndarray:
+    return (account_ids.astype(np.int64) << 32) | service_ids.astype(np.int64)
+
+
+def lookup_readings(keys: np.ndarray, reading_keys: np.ndarray, readings: np.ndarray) -> np.ndarray:
+    if not len(reading_keys):
+        return np.full(len(keys), np.nan)
+    index = np.minimum(np.searchsorted(reading_keys, keys), len(reading_keys) - 1)
+    return np.where(reading_keys[index] == keys, readings[index], np.nan)
+
+
+def compute_lines(
+    plan: np.ndarray,
+    cost: np.ndarray,
+    method: np.ndarray,
+    reading_keys: np.ndarray,
+    readings: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    account_ids = plan[:, 0].astype(np.int64)
+    service_ids = plan[:, 1].astype(np.int64)
+    previous_reading, previous_units, area, residents = plan[:, 2], plan[:, 3], plan[:, 4], plan[:, 5]
+
+    line_method = method[service_ids]
+    reading = lookup_readings(line_keys(account_ids, service_ids), reading_keys, readings)
+    has_reading = ~np.isnan(reading)
+
+    first = np.isnan(previous_units)
+    previous_reading = np.where(first, np.where(has_reading, reading, 0.0), previous_reading)
+    previous_units = np.where(first, np.where(line_method == FIXED, 1.0, 0.0), previous_units)
+
+    consumed = np.where(has_reading, reading - previous_reading, previous_units)
+    rollbacks = has_reading & (consumed < 0)
+    consumed = np.maximum(consumed, 0.0)
+
+    units = np.select(
+        [line_method == METERED, line_method == AREA, line_method == RESIDENTS],
+        [consumed, area, residents],
+        default=previous_units,
+    )
+    last_data = np.where(
+        line_method == METERED,
+        np.where(has_reading & ~rollbacks, reading, previous_reading + units),
+        previous_reading,
+    )
+    amount = np.round(units * cost[service_ids], 2)
+
+    return {
+        "account_id": account_ids,
+        "service_id": service_ids,
+        "amount": amount,
+        "last_data": last_data,
+        "units": units,
+        "method": line_method,
+        "has_reading": has_reading,
+        "first": first,
+        "rollbacks": rollbacks,
+    }
+
+
+def write_lines(connection, lines: Dict[str, np.ndarray], period: date, chunk_size: int) -> int:
+    rows = np.column_stack([
+        lines["account_id"], lines["service_id"], lines["amount"], lines["last_data"], lines["units"]
+    ])
+    fmt = f"%d,%d,{period.isoformat()},%.2f,pending,%.3f,%.3f"
+    written = 0
+    cursor = connection.cursor()
+    cursor.execute("SELECT ensure_bills_partition(%s)", (period,))
+    connection.commit()
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        buffer = io.StringIO()
+        np.savetxt(buffer, chunk, fmt=fmt)
+        buffer.seek(0)
+        cursor.copy_expert(COPY_BILLS, buffer)
+        connection.commit()
+        written += len(chunk)
+        logger.info(f"Written {written}/{len(rows)} bill lines")
+    cursor.close()
+    return written
+
+
+def summarize(lines: Dict[str, np.ndarray]) -> str:
+    metered = lines["method"] == METERED
+    per_method = ", ".join(
+        f"{name}: {int(np.count_nonzero(lines['method'] == code))}" for code, name in enumerate(METHODS)
+    )
+    return (
+        f"lines: {len(lines['amount'])} ({per_method}); "
+        f"accounts: {len(np.unique(lines['account_id']))}; "
+        f"total amount: {lines['amount'].sum():.2f}; "
+        f"metered without reading: {int(np.count_nonzero(metered & ~lines['has_reading']))}; "
+        f"without previous line: {int(np.count_nonzero(lines['first']))}; "
+        f"meter rollbacks: {int(np.count_nonzero(lines['rollbacks']))}"
+    )
+
+
+def run(period: date, readings_path: Optional[str], dry_run: bool, chunk_size: int, lookback: int) -> None:
+    timer = StageTimer()
+    connection = engine.raw_connection()
+    try:
+        with timer.stage("tariffs"):
+            cost, method = load_tariffs()
+
+        with timer.stage("readings") as stage:
+            if readings_path:
+                reading_keys, readings = load_readings(readings_path)
+            else:
+                reading_keys, readings = np.empty(0, dtype=np.int64), np.empty(0)
+            stage.rows = len(readings)
+
+        with timer.stage("plan") as stage:
+            cursor = connection.cursor()
+            plan = copy_out(cursor, PLAN_QUERY.format(period=period.isoformat(), lookback=lookback), 6)
+            cursor.close()
+            connection.commit()
+            stage.rows = len(plan)
+
+        with timer.stage("compute", rows=len(plan)):
+            lines = compute_lines(plan, cost, method, reading_keys, readings)
+
+        logger.info(f"Billing run for {period:%Y-%m}: {summarize(lines)}")
+
+        if dry_run:
+            logger.info("Dry run, nothing written")
+        else:
+            with timer.stage("write", rows=len(plan)):
+                write_lines(connection, lines, period, chunk_size)
+    finally:
+        connection.close()
+
+    print(timer.report())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--period", type=parse_period, required=True, help="YYYY-MM")
+    parser.add_argument("--readings", type=str, default=None, help="CSV: account_id,service_id,reading")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--chunk-size", type=int, default=BILLING_RUN_CHUNK_SIZE)
+    parser.add_argument("--lookback", type=int, default=BILLING_RUN_LOOKBACK_MONTHS, help="months")
+    args = parser.parse_args()
+
+    run(args.period, args.readings, args.dry_run, args.chunk_size, args.lookback)
+
+
+if __name__ == "__main__":
+    main()
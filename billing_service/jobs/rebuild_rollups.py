@@ -0,0 +1,72 @@
+"""Rebuilds the trigger-maintained rollups over bills from scratch.
+
+    python -m jobs.rebuild_rollups                      # all rollups
+    python -m jobs.rebuild_rollups --only provider_totals
+
+The triggers on bills keep these tables current; this is the recovery path
+after a trigger was disabled, a bulk fix bypassed them or a rollup is
+suspected to have drifted. Each rollup is rebuilt in its own transaction
+while bills is locked against writes, so no concurrent delta is lost.
+"""
+import argparse
+import logging
+import time
+
+from models.database import engine
+from sqlalchemy import text
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("billing_service.rebuild_rollups")
+
+ROLLUPS = {
+    "provider_totals": [
+        "SELECT rebuild_provider_period_totals()",
+    ],
+    "account_debts": [
+        "SELECT refresh_account_debts(ARRAY(SELECT id FROM accounts))",
+    ],
+    "account_usage": [
+        "DELETE FROM account_usage_monthly",
+        """
+        INSERT INTO account_usage_monthly (account_id, period, service_id, units, amount, paid_amount)
+        SELECT
+            account_id,
+            period,
+            service_id,
+            sum(units),
+            sum(amount),
+            coalesce(sum(amount) FILTER (WHERE status_type = 'paid'), 0)
+        FROM bills
+        GROUP BY account_id, period, service_id
+        """,
+        # Cached statistics are keyed on these versions, so every account's
+        # entry has to be dropped together with the rows it was built from.
+        """
+        INSERT INTO account_usage_versions (account_id, version)
+        SELECT id, 1 FROM accounts
+        ON CONFLICT (account_id) DO UPDATE SET version = account_usage_versions.version + 1
+        """,
+    ],
+}
+
+
+def rebuild(name: str) -> None:
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute(text("LOCK TABLE bills IN SHARE MODE"))
+        for statement in ROLLUPS[name]:
+            connection.execute(text(statement))
+    logger.info(f"Rebuilt {name} in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", choices=sorted(ROLLUPS), action="append")
+    args = parser.parse_args()
+
+    for name in args.only or ROLLUPS:
+        rebuild(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import os
 
-from sqlalchemy import Column, Float, Integer, String, create_engine
+from sqlalchemy import ARRAY, Column, Date, DateTime, Float, Integer, Numeric, String, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -23,17 +23,53 @@ class Service(Base):
     service_name = Column(String, nullable=False)
     provider_id = Column(Integer, nullable=False)
     cost_per_unit = Column(Float, nullable=False)
+    calculation_method = Column(String, nullable=False, default="metered")
 
 class Bill(Base):
     __tablename__ = "bills"
 
     id = Column(Integer, primary_key=True, index=True)
-    account_id = Column(Integer, nullable=False, index=True)
-    period = Column(String(7), nullable=False)
+    account_id = Column(Integer, nullable=False)
+    period = Column(Date, nullable=False)
     amount = Column(Float, nullable=False)
     status_type = Column(String, default="pending")
     service_id = Column(Integer, nullable=False)
     units = Column(Float, nullable=False)
+    last_data = Column(Float, nullable=False)
+
+class AccountDebt(Base):
+    __tablename__ = "account_debts"
+
+    account_id = Column(Integer, primary_key=True)
+    unpaid_periods = Column(ARRAY(Date), nullable=False)
+    outstanding_amount = Column(Numeric(12, 2), nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+class AccountUsage(Base):
+    __tablename__ = "account_usage_monthly"
+
+    account_id = Column(Integer, primary_key=True)
+    period = Column(Date, primary_key=True)
+    service_id = Column(Integer, primary_key=True)
+    units = Column(Float, nullable=False)
+    amount = Column(Numeric(12, 2), nullable=False)
+    paid_amount = Column(Numeric(12, 2), nullable=False)
+
+class AccountUsageVersion(Base):
+    __tablename__ = "account_usage_versions"
+
+    account_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+class ProviderPeriodTotal(Base):
+    __tablename__ = "provider_period_totals"
+
+    provider_id = Column(Integer, primary_key=True)
+    period = Column(Date, primary_key=True)
+    billed_amount = Column(Numeric(14, 2), nullable=False)
+    collected_amount = Column(Numeric(14, 2), nullable=False)
+    bills_count = Column(Integer, nullable=False)
+    paid_bills_count = Column(Integer, nullable=False)
 
 class Account(Base):
     __tablename__ = "accounts"
@@ -23,4 +23,57 @@ class BillResponse(BaseModel):
 
 class UnpaidPeriodsResponse(BaseModel):
     account_number: str
-    unpaid_periods: List[str]
\ No newline at end of file
+    unpaid_periods: List[str]
+    outstanding_amount: float = 0
+
+
+class BillPeriodResponse(BaseModel):
+    period: str
+    total_amount: float
+    status: str
+    services: List[ServiceResponse]
+
+
+class BillRangeResponse(BaseModel):
+    account_number: str
+    period_from: str
+    period_to: str
+    total_amount: float
+    periods: List[BillPeriodResponse]
+
+
+class MonthlyUsage(BaseModel):
+    period: str
+    units: float
+    amount: float
+    paid_amount: float
+    units_yoy_delta: Optional[float] = None
+    amount_yoy_delta: Optional[float] = None
+
+
+class ServiceStatistics(BaseModel):
+    service_id: int
+    service_name: str
+    total_units: float
+    total_amount: float
+    average_units: float
+    average_amount: float
+    months: List[MonthlyUsage]
+
+
+class StatisticsResponse(BaseModel):
+    account_number: str
+    period_from: Optional[str]
+    period_to: Optional[str]
+    services: List[ServiceStatistics]
+
+
+class ProviderPeriodTotals(BaseModel):
+    provider_id: int
+    period: str
+    billed_amount: float
+    collected_amount: float
+    outstanding_amount: float
+    collection_rate: Optional[float]
+    bills_count: int
+    paid_bills_count: int
@@ -1,17 +1,43 @@
 import logging
+import os
+from datetime import date, datetime
+from itertools import groupby
+from typing import List, Optional
 
+import httpx
 import jwt
-from fastapi import APIRouter, Depends, HTTPException
+from core.access import access_client
+from core.auth import token_roles, token_verifier
+from core.export import BillExport
+from core.statistics import build_statistics, statistics_cache, statistics_key
+from core.tariffs import UnknownTariffError, tariff_cache
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from models.database import Account, Bill, Service, get_db
+from models.database import Account, AccountDebt, Bill, ProviderPeriodTotal, get_db
 from models.requests import PayBillRequest
-from models.responses import BillResponse, ServiceResponse, UnpaidPeriodsResponse
+from models.responses import (
+    BillPeriodResponse,
+    BillRangeResponse,
+    BillResponse,
+    ProviderPeriodTotals,
+    ServiceResponse,
+    StatisticsResponse,
+    UnpaidPeriodsResponse,
+)
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger("billing_service.routes")
 router = APIRouter()
 security = HTTPBearer()
 
+PERIOD_PATTERN = r"^\d{4}-\d{2}$"
+MAX_RANGE_MONTHS = 60
+EXPORT_ROLE = os.getenv("EXPORT_ROLE", "accountant")
+PROVIDER_REPORTS_ROLE = os.getenv("PROVIDER_REPORTS_ROLE", "accountant")
+TARIFF_ADMIN_ROLE = os.getenv("TARIFF_ADMIN_ROLE", "admin")
+
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
@@ -25,7 +51,58 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
-@router.get("/", response_model=BillResponse)
+def get_verified_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Claims of a token whose signature, expiry, issuer and audience were checked."""
+    try:
+        return token_verifier.decode(credentials.credentials)
+    except jwt.PyJWTError as e:
+        logger.warning(f"Rejected token: {e}")
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def require_role(role: str):
+    def dependency(payload: dict = Depends(get_verified_token)):
+        if role not in token_roles(payload):
+            raise HTTPException(status_code=403, detail="Access denied")
+
+    return dependency
+
+
+async def require_account_access(
+    account_number: str,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: str = Depends(get_current_user),
+):
+    try:
+        allowed = await access_client.has_access(credentials.credentials, current_user, account_number)
+    except httpx.HTTPError as e:
+        logger.error(f"Access check failed for account {account_number}: {e}")
+        raise HTTPException(status_code=503, detail="Accounts service unavailable")
+    if not allowed:
+        logger.warning(f"Access denied for user {current_user} to account {account_number}")
+        raise HTTPException(status_code=403, detail="Access denied")
+
+
+async def get_tariffs(service_ids) -> dict:
+    try:
+        return await tariff_cache.get_many(service_ids)
+    except UnknownTariffError as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=404, detail="Tariff not found")
+
+
+def parse_period(value: str) -> date:
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid period: {value}")
+
+
+def month_after(period: date) -> date:
+    return date(period.year + period.month // 12, period.month % 12 + 1, 1)
+
+
+@router.get("/", response_model=BillResponse, dependencies=[Depends(require_account_access)])
 async def get_bill(
     account_number: str,
     period: str,
@@ -39,7 +116,7 @@ async def get_bill(
         .join(Account, Account.id == Bill.account_id)
         .filter(
             Account.account_number == account_number,
-            Bill.period == period,
+            Bill.period == parse_period(period),
         )
         .all()
     )
@@ -48,8 +125,7 @@ async def get_bill(
         logger.warning(f"Bill not found for account {account_number}, period {period}")
         raise HTTPException(status_code=404, detail="Bill not found")
     
-    services = db.query(Service).filter(Service.id.in_([bill.service_id for bill in bills])).all()
-    services_dict = {service.id: service for service in services}
+    services_dict = await get_tariffs(bill.service_id for bill in bills)
 
     services_responses = []
     for bill in bills:
@@ -69,7 +145,84 @@ async def get_bill(
         services=services_responses
     )
 
-@router.get("/unpaid-periods", response_model=UnpaidPeriodsResponse)
+@router.get("/range", response_model=BillRangeResponse, dependencies=[Depends(require_account_access)])
+async def get_bills_range(
+    account_number: str,
+    period_from: str = Query(..., alias="from", pattern=PERIOD_PATTERN),
+    period_to: str = Query(..., alias="to", pattern=PERIOD_PATTERN),
+    db: Session = Depends(get_db),
+    current_user: int = Depends(get_current_user),
+):
+    logger.info(f"Getting bills for account {account_number}, periods {period_from}..{period_to}")
+
+    start = parse_period(period_from)
+    end = parse_period(period_to)
+    months = (end.year - start.year) * 12 + end.month - start.month + 1
+    end_exclusive = month_after(end)
+    if months < 1:
+        raise HTTPException(status_code=400, detail="'from' must not be later than 'to'")
+    if months > MAX_RANGE_MONTHS:
+        raise HTTPException(status_code=400, detail=f"Range must not exceed {MAX_RANGE_MONTHS} months")
+
+    # One grouped query: a line per (period, service), with the period and range
+    # totals computed by window functions over the grouped sums. Tariff names and
+    # prices come from the in-process tariff cache.
+    line_amount = func.sum(Bill.amount)
+    rows = (
+        db.query(
+            func.to_char(Bill.period, "YYYY-MM").label("period"),
+            Bill.service_id,
+            func.sum(Bill.units).label("units"),
+            line_amount.label("total_cost"),
+            func.sum(line_amount).over(partition_by=Bill.period).label("period_total"),
+            func.bool_and(func.bool_and(Bill.status_type == "paid")).over(partition_by=Bill.period).label("period_paid"),
+            func.sum(line_amount).over().label("range_total"),
+        )
+        .join(Account, Account.id == Bill.account_id)
+        .filter(
+            Account.account_number == account_number,
+            Bill.period >= start,
+            Bill.period < end_exclusive,
+        )
+        .group_by(Bill.period, Bill.service_id)
+        .order_by(Bill.period, Bill.service_id)
+        .all()
+    )
+
+    services = await get_tariffs(row.service_id for row in rows)
+    periods = []
+    for period, lines in groupby(rows, key=lambda row: row.period):
+        lines = list(lines)
+        periods.append(BillPeriodResponse(
+            period=period,
+            total_amount=lines[0].period_total,
+            status="paid" if lines[0].period_paid else "pending",
+            services=[
+                ServiceResponse(
+                    service_name=services[line.service_id].service_name,
+                    cost_per_unit=services[line.service_id].cost_per_unit,
+                    units=line.units,
+                    total_cost=line.total_cost,
+                )
+                for line in lines
+            ],
+        ))
+
+    logger.info(f"Found {len(periods)} billed periods for account {account_number}")
+    return BillRangeResponse(
+        account_number=account_number,
+        period_from=period_from,
+        period_to=period_to,
+        total_amount=rows[0].range_total if rows else 0,
+        periods=periods,
+    )
+
+
+@router.get(
+    "/unpaid-periods",
+    response_model=UnpaidPeriodsResponse,
+    dependencies=[Depends(require_account_access)],
+)
 async def get_not_paid_periods(
     account_number: str,
     db: Session = Depends(get_db),
@@ -77,26 +230,125 @@ async def get_not_paid_periods(
 ):
     logger.info(f"Getting unpaid periods for account {account_number}")
 
-    account = db.query(Account).filter(Account.account_number == account_number).first()
+    account = (
+        db.query(Account.id, AccountDebt.unpaid_periods, AccountDebt.outstanding_amount)
+        .outerjoin(AccountDebt, AccountDebt.account_id == Account.id)
+        .filter(Account.account_number == account_number)
+        .first()
+    )
     if not account:
         logger.error(f"Account not found: {account_number}")
         raise HTTPException(status_code=404, detail="Account not found")
-    
-    unpaid_periods = (
-        db.query(Bill.period)
-        .filter(
-            Bill.account_id == account.id,
-            Bill.status_type != "paid"
-        )
-        .distinct()
-        .order_by(Bill.period)
-        .all()
-    )
-    
-    periods_list = [str(period[0]) for period in unpaid_periods]
+
+    periods_list = [str(period) for period in account.unpaid_periods or []]
 
     logger.info(f"Found {len(periods_list)} unpaid periods for account {account_number}")
     return UnpaidPeriodsResponse(
         account_number=account_number,
-        unpaid_periods=periods_list
-    )
\ No newline at end of file
+        unpaid_periods=periods_list,
+        outstanding_amount=account.outstanding_amount or 0,
+    )
+
+
+@router.get("/statistics", response_model=StatisticsResponse, dependencies=[Depends(require_account_access)])
+async def get_statistics(
+    account_number: str,
+    months: int = Query(12, ge=1, le=MAX_RANGE_MONTHS),
+    db: Session = Depends(get_db),
+    current_user: int = Depends(get_current_user),
+):
+    key = statistics_key(db, account_number, months)
+    if key is None:
+        logger.error(f"Account not found: {account_number}")
+        raise HTTPException(status_code=404, detail="Account not found")
+    statistics = statistics_cache.get(key)
+    if statistics is None:
+        logger.info(f"Building statistics for account {account_number}, {months} months")
+        try:
+            statistics = await build_statistics(db, key[0], account_number, months)
+        except UnknownTariffError as e:
+            logger.error(str(e))
+            raise HTTPException(status_code=404, detail="Tariff not found")
+        statistics_cache.set(key, statistics)
+    return statistics
+
+
+@router.get("/export", dependencies=[Depends(require_role(EXPORT_ROLE))])
+async def export_bills(
+    fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+    provider_id: Optional[int] = None,
+    account_from: Optional[str] = None,
+    account_to: Optional[str] = None,
+    period_from: Optional[str] = Query(None, pattern=PERIOD_PATTERN),
+    period_to: Optional[str] = Query(None, pattern=PERIOD_PATTERN),
+    token: dict = Depends(get_verified_token),
+):
+    logger.info(
+        f"Bill export by user {token['sub']}: provider {provider_id}, "
+        f"accounts {account_from}..{account_to}, periods {period_from}..{period_to}"
+    )
+    export = BillExport(
+        fmt,
+        gzip,
+        provider_id=provider_id,
+        account_from=account_from,
+        account_to=account_to,
+        period_start=parse_period(period_from) if period_from else None,
+        period_end=month_after(parse_period(period_to)) if period_to else None,
+    )
+    return StreamingResponse(
+        export.chunks(),
+        media_type=export.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export.filename}"'},
+    )
+
+
+@router.get(
+    "/provider-totals",
+    response_model=List[ProviderPeriodTotals],
+    dependencies=[Depends(require_role(PROVIDER_REPORTS_ROLE))],
+)
+async def get_provider_totals(
+    provider_id: Optional[int] = None,
+    period_from: str = Query(..., alias="from", pattern=PERIOD_PATTERN),
+    period_to: str = Query(..., alias="to", pattern=PERIOD_PATTERN),
+    db: Session = Depends(get_db),
+    token: dict = Depends(get_verified_token),
+):
+    logger.info(f"Provider totals for {provider_id or 'all providers'}, {period_from}..{period_to} by user {token['sub']}")
+    start = parse_period(period_from)
+    end = parse_period(period_to)
+    if end < start:
+        raise HTTPException(status_code=400, detail="'from' must not be later than 'to'")
+
+    query = db.query(ProviderPeriodTotal).filter(
+        ProviderPeriodTotal.period >= start,
+        ProviderPeriodTotal.period < month_after(end),
+    )
+    if provider_id is not None:
+        query = query.filter(ProviderPeriodTotal.provider_id == provider_id)
+    totals = query.order_by(ProviderPeriodTotal.provider_id, ProviderPeriodTotal.period).all()
+
+    return [
+        ProviderPeriodTotals(
+            provider_id=total.provider_id,
+            period=total.period.strftime("%Y-%m"),
+            billed_amount=total.billed_amount,
+            collected_amount=total.collected_amount,
+            outstanding_amount=total.billed_amount - total.collected_amount,
+            collection_rate=(
+                round(float(total.collected_amount / total.billed_amount), 4) if total.billed_amount else None
+            ),
+            bills_count=total.bills_count,
+            paid_bills_count=total.paid_bills_count,
+        )
+        for total in totals
+    ]
+
+
+@router.post("/tariffs/invalidate", dependencies=[Depends(require_role(TARIFF_ADMIN_ROLE))])
+async def invalidate_tariffs(token: dict = Depends(get_verified_token)):
+    logger.info(f"Tariff cache invalidated by user {token['sub']}")
+    await tariff_cache.invalidate()
+    return {"version": tariff_cache.version}
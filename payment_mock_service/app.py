@@ -2,7 +2,9 @@ import argparse
 import logging
 
 import uvicorn
+from core.journal import journal
 from fastapi import FastAPI
+from routes.v1.faults import router as faults_router
 from routes.v1.payments import router as payments_router
 
 logging.basicConfig(
@@ -17,6 +19,7 @@ logger = logging.getLogger("payment_mock_service")
 app = FastAPI(title="Payment Mock Service", version="1.0.0")
 
 app.include_router(payments_router, prefix="/api/v1/payments")
+app.include_router(faults_router, prefix="/api/v1/faults")
 
 
 @app.get("/")
@@ -33,6 +36,7 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Payment Mock Service shutting down...")
+    journal.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,26 @@
+import asyncio
+import os
+import random
+
+from models.requests import FaultSettings
+
+faults = FaultSettings(
+    latency_ms=float(os.getenv("MOCK_LATENCY_MS", "0")),
+    jitter_ms=float(os.getenv("MOCK_JITTER_MS", "0")),
+    error_rate=float(os.getenv("MOCK_ERROR_RATE", "0")),
+    decline_rate=float(os.getenv("MOCK_DECLINE_RATE", "0.05")),
+)
+
+
+async def delay() -> None:
+    latency = faults.latency_ms + random.uniform(0, faults.jitter_ms)
+    if latency:
+        await asyncio.sleep(latency / 1000)
+
+
+def unavailable() -> bool:
+    return random.random() < faults.error_rate
+
+
+def declined() -> bool:
+    return random.random() < faults.decline_rate
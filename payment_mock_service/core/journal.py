@@ -0,0 +1,36 @@
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+MOCK_JOURNAL_PATH = os.getenv("MOCK_JOURNAL_PATH", "settlement_journal.csv")
+
+
+class SettlementJournal:
+    """Append-only log of processed charges, the input of jobs/settlement_file.py.
+
+    One CSV line per charge: reference (the Idempotency-Key sent with it),
+    transaction id, amount, status and processing time.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def record(self, reference: Optional[str], transaction_id: str, amount: float, status: str) -> None:
+        line = f"{reference or ''},{transaction_id},{amount:.2f},{status},{datetime.now(timezone.utc).isoformat()}\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+journal = SettlementJournal(MOCK_JOURNAL_PATH)
@@ -0,0 +1,157 @@
+"""Emits the acquirer settlement file read by payment_service's jobs/reconcile.py.
+
+    python -m jobs.settlement_file --out settlement.csv --since 2024-10-01 --until 2024-10-02
+    python -m jobs.settlement_file --payments payments.csv --out settlement.csv \\
+        --missing-rate 0.001 --amount-error-rate 0.001 --stuck-charged-rate 0.5
+
+The file is a CSV with a "charge_id,transaction_id,amount,status,processed_at"
+header, sorted by charge_id, where charge_id is the payment id the charge
+was sent for (its "payment-<id>" Idempotency-Key).
+
+By default it is built from the charges recorded in the settlement journal
+and processed from --since to --until plus --margin hours, so a charge sent
+just before midnight and processed after it is still reported. The journal
+is read once; charges are sorted in runs of --chunk-size rows spilled to
+temporary files and merged, so memory is bounded by the run size however
+long the journal grows.
+
+With --payments it is synthesized, at any size, from payment_service's own
+charges exported sorted by charge id:
+
+    \\copy (SELECT coalesce(charge_id, id), sum(amount), min(status) FROM payments
+           GROUP BY 1 ORDER BY 1) TO 'payments.csv' CSV
+
+Every completed or failed charge is reported as such, except for the
+injected discrepancies: a --missing-rate share of completed charges is left
+out, a --amount-error-rate share is reported with a different amount and a
+--stuck-charged-rate share of charges still pending on our side is reported
+as charged.
+"""
+import argparse
+import csv
+import heapq
+import logging
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional
+
+from core.journal import MOCK_JOURNAL_PATH
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("payment_mock_service.settlement_file")
+
+HEADER = ["charge_id", "transaction_id", "amount", "status", "processed_at"]
+REFERENCE_PREFIX = "payment-"
+SORT_CHUNK_SIZE = int(os.getenv("SETTLEMENT_SORT_CHUNK_SIZE", "1000000"))
+
+
+def parse_date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+def sorted_run(charges: List[tuple]) -> str:
+    charges.sort(key=lambda charge: charge[0])
+    with tempfile.NamedTemporaryFile("w", newline="", encoding="utf-8", suffix=".csv", delete=False) as run:
+        csv.writer(run).writerows(charges)
+    return run.name
+
+
+def read_run(path: str) -> Iterator[tuple]:
+    with open(path, newline="", encoding="utf-8") as run:
+        for charge_id, transaction_id, amount, status, processed_at in csv.reader(run):
+            yield int(charge_id), transaction_id, amount, status, processed_at
+
+
+def from_journal(path: str, since: Optional[datetime], until: Optional[datetime], chunk_size: int) -> Iterator[tuple]:
+    """Journal charges processed in [since, until), sorted by charge_id with an external merge sort."""
+    runs = []
+    chunk = []
+    skipped = 0
+    try:
+        with open(path, newline="", encoding="utf-8") as journal:
+            for reference, transaction_id, amount, status, processed_at in csv.reader(journal):
+                if not reference.startswith(REFERENCE_PREFIX):
+                    skipped += 1
+                    continue
+                if since is not None or until is not None:
+                    processed = datetime.fromisoformat(processed_at)
+                    if (since is not None and processed < since) or (until is not None and processed >= until):
+                        continue
+                chunk.append((int(reference[len(REFERENCE_PREFIX):]), transaction_id, amount, status, processed_at))
+                if len(chunk) >= chunk_size:
+                    runs.append(sorted_run(chunk))
+                    chunk = []
+        if skipped:
+            logger.warning(f"Skipped {skipped} journal lines without a payment reference")
+        if not runs:
+            chunk.sort(key=lambda charge: charge[0])
+            yield from chunk
+            return
+        if chunk:
+            runs.append(sorted_run(chunk))
+        chunk = []
+        logger.info(f"Merging {len(runs)} sorted runs")
+        yield from heapq.merge(*(read_run(run) for run in runs), key=lambda charge: charge[0])
+    finally:
+        for run in runs:
+            os.unlink(run)
+
+
+def synthesize(path: str, missing_rate: float, amount_error_rate: float, stuck_charged_rate: float):
+    processed_at = datetime.now(timezone.utc).isoformat()
+    with open(path, newline="", encoding="utf-8") as payments:
+        for charge_id, amount, status in csv.reader(payments):
+            if status == "completed":
+                if random.random() < missing_rate:
+                    continue
+                if random.random() < amount_error_rate:
+                    amount = f"{float(amount) + random.choice((-1, 1)) * random.randint(1, 10000) / 100:.2f}"
+                yield charge_id, str(uuid.uuid4()), amount, "success", processed_at
+            elif status == "failed":
+                yield charge_id, str(uuid.uuid4()), amount, "failed", processed_at
+            elif random.random() < stuck_charged_rate:
+                yield charge_id, str(uuid.uuid4()), amount, "success", processed_at
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", type=str, required=True)
+    parser.add_argument("--journal", type=str, default=MOCK_JOURNAL_PATH)
+    parser.add_argument("--since", type=parse_date, default=None, help="YYYY-MM-DD, charges processed from")
+    parser.add_argument("--until", type=parse_date, default=None, help="YYYY-MM-DD, exclusive; default: since + 1 day")
+    parser.add_argument("--margin", type=float, default=6, help="hours of charges processed after --until")
+    parser.add_argument("--chunk-size", type=int, default=SORT_CHUNK_SIZE, help="journal rows sorted in memory at once")
+    parser.add_argument("--payments", type=str, default=None, help="CSV: charge_id,amount,status sorted by charge_id")
+    parser.add_argument("--missing-rate", type=float, default=0.0)
+    parser.add_argument("--amount-error-rate", type=float, default=0.0)
+    parser.add_argument("--stuck-charged-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.payments:
+        charges = synthesize(args.payments, args.missing_rate, args.amount_error_rate, args.stuck_charged_rate)
+    else:
+        until = args.until or (args.since + timedelta(days=1) if args.since else None)
+        if until is not None:
+            until += timedelta(hours=args.margin)
+        charges = from_journal(args.journal, args.since, until, args.chunk_size)
+
+    started = time.perf_counter()
+    written = 0
+    with open(args.out, "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out)
+        writer.writerow(HEADER)
+        for charge in charges:
+            writer.writerow(charge)
+            written += 1
+    elapsed = time.perf_counter() - started
+    logger.info(f"Written {written} charges to {args.out} in {elapsed:.1f}s ({written / elapsed if elapsed else 0:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -47,3 +47,10 @@ class PaymentRequest(BaseModel):
     inn_receiver: str = Field(
         ..., description="Receiver inn", min_length=12, max_length=12
     )
+
+
+class FaultSettings(BaseModel):
+    latency_ms: float = Field(0, description="Delay before answering", ge=0)
+    jitter_ms: float = Field(0, description="Random extra delay up to this value", ge=0)
+    error_rate: float = Field(0, description="Share of requests answered with 503", ge=0, le=1)
+    decline_rate: float = Field(0.05, description="Share of payments declined", ge=0, le=1)
@@ -0,0 +1,20 @@
+import logging
+
+from core import faults as fault_state
+from fastapi import APIRouter
+from models.requests import FaultSettings
+
+logger = logging.getLogger("payment_mock_service.faults")
+router = APIRouter()
+
+
+@router.get("/", response_model=FaultSettings)
+async def get_faults():
+    return fault_state.faults
+
+
+@router.put("/", response_model=FaultSettings)
+async def set_faults(settings: FaultSettings):
+    logger.warning(f"Fault injection set to {settings.model_dump()}")
+    fault_state.faults = settings
+    return settings
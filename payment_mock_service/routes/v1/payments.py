@@ -1,26 +1,72 @@
+import asyncio
 import logging
-import random
 import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
 
-from fastapi import APIRouter
+from core.faults import declined, delay, unavailable
+from core.journal import journal
+from fastapi import APIRouter, Header, HTTPException
 from models.requests import PaymentRequest
 from models.responses import PaymentResponse
 
 logger = logging.getLogger("payment_mock_service.routes")
 router = APIRouter()
 
+MAX_REMEMBERED_KEYS = 100000
+
+# Responses by Idempotency-Key, so a retried charge is answered without charging again.
+processed: "OrderedDict[str, PaymentResponse]" = OrderedDict()
+
+# Charges still being processed by Idempotency-Key; a retry that arrives
+# meanwhile waits for the first charge's answer instead of charging again.
+in_flight: Dict[str, "asyncio.Task[PaymentResponse]"] = {}
+
 
 @router.post("/")
-async def create_payment(payment: PaymentRequest):
+async def create_payment(
+    payment: PaymentRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    if idempotency_key is None:
+        return await charge(payment, None)
+    if idempotency_key in processed:
+        logger.info(f"Replaying mock payment for Idempotency-Key {idempotency_key}")
+        return processed[idempotency_key]
+
+    task = in_flight.get(idempotency_key)
+    if task is None:
+        # A task, so the charge finishes even if the request that started it goes away.
+        task = asyncio.ensure_future(charge(payment, idempotency_key))
+        in_flight[idempotency_key] = task
+        task.add_done_callback(lambda _: in_flight.pop(idempotency_key, None))
+    else:
+        logger.info(f"Waiting for in-flight mock payment with Idempotency-Key {idempotency_key}")
+    return await asyncio.shield(task)
+
+
+async def charge(payment: PaymentRequest, idempotency_key: Optional[str]) -> PaymentResponse:
+    await delay()
+    if unavailable():
+        logger.warning("Mock gateway unavailable (simulated error)")
+        raise HTTPException(status_code=503, detail="Gateway unavailable")
+
     logger.info(f"Processing mock payment for amount {payment.amount}, card ending {payment.card_number[-4:]}")
-    
+
     payment_id = str(uuid.uuid4())
-    
-    if random.random() < 0.95:
+
+    if not declined():
         logger.info(f"Mock payment {payment_id} successful")
-        return PaymentResponse(
+        response = PaymentResponse(
             id=payment_id, status="success", message="Payment successful"
         )
     else:
         logger.warning(f"Mock payment {payment_id} failed (simulated failure)")
-        return PaymentResponse(id=payment_id, status="failed", message="Payment failed")
+        response = PaymentResponse(id=payment_id, status="failed", message="Payment failed")
+
+    journal.record(idempotency_key, payment_id, payment.amount, response.status)
+    if idempotency_key is not None:
+        processed[idempotency_key] = response
+        if len(processed) > MAX_REMEMBERED_KEYS:
+            processed.popitem(last=False)
+    return response
@@ -2,6 +2,10 @@ import argparse
 import logging
 
 import uvicorn
+from core.gateway import payment_gateway
+from core.identity import user_ids
+from core.idempotency import idempotency_store
+from core.pipeline import payment_pipeline
 from fastapi import FastAPI
 from routes.v1.payments import router as payments_router
 
@@ -25,14 +29,30 @@ async def root():
     return {"message": "Payment Service"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "identity_cache": user_ids.cache.stats(),
+        "gateway": payment_gateway.stats(),
+        "pipeline": payment_pipeline.stats(),
+        "idempotency": idempotency_store.stats(),
+    }
+
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Payment Service starting up...")
+    await payment_gateway.start()
+    await payment_pipeline.start()
+    await idempotency_store.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Payment Service shutting down...")
+    await idempotency_store.close()
+    await payment_pipeline.close()
+    await payment_gateway.close()
 
 
 if __name__ == "__main__":
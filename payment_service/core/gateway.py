@@ -0,0 +1,245 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Optional
+
+import httpx
+from core.resilience import CircuitBreaker, RetryBudget, backoff
+
+PAYMENT_MOCK_SERVICE_URL = os.getenv("PAYMENT_MOCK_SERVICE_URL", "http://payment-mock-service:8000")
+GATEWAY_CONNECT_TIMEOUT = float(os.getenv("GATEWAY_CONNECT_TIMEOUT", "2"))
+GATEWAY_READ_TIMEOUT = float(os.getenv("GATEWAY_READ_TIMEOUT", "10"))
+GATEWAY_MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))
+GATEWAY_MAX_KEEPALIVE = int(os.getenv("GATEWAY_MAX_KEEPALIVE", "20"))
+GATEWAY_HTTP2 = os.getenv("GATEWAY_HTTP2", "false").lower() in ("1", "true", "yes")
+GATEWAY_DEADLINE = float(os.getenv("GATEWAY_DEADLINE", "15"))
+GATEWAY_MAX_ATTEMPTS = int(os.getenv("GATEWAY_MAX_ATTEMPTS", "3"))
+GATEWAY_BACKOFF_BASE = float(os.getenv("GATEWAY_BACKOFF_BASE", "0.1"))
+GATEWAY_BACKOFF_MAX = float(os.getenv("GATEWAY_BACKOFF_MAX", "2"))
+GATEWAY_RETRY_RATIO = float(os.getenv("GATEWAY_RETRY_RATIO", "0.2"))
+GATEWAY_RETRY_MIN_PER_SECOND = float(os.getenv("GATEWAY_RETRY_MIN_PER_SECOND", "1"))
+GATEWAY_RETRY_CAPACITY = float(os.getenv("GATEWAY_RETRY_CAPACITY", "10"))
+GATEWAY_BREAKER_THRESHOLD = int(os.getenv("GATEWAY_BREAKER_THRESHOLD", "5"))
+GATEWAY_BREAKER_RESET = float(os.getenv("GATEWAY_BREAKER_RESET", "30"))
+GATEWAY_BREAKER_HALF_OPEN_CALLS = int(os.getenv("GATEWAY_BREAKER_HALF_OPEN_CALLS", "1"))
+
+LATENCY_WINDOW = 1024
+
+# Failures after which the request never reached the gateway, so it can be
+# retried even without an idempotency key.
+NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def charge_reference(charge_id: int) -> str:
+    """Idempotency-Key of a charge, which the gateway reports back in its settlement file."""
+    return f"payment-{charge_id}"
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """The breaker is open; the gateway was not called."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Payment gateway circuit is open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """The per-charge deadline ran out before the gateway answered."""
+
+
+class ChargeOutcomeUnknown(httpx.HTTPError):
+    """A retry could not be made, but an earlier attempt may have reached the gateway."""
+
+
+def charge_not_sent(error: httpx.HTTPError) -> bool:
+    """Whether a failed charge certainly never reached the gateway.
+
+    Any other failure may have charged the card: the payment must stay in
+    flight until jobs/reconcile.py finds it in the settlement file.
+    """
+    return isinstance(error, NOT_SENT + (CircuitOpenError,))
+
+
+class PaymentGatewayClient:
+    """Shared keep-alive connection pool to the payment gateway.
+
+    Created on application startup and closed on shutdown; every payment
+    reuses pooled connections instead of opening its own. A charge has one
+    ``deadline`` for all of its attempts. Transport errors and 5xx responses
+    are retried with jittered backoff while the retry budget allows, but
+    only charges sent with an idempotency key are retried once the request
+    may have reached the gateway. The circuit breaker fails charges fast
+    while the gateway keeps failing. Once an attempt may have reached the
+    gateway, a charge that fails later never raises an error that
+    ``charge_not_sent`` accepts, nor returns a 5xx response as if it had
+    been declined: it raises ``ChargeOutcomeUnknown`` instead.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        connect_timeout: float,
+        read_timeout: float,
+        max_connections: int,
+        max_keepalive: int,
+        http2: bool,
+        deadline: float,
+        max_attempts: int,
+        backoff_base: float,
+        backoff_max: float,
+        breaker: CircuitBreaker,
+        retry_budget: RetryBudget,
+    ):
+        self.base_url = base_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.http2 = http2
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker
+        self.retry_budget = retry_budget
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.deadlines_exceeded = 0
+        self.outcomes_unknown = 0
+        self.total_seconds = 0.0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=self.limits,
+            http2=self.http2,
+        )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def charge(self, payload: dict, idempotency_key: Optional[str] = None) -> httpx.Response:
+        if self._client is None:
+            await self.start()
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+        deadline = time.monotonic() + self.deadline
+        self.retry_budget.deposit()
+
+        attempt = 0
+        sent = False
+        while True:
+            attempt += 1
+            if not self.breaker.allow():
+                error = CircuitOpenError(self.breaker.retry_after())
+                raise self._unknown(error) if sent else error
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.breaker.record(None)
+                self.deadlines_exceeded += 1
+                raise DeadlineExceeded("Payment gateway deadline exceeded")
+
+            sent_before = sent
+            error = None
+            response = None
+            # Stays None if the attempt is cancelled, which says nothing about the gateway.
+            outcome = None
+            try:
+                response = await self._send(payload, headers, remaining)
+                outcome = response.status_code < 500
+            except httpx.HTTPError as e:
+                error = e
+                outcome = False
+            finally:
+                self.breaker.record(outcome)
+            sent = sent or not isinstance(error, NOT_SENT)
+
+            if error is None and response.status_code < 500:
+                return response
+            retryable = idempotency_key is not None or isinstance(error, NOT_SENT)
+            delay = backoff(attempt, self.backoff_base, self.backoff_max)
+            if (
+                not retryable
+                or attempt >= self.max_attempts
+                or time.monotonic() + delay >= deadline
+                or not self.retry_budget.withdraw()
+            ):
+                if error is not None:
+                    raise self._unknown(error) if sent and isinstance(error, NOT_SENT) else error
+                if sent_before:
+                    raise self._unknown(httpx.HTTPStatusError(
+                        f"Payment gateway answered {response.status_code}",
+                        request=response.request,
+                        response=response,
+                    ))
+                return response
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def _unknown(self, error: httpx.HTTPError) -> ChargeOutcomeUnknown:
+        self.outcomes_unknown += 1
+        unknown = ChargeOutcomeUnknown(f"Payment gateway may have been charged before: {error}")
+        unknown.__cause__ = error
+        return unknown
+
+    async def _send(self, payload: dict, headers: dict, remaining: float) -> httpx.Response:
+        timeout = httpx.Timeout(
+            min(self.read_timeout, remaining), connect=min(self.connect_timeout, remaining)
+        )
+        self.requests += 1
+        started = time.perf_counter()
+        try:
+            return await self._client.post("/api/v1/payments/", json=payload, headers=headers, timeout=timeout)
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.total_seconds += elapsed
+            self._latencies.append(elapsed)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(q: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2)
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "deadlines_exceeded": self.deadlines_exceeded,
+            "outcomes_unknown": self.outcomes_unknown,
+            "mean_latency_ms": round(self.total_seconds / self.requests * 1000, 2) if self.requests else 0.0,
+            "p50_latency_ms": percentile(0.5),
+            "p95_latency_ms": percentile(0.95),
+            "p99_latency_ms": percentile(0.99),
+            "breaker": self.breaker.stats(),
+            "retry_budget": self.retry_budget.stats(),
+            "max_connections": self.limits.max_connections,
+            "http2": self.http2,
+        }
+
+
+payment_gateway = PaymentGatewayClient(
+    PAYMENT_MOCK_SERVICE_URL,
+    GATEWAY_CONNECT_TIMEOUT,
+    GATEWAY_READ_TIMEOUT,
+    GATEWAY_MAX_CONNECTIONS,
+    GATEWAY_MAX_KEEPALIVE,
+    GATEWAY_HTTP2,
+    GATEWAY_DEADLINE,
+    GATEWAY_MAX_ATTEMPTS,
+    GATEWAY_BACKOFF_BASE,
+    GATEWAY_BACKOFF_MAX,
+    CircuitBreaker(GATEWAY_BREAKER_THRESHOLD, GATEWAY_BREAKER_RESET, GATEWAY_BREAKER_HALF_OPEN_CALLS),
+    RetryBudget(GATEWAY_RETRY_RATIO, GATEWAY_RETRY_MIN_PER_SECOND, GATEWAY_RETRY_CAPACITY),
+)
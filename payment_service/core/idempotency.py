@@ -0,0 +1,271 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from core.cache import TTLCache
+from models.database import IdempotencyKey, SessionLocal
+from sqlalchemy import and_, func, or_
+from sqlalchemy.dialects.postgresql import insert
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("payment_service.idempotency")
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_CACHE_TTL = float(os.getenv("IDEMPOTENCY_CACHE_TTL", "600"))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "30"))
+IDEMPOTENCY_LEASE = float(os.getenv("IDEMPOTENCY_LEASE", "120"))
+IDEMPOTENCY_CLEANUP_INTERVAL = float(os.getenv("IDEMPOTENCY_CLEANUP_INTERVAL", "3600"))
+
+
+class IdempotencyConflict(Exception):
+    """The key is being processed by a request that has not finished yet."""
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a request with a different body."""
+
+
+class StoredResponse(NamedTuple):
+    request_hash: str
+    status_code: int
+    body: dict
+
+
+class IdempotentResult(NamedTuple):
+    status_code: int
+    body: dict
+    replayed: bool
+
+
+def request_hash(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Deduplicates requests carrying the same ``Idempotency-Key``.
+
+    The payment_idempotency_keys table is the source of truth shared by all
+    processes: a request claims its key with an insert, runs, and stores the
+    response it produced. Finished responses are kept in a hot cache, and
+    duplicates arriving while the first request is still running in this
+    process await its future instead of claiming the key themselves.
+    Responses with a 5xx status are not stored, so the client may retry them.
+    A claim without a response is a lease: once it is ``lease`` seconds old
+    its process is presumed dead and another request may take the key over.
+    """
+
+    def __init__(
+        self, ttl: float, lease: float, cache_size: int, cache_ttl: float, wait_timeout: float, cleanup_interval: float
+    ):
+        self.ttl = ttl
+        self.lease = lease
+        self.wait_timeout = wait_timeout
+        self.cleanup_interval = cleanup_interval
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.executed = 0
+        self.replayed = 0
+        self.joined = 0
+        self.conflicts = 0
+        self.expired = 0
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def close(self) -> None:
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self._cleanup_task = None
+
+    async def execute(
+        self,
+        user_key: str,
+        key: str,
+        fingerprint: str,
+        operation: Callable[[], Awaitable[Tuple[int, dict]]],
+    ) -> IdempotentResult:
+        cache_key = (user_key, key)
+        stored = self.cache.get(cache_key)
+        if stored is not None:
+            return self._replay(stored, fingerprint)
+
+        future = self._in_flight.get(cache_key)
+        if future is not None:
+            self.joined += 1
+            try:
+                stored = await asyncio.wait_for(asyncio.shield(future), self.wait_timeout)
+            except asyncio.TimeoutError:
+                self.conflicts += 1
+                raise IdempotencyConflict(key)
+            if stored is None:
+                # The first request failed without a response; start over.
+                return await self.execute(user_key, key, fingerprint, operation)
+            return self._replay(stored, fingerprint)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[cache_key] = future
+        claimed = False
+        try:
+            claimed, stored = await run_in_threadpool(self._claim, user_key, key, fingerprint)
+            if not claimed:
+                if stored is None:
+                    self.conflicts += 1
+                    raise IdempotencyConflict(key)
+                self.cache.set(cache_key, stored)
+                future.set_result(stored)
+                return self._replay(stored, fingerprint)
+
+            status_code, body = await operation()
+            self.executed += 1
+            stored = StoredResponse(fingerprint, status_code, body)
+            if status_code < 500:
+                await run_in_threadpool(self._save, user_key, key, stored)
+                self.cache.set(cache_key, stored)
+            else:
+                await run_in_threadpool(self._release, user_key, key)
+            future.set_result(stored)
+            return IdempotentResult(status_code, body, False)
+        except BaseException:
+            if claimed and not future.done():
+                self._release(user_key, key)
+            if not future.done():
+                future.set_result(None)
+            raise
+        finally:
+            self._in_flight.pop(cache_key, None)
+
+    def _replay(self, stored: StoredResponse, fingerprint: str) -> IdempotentResult:
+        if stored.request_hash != fingerprint:
+            raise IdempotencyKeyReused()
+        self.replayed += 1
+        return IdempotentResult(stored.status_code, stored.body, True)
+
+    def _claim(self, user_key: str, key: str, fingerprint: str) -> Tuple[bool, Optional[StoredResponse]]:
+        expires_at = func.now() + timedelta(seconds=self.ttl)
+        statement = insert(IdempotencyKey).values(
+            user_key=user_key,
+            idempotency_key=key,
+            request_hash=fingerprint,
+            expires_at=expires_at,
+        )
+        # An expired key that the cleanup has not reached yet is taken over, and
+        # so is an unanswered claim older than the lease (created_at is reset on
+        # every claim).
+        statement = statement.on_conflict_do_update(
+            index_elements=[IdempotencyKey.user_key, IdempotencyKey.idempotency_key],
+            set_={
+                "request_hash": statement.excluded.request_hash,
+                "status_code": None,
+                "response": None,
+                "created_at": func.now(),
+                "expires_at": statement.excluded.expires_at,
+            },
+            where=or_(
+                IdempotencyKey.expires_at < func.now(),
+                and_(
+                    IdempotencyKey.status_code.is_(None),
+                    IdempotencyKey.created_at < func.now() - timedelta(seconds=self.lease),
+                ),
+            ),
+        ).returning(IdempotencyKey.user_key)
+
+        db = SessionLocal()
+        try:
+            claimed = db.execute(statement).first() is not None
+            row = None if claimed else db.get(IdempotencyKey, (user_key, key))
+            db.commit()
+        finally:
+            db.close()
+
+        if claimed:
+            return True, None
+        if row is None:
+            # Deleted by the cleanup between the insert and the read.
+            return self._claim(user_key, key, fingerprint)
+        if row.request_hash != fingerprint:
+            raise IdempotencyKeyReused()
+        if row.status_code is None:
+            return False, None
+        return False, StoredResponse(row.request_hash, row.status_code, row.response)
+
+    def _save(self, user_key: str, key: str, stored: StoredResponse) -> None:
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.user_key == user_key, IdempotencyKey.idempotency_key == key
+            ).update(
+                {IdempotencyKey.status_code: stored.status_code, IdempotencyKey.response: stored.body},
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _release(self, user_key: str, key: str) -> None:
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.user_key == user_key,
+                IdempotencyKey.idempotency_key == key,
+                IdempotencyKey.status_code.is_(None),
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.error(f"Failed to release idempotency key {key}: {e}")
+        finally:
+            db.close()
+
+    def delete_expired(self) -> int:
+        db = SessionLocal()
+        try:
+            count = (
+                db.query(IdempotencyKey)
+                .filter(IdempotencyKey.expires_at < func.now())
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+        return count
+
+    async def _cleanup_loop(self) -> None:
+        while True:
+            try:
+                count = await run_in_threadpool(self.delete_expired)
+                self.expired += count
+                if count:
+                    logger.info(f"Deleted {count} expired idempotency keys")
+            except Exception as e:
+                logger.error(f"Idempotency key cleanup failed: {e}")
+            await asyncio.sleep(self.cleanup_interval)
+
+    def stats(self) -> dict:
+        return {
+            "cache": self.cache.stats(),
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "joined": self.joined,
+            "conflicts": self.conflicts,
+            "expired": self.expired,
+        }
+
+
+idempotency_store = IdempotencyStore(
+    IDEMPOTENCY_TTL,
+    IDEMPOTENCY_LEASE,
+    IDEMPOTENCY_CACHE_SIZE,
+    IDEMPOTENCY_CACHE_TTL,
+    IDEMPOTENCY_WAIT_TIMEOUT,
+    IDEMPOTENCY_CLEANUP_INTERVAL,
+)
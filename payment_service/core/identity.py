@@ -0,0 +1,30 @@
+import os
+from typing import Optional
+
+from core.cache import TTLCache
+from models.database import User
+from sqlalchemy.orm import Session
+
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "10000"))
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "3600"))
+
+
+class UserIdResolver:
+    """Maps a Keycloak subject (JWT ``sub``) to the internal ``users.id``."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize, ttl)
+
+    def resolve(self, db: Session, keycloak_id: str) -> Optional[int]:
+        user_id = self.cache.get(keycloak_id)
+        if user_id is not None:
+            return user_id
+
+        row = db.query(User.id).filter(User.keycloack_id == keycloak_id).first()
+        if row is None:
+            return None
+        self.cache.set(keycloak_id, row.id)
+        return row.id
+
+
+user_ids = UserIdResolver(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional
+
+import httpx
+from core.gateway import charge_not_sent, charge_reference, payment_gateway
+from core.settlement import QUEUED, release_abandoned, settle_payment
+from models.database import Payment, SessionLocal
+from sqlalchemy import update
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("payment_service.pipeline")
+
+PAYMENT_WORKERS = int(os.getenv("PAYMENT_WORKERS", "32"))
+PAYMENT_QUEUE_SIZE = int(os.getenv("PAYMENT_QUEUE_SIZE", "10000"))
+PAYMENT_DRAIN_TIMEOUT = float(os.getenv("PAYMENT_DRAIN_TIMEOUT", "30"))
+PAYMENT_ABANDON_AFTER = float(os.getenv("PAYMENT_ABANDON_AFTER", "600"))
+
+
+class PaymentJob(NamedTuple):
+    payment_id: int
+    bill_ids: List[int]
+    payload: dict
+
+
+def gateway_succeeded(response: httpx.Response) -> bool:
+    return response.status_code == 200 and response.json().get("status") == "success"
+
+
+class PaymentPipeline:
+    """In-process queue of accepted payments drained by a pool of workers.
+
+    The number of workers bounds how many gateway calls are in flight. Card
+    data lives only in the queued job, so payments still queued when a
+    process dies cannot be retried; ``fail_abandoned`` marks those failed and
+    releases their bills on the next start once they are older than
+    ``abandon_after`` seconds. Payments that reached the gateway may have
+    been charged and are left to jobs/reconcile.py.
+    """
+
+    def __init__(self, workers: int, queue_size: int, drain_timeout: float, abandon_after: float):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.drain_timeout = drain_timeout
+        self.abandon_after = abandon_after
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.unknown = 0
+        self.rejected = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        await run_in_threadpool(self.fail_abandoned)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Stopping with {self._queue.qsize()} payments still queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job: PaymentJob) -> bool:
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        return True
+
+    def fail_abandoned(self) -> None:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.abandon_after)
+        db = SessionLocal()
+        try:
+            payment_ids = db.execute(
+                update(Payment)
+                .where(Payment.status == QUEUED, Payment.created_at < cutoff)
+                .values(status="failed")
+                .returning(Payment.id)
+            ).scalars().all()
+            if payment_ids:
+                release_abandoned(db, payment_ids)
+            db.commit()
+        finally:
+            db.close()
+        if payment_ids:
+            logger.warning(f"Marked {len(payment_ids)} abandoned queued payments as failed")
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self.process(job)
+            except Exception as e:
+                logger.error(f"Payment {job.payment_id} processing error: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def process(self, job: PaymentJob) -> None:
+        await run_in_threadpool(self._set_status, job.payment_id, "processing")
+        try:
+            response = await payment_gateway.charge(job.payload, idempotency_key=charge_reference(job.payment_id))
+            succeeded = gateway_succeeded(response)
+        except httpx.HTTPError as e:
+            if not charge_not_sent(e):
+                # Stays processing, with its bills claimed, for jobs/reconcile.py.
+                self.processed += 1
+                self.unknown += 1
+                logger.error(f"No answer from payment gateway for payment {job.payment_id}, left processing: {e}")
+                return
+            logger.error(f"Payment gateway unavailable for payment {job.payment_id}: {e}")
+            succeeded = False
+        await run_in_threadpool(self._settle, job, succeeded)
+
+        self.processed += 1
+        if succeeded:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        logger.info(f"Payment {job.payment_id} {'completed' if succeeded else 'failed'}")
+
+    def _set_status(self, payment_id: int, status: str) -> None:
+        db = SessionLocal()
+        try:
+            db.query(Payment).filter(Payment.id == payment_id).update(
+                {Payment.status: status}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _settle(self, job: PaymentJob, succeeded: bool) -> None:
+        db = SessionLocal()
+        try:
+            settle_payment(db, [job.payment_id], job.bill_ids, succeeded)
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "processed": self.processed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "unknown": self.unknown,
+            "rejected": self.rejected,
+        }
+
+
+payment_pipeline = PaymentPipeline(PAYMENT_WORKERS, PAYMENT_QUEUE_SIZE, PAYMENT_DRAIN_TIMEOUT, PAYMENT_ABANDON_AFTER)
@@ -0,0 +1,120 @@
+import random
+import time
+from typing import Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stops calls to a dependency after ``failure_threshold`` consecutive failures.
+
+    While open every call is rejected without being attempted. After
+    ``reset_timeout`` seconds the breaker lets up to ``half_open_calls``
+    probes through: a successful probe closes it, a failed one opens it
+    again for another ``reset_timeout``.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, half_open_calls: int):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+    def allow(self) -> bool:
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self._probes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                self.rejected += 1
+                return False
+            self._probes += 1
+            return True
+        if self.state == OPEN:
+            self.rejected += 1
+            return False
+        return True
+
+    def record(self, succeeded: Optional[bool]) -> None:
+        """Records the outcome of an allowed call; None means it was abandoned."""
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+        if succeeded is None:
+            return
+        if succeeded:
+            self.failures = 0
+            self.state = CLOSED
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._open()
+
+    def retry_after(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def _open(self) -> None:
+        if self.state != OPEN:
+            self.opened += 1
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class RetryBudget:
+    """Token bucket that caps retries to a fraction of the calls made.
+
+    Every call deposits ``ratio`` tokens and every retry withdraws one, so
+    retries add at most ``ratio`` extra load during an outage instead of
+    multiplying it. ``min_per_second`` tokens accrue over time so rare
+    calls can still be retried.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, capacity: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self.exhausted = 0
+        self._balance = capacity
+        self._updated = time.monotonic()
+
+    def deposit(self) -> None:
+        self._refill()
+        self._balance = min(self.capacity, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self._balance < 1:
+            self.exhausted += 1
+            return False
+        self._balance -= 1
+        return True
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._balance = min(self.capacity, self._balance + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def stats(self) -> dict:
+        self._refill()
+        return {"balance": round(self._balance, 2), "capacity": self.capacity, "exhausted": self.exhausted}
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff before retry number ``attempt`` (from 1)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
@@ -0,0 +1,149 @@
+import logging
+from datetime import date, datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from models.database import Bill, Payment, PaymentBill
+from sqlalchemy import BigInteger, any_, insert, literal, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger("payment_service.settlement")
+
+# Bills claimed by a payment whose gateway call has not finished yet.
+PROCESSING = "processing"
+
+# Accepted for asynchronous processing and not yet sent to the gateway.
+QUEUED = "queued"
+
+# Payment statuses before the gateway's answer has been recorded.
+IN_FLIGHT = (QUEUED, "pending", "processing")
+
+
+def id_array(ids: Iterable[int]):
+    """Binds ids as one array parameter, for ``= ANY(...)``."""
+    return any_(literal(list(ids), ARRAY(BigInteger)))
+
+
+def claim_bills(db: Session, periods: List[Tuple[int, date]]) -> List:
+    """Marks the unpaid bills of the given ``(account_id, period)`` pairs as processing.
+
+    Returns ``(id, account_id, period, amount)`` rows of the claimed bills.
+    Bills locked by a concurrent claim are skipped rather than waited for,
+    and bills it has already claimed no longer match, so two payments never
+    cover the same bill. The claim is released by ``settle_payment`` or, if
+    the process dies first, by ``release_abandoned`` or jobs/reconcile.py.
+    """
+    unpaid = (
+        select(Bill.id)
+        .where(
+            tuple_(Bill.account_id, Bill.period).in_(periods),
+            Bill.status_type.notin_(("paid", PROCESSING)),
+        )
+        .with_for_update(skip_locked=True)
+    )
+    return db.execute(
+        update(Bill)
+        .where(Bill.id.in_(unpaid), Bill.period.in_({period for _, period in periods}))
+        .values(status_type=PROCESSING)
+        .returning(Bill.id, Bill.account_id, Bill.period, Bill.amount)
+    ).all()
+
+
+def link_bills(db: Session, links: Iterable[Tuple[int, int]]) -> None:
+    """Inserts ``(payment_id, bill_id)`` pairs into payment_bills in one statement."""
+    db.execute(
+        insert(PaymentBill).values([{"payment_id": payment_id, "bill_id": bill_id} for payment_id, bill_id in links])
+    )
+
+
+def group_charge(db: Session, payment_ids: List[int]) -> None:
+    """Records that the payments are paid by one gateway charge, identified by the first of them."""
+    db.execute(update(Payment).where(Payment.id == id_array(payment_ids)).values(charge_id=payment_ids[0]))
+
+
+def release_bills(db: Session, bill_ids: List[int]) -> None:
+    db.execute(
+        update(Bill)
+        .where(Bill.id == id_array(bill_ids), Bill.status_type == PROCESSING)
+        .values(status_type="pending")
+    )
+
+
+def settle_payment(db: Session, payment_ids: List[int], bill_ids: List[int], succeeded: bool) -> Optional[datetime]:
+    """Settles the payments covered by one gateway charge in one transaction.
+
+    Returns the payment time, or None when the charge failed.
+    """
+    if succeeded:
+        paid_at = datetime.now(timezone.utc)
+        db.execute(
+            update(Payment).where(Payment.id == id_array(payment_ids)).values(status="completed", paid_at=paid_at)
+        )
+        settled = db.execute(
+            update(Bill)
+            .where(Bill.id == id_array(bill_ids), Bill.status_type == PROCESSING)
+            .values(status_type="paid")
+            .returning(Bill.id)
+        ).scalars().all()
+        if len(settled) != len(bill_ids):
+            logger.error(f"Payments {payment_ids} settled {len(settled)} of {len(bill_ids)} claimed bills")
+    else:
+        paid_at = None
+        db.execute(update(Payment).where(Payment.id == id_array(payment_ids)).values(status="failed"))
+        release_bills(db, bill_ids)
+    db.commit()
+    return paid_at
+
+
+def mark_processing(db: Session, payment_ids: List[int]) -> None:
+    """Records that the gateway may have charged the payments without answering.
+
+    They keep their claimed bills until jobs/reconcile.py settles them.
+    """
+    db.execute(
+        update(Payment)
+        .where(Payment.id == id_array(payment_ids), Payment.status.in_(IN_FLIGHT))
+        .values(status=PROCESSING)
+    )
+    db.commit()
+
+
+def release_abandoned(db: Session, payment_ids: List[int]) -> None:
+    db.execute(
+        update(Bill)
+        .where(
+            Bill.id.in_(select(PaymentBill.bill_id).where(PaymentBill.payment_id == id_array(payment_ids))),
+            Bill.status_type == PROCESSING,
+        )
+        .values(status_type="pending")
+    )
+
+
+def fail_payments(db: Session, payment_ids: List[int]) -> None:
+    """Fails payments still in flight and releases their bills."""
+    db.execute(
+        update(Payment)
+        .where(Payment.id == id_array(payment_ids), Payment.status.in_(IN_FLIGHT))
+        .values(status="failed")
+    )
+    release_abandoned(db, payment_ids)
+
+
+def complete_payments(db: Session, payment_ids: List[int], paid_at: List[datetime]) -> None:
+    """Completes payments still in flight that the gateway did charge, and marks their bills paid."""
+    db.execute(
+        text(
+            "UPDATE payments p SET status = 'completed', paid_at = v.paid_at "
+            "FROM unnest(:payment_ids, :paid_at) AS v(id, paid_at) "
+            "WHERE p.id = v.id AND p.status = ANY(:in_flight)"
+        ),
+        {"payment_ids": payment_ids, "paid_at": paid_at, "in_flight": list(IN_FLIGHT)},
+    )
+    db.execute(
+        update(Bill)
+        .where(
+            Bill.id.in_(select(PaymentBill.bill_id).where(PaymentBill.payment_id == id_array(payment_ids))),
+            Bill.status_type != "paid",
+        )
+        .values(status_type="paid")
+    )
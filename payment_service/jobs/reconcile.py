@@ -0,0 +1,359 @@
+"""Nightly reconciliation of payments against the acquirer's settlement file.
+
+    python -m jobs.reconcile --settlement settlement.csv --since 2024-10-01 --until 2024-10-02
+    python -m jobs.reconcile --settlement settlement.csv --since 2024-10-01 --until 2024-10-02 --dry-run
+
+Our side is read with a server-side cursor, one row per charge: a batch
+payment's payments share a charge_id and are reported as one charge. The
+settlement file (payment_mock_service's jobs/settlement_file.py) must be
+sorted by charge_id and cover the same days, plus a margin for charges
+processed after midnight. Both sides are merge-joined on charge_id in one
+pass, so memory stays constant however many rows there are.
+
+A settlement line with no charge of ours in the window is looked up in
+payments, --batch-size lines at a time: a charge of a payment created
+outside the window (one the margin let in) is only counted, and only
+charge ids that payments does not have at all are unknown_charge.
+
+A charge still in flight is only fixed once its newest payment is older than
+--min-age seconds: by default longer than a payment may wait in the queue
+plus one gateway deadline, so a charge that may still be in progress is
+never failed because the file does not have it yet. Younger ones are counted
+as too recent and left alone.
+
+Discrepancies are classified as follows:
+
+    stuck_charged        in flight on our side, charged   -> completed, bills paid
+    stuck_declined       in flight on our side, declined  -> failed, bills released
+    stuck_uncharged      in flight on our side, absent    -> failed, bills released
+    amount_mismatch      charged a different amount       -> reported
+    missing_at_gateway   completed on our side, absent    -> reported
+    completed_declined   completed on our side, declined  -> reported
+    failed_charged       failed on our side, charged      -> reported
+    unknown_charge       charged, no such payment at all  -> reported
+    duplicate_charge     charged more than once           -> reported
+    mixed_status         a batch charge's payments differ -> reported
+
+Fixes are applied in batches of --batch-size charges, each batch committed
+separately; every discrepancy is written to --report.
+"""
+import argparse
+import csv
+import logging
+import os
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from core.gateway import GATEWAY_DEADLINE
+from core.pipeline import PAYMENT_ABANDON_AFTER
+from core.settlement import IN_FLIGHT, complete_payments, fail_payments
+from models.database import SessionLocal, engine
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("payment_service.reconcile")
+
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "5000"))
+RECONCILE_FETCH_SIZE = int(os.getenv("RECONCILE_FETCH_SIZE", "50000"))
+RECONCILE_MIN_AGE = float(os.getenv("RECONCILE_MIN_AGE", str(PAYMENT_ABANDON_AFTER + GATEWAY_DEADLINE + 60)))
+
+CHARGES_QUERY = """
+SELECT
+    coalesce(charge_id, id) AS charge_id,
+    array_agg(id ORDER BY id),
+    sum(amount),
+    array_agg(DISTINCT status ORDER BY status),
+    max(created_at) >= %(recent_after)s
+FROM payments
+WHERE created_at >= %(since)s AND created_at < %(until)s
+GROUP BY 1
+ORDER BY 1
+"""
+
+# Which of the given charge ids exist at all; a charge id is its first payment's id.
+KNOWN_CHARGES_QUERY = "SELECT id FROM payments WHERE id = ANY(%(charge_ids)s)"
+
+FIXES = {
+    "stuck_charged": "completed",
+    "stuck_declined": "failed",
+    "stuck_uncharged": "failed",
+}
+
+REPORT_HEADER = [
+    "kind", "charge_id", "payment_ids", "amount", "status", "gateway_amount", "gateway_status", "transaction_id"
+]
+
+
+class Charge(NamedTuple):
+    charge_id: int
+    payment_ids: List[int]
+    cents: int
+    # The payments' status, or all of their statuses when they differ.
+    status: str
+    mixed: bool
+    recent: bool
+
+
+class GatewayCharge(NamedTuple):
+    charge_id: int
+    transaction_id: str
+    cents: int
+    status: str
+    processed_at: datetime
+
+
+def cents(amount) -> int:
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def parse_date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def read_charges(
+    connection, since: date, until: date, recent_after: datetime, fetch_size: int
+) -> Iterator[Charge]:
+    cursor = connection.cursor(name="reconcile_charges")
+    cursor.itersize = fetch_size
+    cursor.execute(CHARGES_QUERY, {"since": since, "until": until, "recent_after": recent_after})
+    try:
+        for charge_id, payment_ids, amount, statuses, recent in cursor:
+            yield Charge(charge_id, payment_ids, cents(amount), " ".join(statuses), len(statuses) > 1, recent)
+    finally:
+        cursor.close()
+
+
+def read_settlement(path: str) -> Iterator[GatewayCharge]:
+    with open(path, newline="", encoding="utf-8") as settlement:
+        reader = csv.reader(settlement)
+        next(reader, None)
+        previous = None
+        for charge_id, transaction_id, amount, status, processed_at in reader:
+            charge = GatewayCharge(
+                int(charge_id), transaction_id, cents(amount), status, datetime.fromisoformat(processed_at)
+            )
+            if previous is not None and charge.charge_id < previous:
+                raise ValueError(f"Settlement file is not sorted by charge_id at line {reader.line_num}")
+            previous = charge.charge_id
+            yield charge
+
+
+def merge_join(
+    ours: Iterator[Charge], theirs: Iterator[GatewayCharge]
+) -> Iterator[Tuple[Optional[Charge], Optional[GatewayCharge], bool]]:
+    """Pairs both sides by charge_id; the flag marks repeated gateway lines for one charge."""
+    our = next(ours, None)
+    their = next(theirs, None)
+    last_matched = None
+    while our is not None or their is not None:
+        if their is None or (our is not None and our.charge_id < their.charge_id):
+            yield our, None, False
+            our = next(ours, None)
+        elif our is None or their.charge_id < our.charge_id:
+            yield None, their, their.charge_id == last_matched
+            their = next(theirs, None)
+        else:
+            yield our, their, False
+            last_matched = their.charge_id
+            our = next(ours, None)
+            their = next(theirs, None)
+
+
+def classify(our: Optional[Charge], their: Optional[GatewayCharge], duplicate: bool) -> Optional[str]:
+    if our is None:
+        return "duplicate_charge" if duplicate else "unknown_charge"
+    if our.mixed:
+        return "mixed_status"
+    if their is None:
+        if our.status in IN_FLIGHT:
+            return "stuck_uncharged"
+        return "missing_at_gateway" if our.status == "completed" else None
+    if their.status == "success":
+        if their.cents != our.cents:
+            return "amount_mismatch"
+        if our.status in IN_FLIGHT:
+            return "stuck_charged"
+        return "failed_charged" if our.status == "failed" else None
+    if our.status in IN_FLIGHT:
+        return "stuck_declined"
+    return "completed_declined" if our.status == "completed" else None
+
+
+class UnknownCharges:
+    """Settlement lines without a charge of ours in the window, confirmed in batches."""
+
+    def __init__(self, connection, batch_size: int):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.outside_window = 0
+        self._pending: List[GatewayCharge] = []
+
+    def add(self, their: GatewayCharge) -> List[GatewayCharge]:
+        self._pending.append(their)
+        if len(self._pending) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[GatewayCharge]:
+        """Returns the pending lines whose charge id payments does not have."""
+        if not self._pending:
+            return []
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(KNOWN_CHARGES_QUERY, {"charge_ids": [their.charge_id for their in self._pending]})
+            known = {charge_id for charge_id, in cursor}
+        finally:
+            cursor.close()
+        unknown = [their for their in self._pending if their.charge_id not in known]
+        self.outside_window += len(self._pending) - len(unknown)
+        self._pending = []
+        return unknown
+
+
+class Fixes:
+    """Pending status fixes, applied in one transaction per batch."""
+
+    def __init__(self, batch_size: int, dry_run: bool):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.seconds = 0.0
+        self._complete: List[int] = []
+        self._paid_at: List[datetime] = []
+        self._fail: List[int] = []
+        self._charges = 0
+
+    def add(self, kind: str, our: Charge, their: Optional[GatewayCharge]) -> None:
+        if FIXES[kind] == "completed":
+            self._complete.extend(our.payment_ids)
+            self._paid_at.extend([their.processed_at] * len(our.payment_ids))
+        else:
+            self._fail.extend(our.payment_ids)
+        self._charges += 1
+        if self._charges >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._charges:
+            return
+        started = time.perf_counter()
+        if not self.dry_run:
+            db = SessionLocal()
+            try:
+                if self._complete:
+                    complete_payments(db, self._complete, self._paid_at)
+                if self._fail:
+                    fail_payments(db, self._fail)
+                db.commit()
+            finally:
+                db.close()
+        self.seconds += time.perf_counter() - started
+        logger.info(f"Applied fixes for {self._charges} charges")
+        self._complete, self._paid_at, self._fail, self._charges = [], [], [], 0
+
+
+def run(
+    settlement: str,
+    since: date,
+    until: date,
+    report: str,
+    batch_size: int,
+    fetch_size: int,
+    min_age: float,
+    dry_run: bool,
+) -> None:
+    started = time.perf_counter()
+    recent_after = datetime.now(timezone.utc) - timedelta(seconds=min_age)
+    counts = Counter()
+    kinds = Counter()
+    fixes = Fixes(batch_size, dry_run)
+
+    connection = engine.raw_connection()
+    unknown = UnknownCharges(connection, batch_size)
+    try:
+        with open(report, "w", newline="", encoding="utf-8") as report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(REPORT_HEADER)
+
+            def write(kind: str, our: Optional[Charge], their: Optional[GatewayCharge]) -> None:
+                kinds[kind] += 1
+                writer.writerow([
+                    kind,
+                    their.charge_id if our is None else our.charge_id,
+                    " ".join(map(str, our.payment_ids)) if our else "",
+                    f"{our.cents / 100:.2f}" if our else "",
+                    our.status if our else "",
+                    f"{their.cents / 100:.2f}" if their else "",
+                    their.status if their else "",
+                    their.transaction_id if their else "",
+                ])
+
+            pairs = merge_join(
+                read_charges(connection, since, until, recent_after, fetch_size), read_settlement(settlement)
+            )
+            for our, their, duplicate in pairs:
+                counts["payments"] += our is not None
+                counts["settlement"] += their is not None
+                kind = classify(our, their, duplicate)
+                if kind is None:
+                    counts["matched"] += 1
+                    continue
+                if kind in FIXES and our.recent:
+                    counts["recent"] += 1
+                    continue
+                if kind == "unknown_charge":
+                    for confirmed in unknown.add(their):
+                        write(kind, None, confirmed)
+                    continue
+                write(kind, our, their)
+                if kind in FIXES:
+                    fixes.add(kind, our, their)
+            for confirmed in unknown.flush():
+                write("unknown_charge", None, confirmed)
+            fixes.flush()
+        connection.commit()
+    finally:
+        connection.close()
+
+    elapsed = time.perf_counter() - started
+    rows = counts["payments"] + counts["settlement"]
+    print(f"{'charges':<22}{'ours':>12}{'gateway':>12}{'matched':>12}")
+    print(f"{'':<22}{counts['payments']:>12}{counts['settlement']:>12}{counts['matched']:>12}")
+    print(f"{'outside window':<22}{unknown.outside_window:>12}  skipped")
+    print(f"{'too recent':<22}{counts['recent']:>12}  skipped")
+    print(f"{'discrepancy':<22}{'count':>12}  action")
+    for kind, count in sorted(kinds.items()):
+        action = FIXES.get(kind, "reported")
+        if kind in FIXES and dry_run:
+            action += " (dry run)"
+        print(f"{kind:<22}{count:>12}  {action}")
+    print(
+        f"{rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s), "
+        f"fixes {fixes.seconds:.1f}s; report: {report}"
+    )
+
+
+def main():
+    yesterday = date.today() - timedelta(days=1)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--settlement", type=str, required=True, help="CSV sorted by charge_id")
+    parser.add_argument("--since", type=parse_date, default=yesterday, help="YYYY-MM-DD, payments created from")
+    parser.add_argument("--until", type=parse_date, default=None, help="YYYY-MM-DD, exclusive; default: since + 1 day")
+    parser.add_argument("--report", type=str, default="reconciliation.csv")
+    parser.add_argument("--batch-size", type=int, default=RECONCILE_BATCH_SIZE)
+    parser.add_argument("--fetch-size", type=int, default=RECONCILE_FETCH_SIZE)
+    parser.add_argument(
+        "--min-age", type=float, default=RECONCILE_MIN_AGE, help="seconds before an in-flight charge is fixed"
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    until = args.until or args.since + timedelta(days=1)
+    run(
+        args.settlement, args.since, until, args.report, args.batch_size, args.fetch_size, args.min_age, args.dry_run
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,16 @@ from datetime import datetime, timezone
 from sqlalchemy import (
     Boolean,
     Column,
+    Date,
     DateTime,
     Float,
     Integer,
     String,
+    Text,
     create_engine,
+    func,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -27,13 +31,13 @@ Base = declarative_base()
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
-    keycloack_id = Column(String, nullable=False)
+    keycloack_id = Column(String, unique=True, index=True, nullable=False)
 
 class Account(Base):
     __tablename__ = "accounts"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False, index=True)
     account_number = Column(String(10), unique=True, index=True, nullable=False)
     address_id = Column(Integer, nullable=False)
     provider_id = Column(Integer, nullable=False)
@@ -46,7 +50,7 @@ class Bill(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     account_id = Column(Integer, nullable=False)
-    period = Column(String, nullable=False)
+    period = Column(Date, nullable=False)
     amount = Column(Float, nullable=False)
     service_id = Column(Integer, nullable=False)
     status_type = Column(String, default="pending")
@@ -61,7 +65,20 @@ class Payment(Base):
     amount = Column(Float, nullable=False)
     paid_at = Column(DateTime, nullable=True)
     status = Column(String, default="pending")
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    charge_id = Column(Integer, nullable=True)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "payment_idempotency_keys"
+
+    user_key = Column(Text, primary_key=True)
+    idempotency_key = Column(Text, primary_key=True)
+    request_hash = Column(Text, nullable=False)
+    status_code = Column(Integer, nullable=True)
+    response = Column(JSONB, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False)
 
 
 class PaymentBill(Base):
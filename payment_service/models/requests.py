@@ -1,14 +1,37 @@
 from datetime import datetime
+from typing import List
 
 from pydantic import BaseModel, Field, validator
 
+MAX_BATCH_ITEMS = 36
 
-class PaymentCreate(BaseModel):
+# Card details are sent to the gateway but never stored, not even hashed.
+CARD_FIELDS = {"card_number", "card_holder", "card_expiration_date", "card_cvv"}
+
+
+class BillPeriod(BaseModel):
     account_number: str = Field(
         ..., description="Account number", min_length=10, max_length=10
     )
-    amount: float = Field(..., description="Amount", gt=0)
     period: str = Field(..., description="Period", pattern=r"^\d{4}-\d{2}$")
+
+    @validator("account_number")
+    def validate_account_number(cls, v):
+        if not v.isdigit() or len(v) != 10:
+            raise ValueError("Account number must be exactly 10 digits")
+        return v
+
+    @validator("period")
+    def validate_period(cls, v):
+        try:
+            datetime.strptime(v, "%Y-%m")
+        except ValueError:
+            raise ValueError("Period must be in YYYY-MM format")
+        return v
+
+
+class CardCharge(BaseModel):
+    amount: float = Field(..., description="Amount", gt=0)
     card_number: str = Field(
         ..., description="Card number", min_length=16, max_length=16
     )
@@ -23,16 +46,19 @@ class PaymentCreate(BaseModel):
         ..., description="INN receiver", min_length=12, max_length=12
     )
 
-    @validator("account_number")
-    def validate_account_number(cls, v):
-        if not v.isdigit() or len(v) != 10:
-            raise ValueError("Account number must be exactly 10 digits")
-        return v
 
-    @validator("period")
-    def validate_period(cls, v):
-        try:
-            datetime.strptime(v, "%Y-%m")
-        except ValueError:
-            raise ValueError("Period must be in YYYY-MM format")
+class PaymentCreate(CardCharge, BillPeriod):
+    pass
+
+
+class PaymentBatchCreate(CardCharge):
+    items: List[BillPeriod] = Field(
+        ..., description="Account periods to pay", min_length=1, max_length=MAX_BATCH_ITEMS
+    )
+
+    @validator("items")
+    def validate_items(cls, v):
+        pairs = {(item.account_number, item.period) for item in v}
+        if len(pairs) != len(v):
+            raise ValueError("Each account period may be listed only once")
         return v
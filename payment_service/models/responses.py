@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -13,3 +13,25 @@ class PaymentResponse(BaseModel):
     status: str
     created_at: datetime
     completed_at: Optional[datetime]
+
+
+class PaymentBatchResponse(BaseModel):
+    amount: float
+    status: str
+    completed_at: Optional[datetime]
+    payments: List[PaymentResponse]
+
+
+class PaymentHistoryItem(BaseModel):
+    id: int
+    account_number: str
+    amount: float
+    periods: List[str]
+    status: str
+    created_at: datetime
+    completed_at: Optional[datetime]
+
+
+class PaymentHistoryResponse(BaseModel):
+    payments: List[PaymentHistoryItem]
+    next_cursor: Optional[str]
@@ -1,22 +1,42 @@
+import base64
 import logging
-import os
-from datetime import datetime, timezone
+import math
+from collections import defaultdict
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Tuple
 
+import httpx
 import jwt
-import requests
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from models.database import Account, Bill, Payment, PaymentBill, User, get_db
-from models.requests import PaymentCreate
-from models.responses import PaymentResponse
+from core.gateway import CircuitOpenError, charge_not_sent, charge_reference, payment_gateway
+from core.identity import user_ids
+from core.idempotency import IdempotencyConflict, IdempotencyKeyReused, idempotency_store, request_hash
+from core.pipeline import PaymentJob, payment_pipeline
+from core.settlement import (
+    PROCESSING,
+    QUEUED,
+    claim_bills,
+    group_charge,
+    id_array,
+    link_bills,
+    mark_processing,
+    settle_payment,
+)
+from models.database import Account, Bill, Payment, PaymentBill, get_db
+from models.requests import CARD_FIELDS, CardCharge, PaymentBatchCreate, PaymentCreate
+from models.responses import PaymentBatchResponse, PaymentHistoryItem, PaymentHistoryResponse, PaymentResponse
+from pydantic import BaseModel
+from sqlalchemy import func, select, true, tuple_
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger("payment_service.routes")
 router = APIRouter()
 security = HTTPBearer()
-PAYMENT_MOCK_SERVICE_URL = os.getenv(
-    "PAYMENT_MOCK_SERVICE_URL", "http://payment-mock-service:8000"
-)
+
+MAX_HISTORY_PAGE = 100
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
@@ -30,31 +50,169 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
-@router.post("/", response_model=PaymentResponse)
+@router.post("/", response_model=PaymentResponse, responses={202: {"model": PaymentResponse}})
 async def create_payment(
     payment_data: PaymentCreate,
+    response: Response,
+    async_mode: bool = Query(False, alias="async"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", min_length=1, max_length=255),
     db: Session = Depends(get_db),
     current_user: str = Depends(get_current_user),
 ):
+    if idempotency_key is None:
+        status_code, payment = await _create_payment(payment_data, async_mode, db, current_user)
+        response.status_code = status_code
+        if status_code == 202:
+            response.headers["Location"] = f"/api/payments/{payment.id}"
+        return payment
+
+    fingerprint = request_hash({**payment_data.model_dump(exclude=CARD_FIELDS), "async": async_mode})
+    return await _idempotent(
+        current_user, idempotency_key, fingerprint, lambda: _create_payment(payment_data, async_mode, db, current_user)
+    )
+
+
+@router.post("/batch", response_model=PaymentBatchResponse, responses={202: {"model": PaymentBatchResponse}})
+async def create_batch_payment(
+    batch: PaymentBatchCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", min_length=1, max_length=255),
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user),
+):
+    if idempotency_key is None:
+        response.status_code, payments = await _create_batch_payment(batch, db, current_user)
+        return payments
+
+    fingerprint = request_hash({**batch.model_dump(exclude=CARD_FIELDS), "batch": True})
+    return await _idempotent(
+        current_user, idempotency_key, fingerprint, lambda: _create_batch_payment(batch, db, current_user)
+    )
+
+
+async def _idempotent(
+    current_user: str,
+    idempotency_key: str,
+    fingerprint: str,
+    create: Callable[[], Awaitable[Tuple[int, BaseModel]]],
+) -> JSONResponse:
+    async def operation():
+        try:
+            status_code, body = await create()
+        except HTTPException as e:
+            return e.status_code, {"detail": e.detail}
+        return status_code, jsonable_encoder(body)
+
+    try:
+        result = await idempotency_store.execute(current_user, idempotency_key, fingerprint, operation)
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    except IdempotencyConflict:
+        raise HTTPException(
+            status_code=409, detail="A request with this Idempotency-Key is in progress", headers={"Retry-After": "1"}
+        )
+
+    if result.replayed:
+        logger.info(f"Replaying response for Idempotency-Key {idempotency_key} of user {current_user}")
+    headers = {"Idempotent-Replayed": "true"} if result.replayed else {}
+    if result.status_code == 202 and "id" in result.body:
+        headers["Location"] = f"/api/payments/{result.body['id']}"
+    return JSONResponse(status_code=result.status_code, content=result.body, headers=headers)
+
+
+def _gateway_payload(charge: CardCharge) -> dict:
+    return {
+        "amount": charge.amount,
+        "card_number": charge.card_number,
+        "card_holder": charge.card_holder,
+        "card_expiration_date": charge.card_expiration_date,
+        "card_cvv": charge.card_cvv,
+        "inn_receiver": charge.inn_receiver,
+    }
+
+
+async def _charge(db: Session, payment_ids: List[int], bill_ids: List[int], charge: CardCharge) -> Optional[datetime]:
+    """Charges the card once for the payments and settles them; raises HTTPException on failure.
+
+    Returns the payment time, or None when the gateway may have charged the
+    card without answering: the payments are then left processing for
+    jobs/reconcile.py.
+    """
+    try:
+        logger.info(f"Calling payment mock service for payments {payment_ids}")
+        response = await payment_gateway.charge(
+            _gateway_payload(charge), idempotency_key=charge_reference(payment_ids[0])
+        )
+    except CircuitOpenError as e:
+        logger.error(f"Payment gateway circuit is open, failing payments {payment_ids}")
+        settle_payment(db, payment_ids, bill_ids, False)
+        raise HTTPException(
+            status_code=503,
+            detail="Payment service is temporarily unavailable",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    except httpx.HTTPError as e:
+        if not charge_not_sent(e):
+            logger.error(f"No answer from payment service for payments {payment_ids}, left processing: {str(e)}")
+            mark_processing(db, payment_ids)
+            return None
+        logger.error(f"Payment service unavailable for payments {payment_ids}: {str(e)}")
+        settle_payment(db, payment_ids, bill_ids, False)
+        raise HTTPException(
+            status_code=500, detail=f"Payment service unavailable: {str(e)}"
+        )
+
+    # The gateway has answered, so the card may have been charged: if the answer
+    # cannot be recorded the payments stay in flight with their bills claimed,
+    # and jobs/reconcile.py settles them from the settlement file.
+    try:
+        if response.status_code != 200:
+            logger.error(f"Payment mock service failed with status {response.status_code}")
+            settle_payment(db, payment_ids, bill_ids, False)
+            raise HTTPException(status_code=400, detail="Payment failed")
+
+        mock_response = response.json()
+
+        if mock_response.get("status") == "success":
+            logger.info(f"Payments {payment_ids} successful, updating bills status")
+            paid_at = settle_payment(db, payment_ids, bill_ids, True)
+            logger.info(f"Payments {payment_ids} completed successfully")
+            return paid_at
+        else:
+            logger.error(f"Payments {payment_ids} failed: {mock_response.get('message', 'Unknown error')}")
+            settle_payment(db, payment_ids, bill_ids, False)
+            raise HTTPException(
+                status_code=400,
+                detail=f"Payment failed: {mock_response.get('message', 'Unknown error')}",
+            )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Could not record the gateway answer for payments {payment_ids}, left for reconciliation: {e}")
+        db.rollback()
+        raise HTTPException(
+            status_code=500, detail="Payment result could not be recorded; it will be reconciled"
+        )
+
+
+async def _create_payment(
+    payment_data: PaymentCreate, async_mode: bool, db: Session, current_user: str
+) -> Tuple[int, PaymentResponse]:
     logger.info(f"Creating payment for user {current_user}, account {payment_data.account_number}, period {payment_data.period}")
     
+    user_id = user_ids.resolve(db, current_user)
     account = (
         db.query(Account)
-        .join(User, Account.user_id == User.id)
-        .filter(Account.account_number == payment_data.account_number, User.keycloack_id == current_user)
+        .filter(Account.account_number == payment_data.account_number, Account.user_id == user_id)
         .first()
     )
     if not account:
         logger.error(f"Account not found: {payment_data.account_number} for user {current_user}")
         raise HTTPException(status_code=404, detail="Account not found")
     
-    bills = (
-        db.query(Bill)
-        .filter(Bill.account_id == account.id, 
-                Bill.period == payment_data.period + '-01',
-                Bill.status_type != 'paid')
-        .all()
-    )
+    period = datetime.strptime(payment_data.period, "%Y-%m").date()
+    bills = claim_bills(db, [(account.id, period)])
     if not bills:
         logger.warning(f"No unpaid bills found for account {payment_data.account_number}, period {payment_data.period}")
         raise HTTPException(status_code=404, detail="No unpaid bills found for this period")
@@ -64,6 +222,7 @@ async def create_payment(
 
     if abs(payment_data.amount - total_amount) > 0.01:
         logger.error(f"Payment amount mismatch: {payment_data.amount} vs {total_amount}")
+        db.rollback()
         raise HTTPException(
             status_code=400, detail=f"Payment amount {payment_data.amount} must match total bill amount {total_amount}"
         )
@@ -71,82 +230,241 @@ async def create_payment(
     payment = Payment(
         account_id=account.id,
         amount=payment_data.amount,
-        status="pending",
+        status=QUEUED if async_mode else "pending",
     )
     db.add(payment)
     db.flush() 
 
-    for bill in bills:
-        payment_bill = PaymentBill(
-            payment_id=payment.id,
-            bill_id=bill.id
-        )
-        db.add(payment_bill)
+    payment_id, created_at = payment.id, payment.created_at
+    bill_ids = [bill.id for bill in bills]
+    link_bills(db, [(payment_id, bill_id) for bill_id in bill_ids])
+    db.commit()
 
-    logger.info(f"Created payment {payment.id} with {len(bills)} linked bills")
+    logger.info(f"Created payment {payment_id} with {len(bills)} linked bills")
 
-    try:
-        mock_payment_data = {
-            "amount": payment_data.amount,
-            "card_number": payment_data.card_number,
-            "card_holder": payment_data.card_holder,
-            "card_expiration_date": payment_data.card_expiration_date,
-            "card_cvv": payment_data.card_cvv,
-            "inn_receiver": payment_data.inn_receiver,
-        }
-        
-        logger.info(f"Calling payment mock service for payment {payment.id}")
-        response = requests.post(
-            f"{PAYMENT_MOCK_SERVICE_URL}/api/v1/payments/", json=mock_payment_data
+    if async_mode:
+        if not payment_pipeline.submit(PaymentJob(payment_id, bill_ids, _gateway_payload(payment_data))):
+            logger.error(f"Payment queue is full, rejecting payment {payment_id}")
+            settle_payment(db, [payment_id], bill_ids, False)
+            raise HTTPException(status_code=503, detail="Payment queue is full")
+
+        logger.info(f"Payment {payment_id} queued")
+        status_code, status, paid_at = 202, QUEUED, None
+    else:
+        paid_at = await _charge(db, [payment_id], bill_ids, payment_data)
+        if paid_at is None:
+            status_code, status = 202, PROCESSING
+        else:
+            status_code, status = 200, "completed"
+
+    return status_code, PaymentResponse(
+        id=payment_id,
+        payment_id=str(payment_id),
+        account_number=payment_data.account_number,
+        amount=payment_data.amount,
+        period=payment_data.period,
+        status=status,
+        created_at=created_at,
+        completed_at=paid_at,
+    )
+
+
+async def _create_batch_payment(
+    batch: PaymentBatchCreate, db: Session, current_user: str
+) -> Tuple[int, PaymentBatchResponse]:
+    """Pays several account periods with one gateway charge.
+
+    Bills of all periods are claimed in one statement and the amount is
+    checked against their total. One payment is recorded per period so that
+    each keeps its own account and period; all of them are settled together.
+    """
+    logger.info(f"Creating batch payment for user {current_user}, {len(batch.items)} periods")
+
+    user_id = user_ids.resolve(db, current_user)
+    account_numbers = {item.account_number for item in batch.items}
+    accounts = dict(
+        db.query(Account.account_number, Account.id)
+        .filter(Account.account_number.in_(account_numbers), Account.user_id == user_id)
+        .all()
+    )
+    missing = sorted(account_numbers - accounts.keys())
+    if missing:
+        logger.error(f"Accounts not found: {missing} for user {current_user}")
+        raise HTTPException(status_code=404, detail=f"Accounts not found: {', '.join(missing)}")
+
+    periods = [
+        (accounts[item.account_number], datetime.strptime(item.period, "%Y-%m").date()) for item in batch.items
+    ]
+    bills_by_period = defaultdict(list)
+    for bill in claim_bills(db, periods):
+        bills_by_period[(bill.account_id, bill.period)].append(bill)
+
+    empty = [f"{item.account_number} {item.period}" for item, key in zip(batch.items, periods) if key not in bills_by_period]
+    if empty:
+        logger.warning(f"No unpaid bills found for {empty}")
+        db.rollback()
+        raise HTTPException(status_code=404, detail=f"No unpaid bills found for: {', '.join(empty)}")
+
+    amounts = [round(sum(bill.amount for bill in bills_by_period[key]), 2) for key in periods]
+    total_amount = round(sum(amounts), 2)
+    logger.info(f"Found unpaid bills for {len(periods)} periods, total amount: {total_amount}")
+
+    if abs(batch.amount - total_amount) > 0.01:
+        logger.error(f"Payment amount mismatch: {batch.amount} vs {total_amount}")
+        db.rollback()
+        raise HTTPException(
+            status_code=400, detail=f"Payment amount {batch.amount} must match total bill amount {total_amount}"
         )
 
-        if response.status_code != 200:
-            logger.error(f"Payment mock service failed with status {response.status_code}")
-            payment.status = "failed"
-            db.commit()
-            raise HTTPException(status_code=400, detail="Payment failed")
+    payments = [
+        Payment(account_id=account_id, amount=amount, status="pending")
+        for (account_id, _), amount in zip(periods, amounts)
+    ]
+    db.add_all(payments)
+    db.flush()
 
-        mock_response = response.json()
+    created = [(payment.id, payment.created_at) for payment in payments]
+    payment_ids = [payment_id for payment_id, _ in created]
+    bill_ids = [bill.id for key in periods for bill in bills_by_period[key]]
+    link_bills(db, [
+        (payment_id, bill.id) for payment_id, key in zip(payment_ids, periods) for bill in bills_by_period[key]
+    ])
+    group_charge(db, payment_ids)
+    db.commit()
 
-        if mock_response.get("status") == "success":
-            logger.info(f"Payment {payment.id} successful, updating bills status")
-            payment.status = "completed"
-            payment.paid_at = datetime.now(timezone.utc)
-            
-            for bill in bills:
-                bill.status_type = "paid"
-               
-            db.commit()
-            logger.info(f"Payment {payment.id} completed successfully")
-
-            return PaymentResponse(
-                id=payment.id,
-                payment_id=str(payment.id),
-                account_number=payment_data.account_number,
-                amount=payment_data.amount,
-                period=payment_data.period,
-                status="completed",
-                created_at=payment.created_at,
-                completed_at=payment.paid_at,
+    logger.info(f"Created payments {payment_ids} with {len(bill_ids)} linked bills")
+    paid_at = await _charge(db, payment_ids, bill_ids, batch)
+    status = "completed" if paid_at is not None else PROCESSING
+
+    return 200 if paid_at is not None else 202, PaymentBatchResponse(
+        amount=total_amount,
+        status=status,
+        completed_at=paid_at,
+        payments=[
+            PaymentResponse(
+                id=payment_id,
+                payment_id=str(payment_id),
+                account_number=item.account_number,
+                amount=amount,
+                period=item.period,
+                status=status,
+                created_at=created_at,
+                completed_at=paid_at,
             )
-        else:
-            logger.error(f"Payment {payment.id} failed: {mock_response.get('message', 'Unknown error')}")
-            payment.status = "failed"
-            db.commit()
-            raise HTTPException(
-                status_code=400,
-                detail=f"Payment failed: {mock_response.get('message', 'Unknown error')}",
+            for (payment_id, created_at), item, amount in zip(created, batch.items, amounts)
+        ],
+    )
+
+
+def _encode_cursor(created_at: datetime, payment_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{payment_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, payment_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(payment_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/history", response_model=PaymentHistoryResponse)
+async def get_payment_history(
+    account_number: Optional[str] = Query(None, min_length=10, max_length=10),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_HISTORY_PAGE),
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user),
+):
+    """Payments of the user's accounts, newest first, ``limit`` per page.
+
+    Pages are keyed by ``(created_at, id)`` of the last payment returned, so
+    each account's page is one range scan of
+    payments_account_id_created_at_index whatever the depth; the per-account
+    pages are merged and cut to ``limit``.
+    """
+    user_id = user_ids.resolve(db, current_user)
+    accounts = select(Account.id, Account.account_number).where(Account.user_id == user_id)
+    if account_number is not None:
+        accounts = accounts.where(Account.account_number == account_number)
+    accounts = accounts.subquery()
+
+    page = select(
+        Payment.id, Payment.amount, Payment.status, Payment.created_at, Payment.paid_at
+    ).where(Payment.account_id == accounts.c.id)
+    if cursor is not None:
+        page = page.where(tuple_(Payment.created_at, Payment.id) < tuple_(*_decode_cursor(cursor)))
+    page = page.order_by(Payment.created_at.desc(), Payment.id.desc()).limit(limit + 1).lateral()
+
+    rows = (
+        db.query(accounts.c.account_number, page)
+        .select_from(accounts)
+        .join(page, true())
+        .order_by(page.c.created_at.desc(), page.c.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    periods = defaultdict(list)
+    if rows:
+        for payment_id, period in (
+            db.query(PaymentBill.payment_id, func.to_char(Bill.period, "YYYY-MM"))
+            .join(Bill, Bill.id == PaymentBill.bill_id)
+            .filter(PaymentBill.payment_id == id_array(row.id for row in rows))
+            .distinct()
+            .order_by(PaymentBill.payment_id, func.to_char(Bill.period, "YYYY-MM"))
+        ):
+            periods[payment_id].append(period)
+
+    return PaymentHistoryResponse(
+        payments=[
+            PaymentHistoryItem(
+                id=row.id,
+                account_number=row.account_number,
+                amount=row.amount,
+                periods=periods[row.id],
+                status=row.status,
+                created_at=row.created_at,
+                completed_at=row.paid_at,
             )
+            for row in rows
+        ],
+        next_cursor=_encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None,
+    )
 
-    except requests.RequestException as e:
-        logger.error(f"Payment service unavailable for payment {payment.id}: {str(e)}")
-        payment.status = "failed"
-        db.commit()
-        raise HTTPException(
-            status_code=500, detail=f"Payment service unavailable: {str(e)}"
-        )
-    except Exception as e:
-        logger.error(f"Internal error for payment {payment.id}: {str(e)}")
-        payment.status = "failed"
-        db.commit()
-        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+@router.get("/{payment_id}", response_model=PaymentResponse)
+async def get_payment(
+    payment_id: int,
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user),
+):
+    user_id = user_ids.resolve(db, current_user)
+    row = (
+        db.query(Payment, Account.account_number)
+        .join(Account, Account.id == Payment.account_id)
+        .filter(Payment.id == payment_id, Account.user_id == user_id)
+        .first()
+    )
+    if row is None:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    payment, account_number = row
+
+    period = (
+        db.query(func.min(Bill.period))
+        .join(PaymentBill, PaymentBill.bill_id == Bill.id)
+        .filter(PaymentBill.payment_id == payment.id)
+        .scalar()
+    )
+    return PaymentResponse(
+        id=payment.id,
+        payment_id=str(payment.id),
+        account_number=account_number,
+        amount=payment.amount,
+        period=period.strftime("%Y-%m") if period else "",
+        status=payment.status,
+        created_at=payment.created_at,
+        completed_at=payment.paid_at,
+    )
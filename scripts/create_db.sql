@@ -8,6 +8,8 @@ CREATE TABLE "users"(
 );
 ALTER TABLE
     "users" ADD PRIMARY KEY("id");
+ALTER TABLE
+    "users" ADD CONSTRAINT "users_keycloack_id_unique" UNIQUE("keycloack_id");
 CREATE TABLE "user_profiles"(
     "user_id" BIGINT NOT NULL,
     "last_name" TEXT NOT NULL,
@@ -53,28 +55,53 @@ CREATE TABLE "accounts"(
 );
 ALTER TABLE
     "accounts" ADD PRIMARY KEY("id");
+CREATE INDEX "accounts_user_id_index" ON
+    "accounts"("user_id");
+CREATE INDEX "accounts_account_number_index" ON
+    "accounts"("account_number");
 CREATE TABLE "bills"(
     "id" SERIAL NOT NULL,
     "account_id" BIGINT NOT NULL,
     "service_id" BIGINT NOT NULL,
-    "period" DATE NOT NULL,
+    "period" DATE NOT NULL CHECK (EXTRACT(DAY FROM "period") = 1),
     "amount" DECIMAL(8, 2) NOT NULL,
     "status_type" TEXT NOT NULL,
     "last_data" FLOAT(53) NOT NULL,
     "units" FLOAT(53) NOT NULL
-);
+) PARTITION BY RANGE("period");
 ALTER TABLE
-    "bills" ADD PRIMARY KEY("id");
+    "bills" ADD PRIMARY KEY("id", "period");
+ALTER TABLE
+    "bills" ADD CONSTRAINT "bills_account_id_period_service_id_unique" UNIQUE("account_id", "period", "service_id");
+CREATE TABLE "bills_default" PARTITION OF "bills" DEFAULT;
 CREATE TABLE "payments"(
     "id" SERIAL NOT NULL,
     "account_id" BIGINT NOT NULL,
-    "amount" BIGINT NOT NULL,
+    "amount" DECIMAL(12, 2) NOT NULL,
     "paid_at" TIMESTAMP(0) WITHOUT TIME ZONE,
     "status" TEXT NOT NULL DEFAULT 'pending',
-    "created_at" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+    "created_at" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+    -- Первый платёж списания, которым оплачено несколько платежей (пакетная оплата);
+    -- NULL - платёж списан отдельно
+    "charge_id" BIGINT
 );
 ALTER TABLE
     "payments" ADD PRIMARY KEY("id");
+CREATE INDEX "payments_account_id_created_at_index" ON
+    "payments"("account_id", "created_at" DESC, "id" DESC) INCLUDE ("amount", "status", "paid_at");
+CREATE TABLE "payment_idempotency_keys"(
+    "user_key" TEXT NOT NULL,
+    "idempotency_key" TEXT NOT NULL,
+    "request_hash" TEXT NOT NULL,
+    "status_code" INTEGER,
+    "response" JSONB,
+    "created_at" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+    "expires_at" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL
+);
+ALTER TABLE
+    "payment_idempotency_keys" ADD PRIMARY KEY("user_key", "idempotency_key");
+CREATE INDEX "payment_idempotency_keys_expires_at_index" ON
+    "payment_idempotency_keys"("expires_at");
 CREATE TABLE "payment_bills"(
     "id" SERIAL NOT NULL,
     "payment_id" BIGINT NOT NULL,
@@ -82,11 +109,15 @@ CREATE TABLE "payment_bills"(
 );
 ALTER TABLE
     "payment_bills" ADD PRIMARY KEY("id");
+CREATE INDEX "payment_bills_payment_id_index" ON
+    "payment_bills"("payment_id");
 CREATE TABLE "services"(
     "id" SERIAL NOT NULL,
     "service_name" TEXT NOT NULL,
     "provider_id" BIGINT NOT NULL,
-    "cost_per_unit" FLOAT(53) NOT NULL
+    "cost_per_unit" FLOAT(53) NOT NULL,
+    "calculation_method" TEXT NOT NULL DEFAULT 'metered'
+        CHECK ("calculation_method" IN ('metered', 'area', 'residents', 'fixed'))
 );
 ALTER TABLE
     "services" ADD PRIMARY KEY("id");
@@ -102,8 +133,8 @@ ALTER TABLE
     "accounts" ADD CONSTRAINT "accounts_address_id_foreign" FOREIGN KEY("address_id") REFERENCES "user_addresses"("id");
 ALTER TABLE
     "payment_bills" ADD CONSTRAINT "payment_bills_payment_id_foreign" FOREIGN KEY("payment_id") REFERENCES "payments"("id");
-ALTER TABLE
-    "payment_bills" ADD CONSTRAINT "payment_bills_bill_id_foreign" FOREIGN KEY("bill_id") REFERENCES "bills"("id");
+-- payment_bills.bill_id не ссылается на bills внешним ключом: первичный ключ
+-- секционированной bills включает period.
 ALTER TABLE
     "accounts" ADD CONSTRAINT "accounts_provider_id_foreign" FOREIGN KEY("provider_id") REFERENCES "providers"("id");
 ALTER TABLE
@@ -111,4 +142,495 @@ ALTER TABLE
 ALTER TABLE
     "services" ADD CONSTRAINT "services_provider_id_foreign" FOREIGN KEY("provider_id") REFERENCES "providers"("id");
 ALTER TABLE
-    "users" ADD CONSTRAINT "users_id_foreign" FOREIGN KEY("id") REFERENCES "user_profiles"("user_id");
\ No newline at end of file
+    "users" ADD CONSTRAINT "users_id_foreign" FOREIGN KEY("id") REFERENCES "user_profiles"("user_id");
+
+-- Секции bills по месяцам. Секции создаются заранее: до конца следующего года при
+-- инициализации и перед каждым запуском jobs/billing_run.py.
+CREATE OR REPLACE FUNCTION ensure_bills_partition(target DATE) RETURNS void AS $$
+DECLARE
+    start_date DATE := date_trunc('month', target)::date;
+    partition_name TEXT := 'bills_' || to_char(start_date, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF bills FOR VALUES FROM (%L) TO (%L)',
+            partition_name, start_date, (start_date + INTERVAL '1 month')::date
+        );
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_bills_partition(month::date)
+FROM generate_series(DATE '2024-01-01', date_trunc('year', now()) + INTERVAL '1 year 11 months', INTERVAL '1 month') AS month;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Нормализация адреса: регистр, ё -> е, пунктуация и пробелы, сокращения
+-- типов улиц и служебные слова (г., д., кв.). Используется в генерируемых
+-- колонках user_addresses и в поиске, поэтому должна оставаться IMMUTABLE.
+CREATE OR REPLACE FUNCTION normalize_address_text(value TEXT) RETURNS TEXT AS $$
+    SELECT btrim(regexp_replace(
+        regexp_replace(regexp_replace(regexp_replace(regexp_replace(regexp_replace(
+        regexp_replace(regexp_replace(regexp_replace(regexp_replace(regexp_replace(
+            ' ' || regexp_replace(lower(translate(value, 'Ёё', 'ее')), '[^0-9a-zа-я]+', ' ', 'g') || ' ',
+            '(?<= )(улица|ул)(?= )', 'ул', 'g'),
+            '(?<= )(проспект|просп|пр)(?= )', 'пр', 'g'),
+            '(?<= )(переулок|пер)(?= )', 'пер', 'g'),
+            '(?<= )(бульвар|бул)(?= )', 'бул', 'g'),
+            '(?<= )(шоссе|ш)(?= )', 'ш', 'g'),
+            '(?<= )(площадь|пл)(?= )', 'пл', 'g'),
+            '(?<= )(набережная|наб)(?= )', 'наб', 'g'),
+            '(?<= )(область|обл)(?= )', 'обл', 'g'),
+            '(?<= )(республика|респ)(?= )', 'респ', 'g'),
+            '(?<= )(город|г|дом|д|квартира|кв)(?= )', '', 'g'),
+        '\s+', ' ', 'g'
+    ))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+-- Слова в названии улицы сортируются: "ул. Ленина" и "Ленина ул." совпадают.
+CREATE OR REPLACE FUNCTION normalize_street(value TEXT) RETURNS TEXT AS $$
+    SELECT coalesce(string_agg(word, ' ' ORDER BY word), '')
+    FROM unnest(string_to_array(normalize_address_text(value), ' ')) AS word
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION normalize_address(
+    region TEXT, city TEXT, street TEXT, house TEXT, flat TEXT
+) RETURNS TEXT AS $$
+    SELECT normalize_address_text(region) || '|' || normalize_address_text(city) || '|'
+        || normalize_street(street) || '|' || normalize_address_text(house) || '|'
+        || normalize_address_text(flat)
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+ALTER TABLE
+    "user_addresses" ADD COLUMN "address_key" TEXT
+    GENERATED ALWAYS AS (md5(normalize_address("region", "city", "street", "house", "flat"))) STORED;
+ALTER TABLE
+    "user_addresses" ADD COLUMN "address_search" TEXT
+    GENERATED ALWAYS AS (normalize_address_text(
+        "region" || ' ' || "city" || ' ' || "street" || ' ' || "house" || ' ' || "flat"
+    )) STORED;
+ALTER TABLE
+    "user_addresses" ADD CONSTRAINT "user_addresses_address_key_unique" UNIQUE("address_key");
+CREATE INDEX "user_addresses_address_search_trgm_index" ON
+    "user_addresses" USING GIN ("address_search" gin_trgm_ops);
+
+CREATE TABLE "account_summaries"(
+    "account_id" BIGINT NOT NULL,
+    "user_id" BIGINT NOT NULL,
+    "account_number" TEXT NOT NULL,
+    "address_id" BIGINT NOT NULL,
+    "provider_id" BIGINT NOT NULL,
+    "address" TEXT NOT NULL,
+    "owner_name" TEXT NOT NULL,
+    "area" FLOAT(53) NOT NULL,
+    "residents_count" INTEGER NOT NULL,
+    "management_company" TEXT NOT NULL,
+    "is_active" BOOLEAN NOT NULL,
+    "created_at" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL
+);
+ALTER TABLE
+    "account_summaries" ADD PRIMARY KEY("account_id");
+CREATE INDEX "account_summaries_user_id_created_at_index" ON
+    "account_summaries"("user_id", "created_at", "account_id");
+CREATE INDEX "account_summaries_address_id_index" ON
+    "account_summaries"("address_id");
+CREATE INDEX "account_summaries_provider_id_index" ON
+    "account_summaries"("provider_id");
+
+-- Витрина account_summaries: готовые к выдаче строки AccountResponse.
+-- Обновляется триггерами уровня оператора на accounts, user_addresses,
+-- user_profiles и providers; удалённые счета в витрину не попадают.
+CREATE OR REPLACE FUNCTION refresh_account_summaries(account_ids BIGINT[]) RETURNS void AS $$
+BEGIN
+    DELETE FROM account_summaries WHERE account_id = ANY(account_ids);
+    INSERT INTO account_summaries (
+        account_id, user_id, account_number, address_id, provider_id, address, owner_name,
+        area, residents_count, management_company, is_active, created_at
+    )
+    SELECT
+        a.id,
+        a.user_id,
+        a.account_number,
+        a.address_id,
+        a.provider_id,
+        ad.city || ', ' || ad.street || ', ' || ad.house || ', кв. ' || ad.flat,
+        p.last_name || ' ' || p.first_name || ' ' || p.middle_name,
+        ad.area,
+        ad.residents_counts,
+        pr.name,
+        a.is_active,
+        a.created_at
+    FROM accounts a
+    JOIN user_addresses ad ON ad.id = a.address_id
+    JOIN user_profiles p ON p.user_id = a.user_id
+    JOIN providers pr ON pr.id = a.provider_id
+    WHERE a.id = ANY(account_ids) AND a.is_deleted = false;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_summaries_on_accounts() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_account_summaries(ARRAY(SELECT id FROM changed_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_summaries_on_addresses() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_account_summaries(ARRAY(
+        SELECT s.account_id
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        JOIN account_summaries s ON s.address_id = c.id
+        WHERE (c.city, c.street, c.house, c.flat, c.area, c.residents_counts)
+            IS DISTINCT FROM (o.city, o.street, o.house, o.flat, o.area, o.residents_counts)
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_summaries_on_profiles() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_account_summaries(ARRAY(
+        SELECT a.id
+        FROM changed_rows c
+        JOIN accounts a ON a.user_id = c.user_id
+        WHERE a.is_deleted = false
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_summaries_on_providers() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_account_summaries(ARRAY(
+        SELECT s.account_id
+        FROM changed_rows c
+        JOIN account_summaries s ON s.provider_id = c.id
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "account_summaries_accounts_insert" AFTER INSERT ON "accounts"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_accounts();
+CREATE TRIGGER "account_summaries_accounts_update" AFTER UPDATE ON "accounts"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_accounts();
+CREATE TRIGGER "account_summaries_accounts_delete" AFTER DELETE ON "accounts"
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_accounts();
+CREATE TRIGGER "account_summaries_addresses_update" AFTER UPDATE ON "user_addresses"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_addresses();
+CREATE TRIGGER "account_summaries_profiles_insert" AFTER INSERT ON "user_profiles"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_profiles();
+CREATE TRIGGER "account_summaries_profiles_update" AFTER UPDATE ON "user_profiles"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_profiles();
+CREATE TRIGGER "account_summaries_providers_update" AFTER UPDATE ON "providers"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_providers();
+
+CREATE TABLE "account_debts"(
+    "account_id" BIGINT NOT NULL,
+    "unpaid_periods" DATE[] NOT NULL,
+    "outstanding_amount" DECIMAL(12, 2) NOT NULL,
+    "updated_at" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL DEFAULT now()
+);
+ALTER TABLE
+    "account_debts" ADD PRIMARY KEY("account_id");
+CREATE INDEX "bills_account_id_unpaid_index" ON
+    "bills"("account_id", "period") WHERE "status_type" <> 'paid';
+
+-- Сводка задолженности по счёту: неоплаченные периоды и сумма к оплате.
+-- Пересчитывается триггерами уровня оператора на bills только для затронутых
+-- счетов, в том числе когда payment_service отмечает счета оплаченными.
+-- Пересчёт счёта сериализуется блокировкой строки account_debts (FOR UPDATE в
+-- порядке возрастания account_id, чтобы не было взаимоблокировок; недостающие
+-- строки сначала вставляются пустыми). Блокировки строк не занимают общую
+-- таблицу блокировок, поэтому пересчёт большого числа счетов в одной
+-- транзакции (COPY в billing_run, rebuild_rollups) не упирается в её размер.
+-- Итоговый INSERT выполняется уже после получения блокировок, поэтому видит
+-- счета, оплаченные параллельной транзакцией, и не перезаписывает строку
+-- устаревшими данными.
+CREATE OR REPLACE FUNCTION refresh_account_debts(account_ids BIGINT[]) RETURNS void AS $$
+BEGIN
+    INSERT INTO account_debts (account_id, unpaid_periods, outstanding_amount, updated_at)
+    SELECT ids.account_id, '{}', 0, now()
+    FROM (SELECT DISTINCT unnest(account_ids) AS account_id) ids
+    ORDER BY ids.account_id
+    ON CONFLICT (account_id) DO NOTHING;
+
+    PERFORM 1
+    FROM account_debts
+    WHERE account_id = ANY(account_ids)
+    ORDER BY account_id
+    FOR UPDATE;
+
+    INSERT INTO account_debts (account_id, unpaid_periods, outstanding_amount, updated_at)
+    SELECT
+        ids.account_id,
+        coalesce(unpaid.periods, '{}'),
+        coalesce(unpaid.total, 0),
+        now()
+    FROM (SELECT DISTINCT unnest(account_ids) AS account_id) ids
+    CROSS JOIN LATERAL (
+        SELECT array_agg(DISTINCT b.period ORDER BY b.period) AS periods, sum(b.amount) AS total
+        FROM bills b
+        WHERE b.account_id = ids.account_id AND b.status_type <> 'paid'
+    ) unpaid
+    ON CONFLICT (account_id) DO UPDATE SET
+        unpaid_periods = EXCLUDED.unpaid_periods,
+        outstanding_amount = EXCLUDED.outstanding_amount,
+        updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_debts_on_bills() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_account_debts(ARRAY(SELECT DISTINCT account_id FROM changed_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_debts_on_bills_update() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_account_debts(ARRAY(
+        SELECT c.account_id
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        WHERE (c.account_id, c.period, c.amount, c.status_type)
+            IS DISTINCT FROM (o.account_id, o.period, o.amount, o.status_type)
+        UNION
+        SELECT o.account_id
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        WHERE c.account_id <> o.account_id
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "account_debts_bills_insert" AFTER INSERT ON "bills"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_debts_on_bills();
+CREATE TRIGGER "account_debts_bills_update" AFTER UPDATE ON "bills"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_debts_on_bills_update();
+CREATE TRIGGER "account_debts_bills_delete" AFTER DELETE ON "bills"
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_debts_on_bills();
+
+CREATE TABLE "account_usage_monthly"(
+    "account_id" BIGINT NOT NULL,
+    "period" DATE NOT NULL,
+    "service_id" BIGINT NOT NULL,
+    "units" FLOAT(53) NOT NULL,
+    "amount" DECIMAL(12, 2) NOT NULL,
+    "paid_amount" DECIMAL(12, 2) NOT NULL
+);
+ALTER TABLE
+    "account_usage_monthly" ADD PRIMARY KEY("account_id", "period", "service_id");
+
+-- Версия статистики счёта: увеличивается при каждом пересчёте
+-- account_usage_monthly, по ней billing_service сбрасывает кэш статистики.
+CREATE TABLE "account_usage_versions"(
+    "account_id" BIGINT NOT NULL,
+    "version" BIGINT NOT NULL
+);
+ALTER TABLE
+    "account_usage_versions" ADD PRIMARY KEY("account_id");
+
+-- Помесячный объём и стоимость услуг по счёту для статистики потребления.
+-- Пересчитывается триггерами уровня оператора на bills для затронутых пар
+-- (счёт, период): при начислении, оплате и удалении строк.
+CREATE OR REPLACE FUNCTION refresh_account_usage(account_ids BIGINT[], periods DATE[]) RETURNS void AS $$
+BEGIN
+    INSERT INTO account_usage_monthly (account_id, period, service_id, units, amount, paid_amount)
+    SELECT
+        b.account_id,
+        b.period,
+        b.service_id,
+        sum(b.units),
+        sum(b.amount),
+        coalesce(sum(b.amount) FILTER (WHERE b.status_type = 'paid'), 0)
+    FROM (SELECT DISTINCT * FROM unnest(account_ids, periods) AS k(account_id, period)) k
+    JOIN bills b ON b.account_id = k.account_id AND b.period = k.period
+    GROUP BY b.account_id, b.period, b.service_id
+    ON CONFLICT (account_id, period, service_id) DO UPDATE SET
+        units = EXCLUDED.units,
+        amount = EXCLUDED.amount,
+        paid_amount = EXCLUDED.paid_amount;
+
+    DELETE FROM account_usage_monthly u
+    USING unnest(account_ids, periods) AS k(account_id, period)
+    WHERE u.account_id = k.account_id
+      AND u.period = k.period
+      AND NOT EXISTS (
+          SELECT 1 FROM bills b
+          WHERE b.account_id = u.account_id AND b.period = u.period AND b.service_id = u.service_id
+      );
+
+    INSERT INTO account_usage_versions (account_id, version)
+    SELECT DISTINCT unnest(account_ids), 1
+    ON CONFLICT (account_id) DO UPDATE SET version = account_usage_versions.version + 1;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_usage_on_bills() RETURNS trigger AS $$
+DECLARE
+    account_ids BIGINT[];
+    periods DATE[];
+BEGIN
+    SELECT array_agg(k.account_id), array_agg(k.period) INTO account_ids, periods
+    FROM (SELECT DISTINCT account_id, period FROM changed_rows) k;
+    IF account_ids IS NOT NULL THEN
+        PERFORM refresh_account_usage(account_ids, periods);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_usage_on_bills_update() RETURNS trigger AS $$
+DECLARE
+    account_ids BIGINT[];
+    periods DATE[];
+BEGIN
+    SELECT array_agg(k.account_id), array_agg(k.period) INTO account_ids, periods
+    FROM (
+        SELECT c.account_id, c.period
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        WHERE (c.account_id, c.period, c.service_id, c.units, c.amount, c.status_type)
+            IS DISTINCT FROM (o.account_id, o.period, o.service_id, o.units, o.amount, o.status_type)
+        UNION
+        SELECT o.account_id, o.period
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        WHERE (c.account_id, c.period) IS DISTINCT FROM (o.account_id, o.period)
+    ) k;
+    IF account_ids IS NOT NULL THEN
+        PERFORM refresh_account_usage(account_ids, periods);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "account_usage_bills_insert" AFTER INSERT ON "bills"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_usage_on_bills();
+CREATE TRIGGER "account_usage_bills_update" AFTER UPDATE ON "bills"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_usage_on_bills_update();
+CREATE TRIGGER "account_usage_bills_delete" AFTER DELETE ON "bills"
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_usage_on_bills();
+
+CREATE TABLE "provider_period_totals"(
+    "provider_id" BIGINT NOT NULL,
+    "period" DATE NOT NULL,
+    "billed_amount" DECIMAL(14, 2) NOT NULL,
+    "collected_amount" DECIMAL(14, 2) NOT NULL,
+    "bills_count" BIGINT NOT NULL,
+    "paid_bills_count" BIGINT NOT NULL
+);
+ALTER TABLE
+    "provider_period_totals" ADD PRIMARY KEY("provider_id", "period");
+
+-- Начислено и собрано по поставщику за период. Триггеры уровня оператора на
+-- bills прибавляют разницу, посчитанную по переходным таблицам, так что
+-- стоимость обновления зависит от числа затронутых пар (поставщик, период),
+-- а не от объёма bills. Полный пересчёт: jobs/rebuild_rollups.py.
+CREATE OR REPLACE FUNCTION provider_totals_on_bills() RETURNS trigger AS $$
+DECLARE
+    direction INTEGER := TG_ARGV[0]::INTEGER;
+BEGIN
+    INSERT INTO provider_period_totals AS t (
+        provider_id, period, billed_amount, collected_amount, bills_count, paid_bills_count
+    )
+    SELECT
+        s.provider_id,
+        c.period,
+        direction * sum(c.amount),
+        direction * coalesce(sum(c.amount) FILTER (WHERE c.status_type = 'paid'), 0),
+        direction * count(*),
+        direction * count(*) FILTER (WHERE c.status_type = 'paid')
+    FROM changed_rows c
+    JOIN services s ON s.id = c.service_id
+    GROUP BY s.provider_id, c.period
+    ON CONFLICT (provider_id, period) DO UPDATE SET
+        billed_amount = t.billed_amount + EXCLUDED.billed_amount,
+        collected_amount = t.collected_amount + EXCLUDED.collected_amount,
+        bills_count = t.bills_count + EXCLUDED.bills_count,
+        paid_bills_count = t.paid_bills_count + EXCLUDED.paid_bills_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION provider_totals_on_bills_update() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO provider_period_totals AS t (
+        provider_id, period, billed_amount, collected_amount, bills_count, paid_bills_count
+    )
+    SELECT
+        s.provider_id,
+        d.period,
+        sum(d.sign * d.amount),
+        coalesce(sum(d.sign * d.amount) FILTER (WHERE d.status_type = 'paid'), 0),
+        sum(d.sign),
+        coalesce(sum(d.sign) FILTER (WHERE d.status_type = 'paid'), 0)
+    FROM (
+        SELECT c.service_id, c.period, c.amount, c.status_type, 1 AS sign
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        WHERE (c.service_id, c.period, c.amount, c.status_type)
+            IS DISTINCT FROM (o.service_id, o.period, o.amount, o.status_type)
+        UNION ALL
+        SELECT o.service_id, o.period, o.amount, o.status_type, -1 AS sign
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        WHERE (c.service_id, c.period, c.amount, c.status_type)
+            IS DISTINCT FROM (o.service_id, o.period, o.amount, o.status_type)
+    ) d
+    JOIN services s ON s.id = d.service_id
+    GROUP BY s.provider_id, d.period
+    ON CONFLICT (provider_id, period) DO UPDATE SET
+        billed_amount = t.billed_amount + EXCLUDED.billed_amount,
+        collected_amount = t.collected_amount + EXCLUDED.collected_amount,
+        bills_count = t.bills_count + EXCLUDED.bills_count,
+        paid_bills_count = t.paid_bills_count + EXCLUDED.paid_bills_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rebuild_provider_period_totals() RETURNS void AS $$
+BEGIN
+    DELETE FROM provider_period_totals;
+    INSERT INTO provider_period_totals (
+        provider_id, period, billed_amount, collected_amount, bills_count, paid_bills_count
+    )
+    SELECT
+        s.provider_id,
+        b.period,
+        sum(b.amount),
+        coalesce(sum(b.amount) FILTER (WHERE b.status_type = 'paid'), 0),
+        count(*),
+        count(*) FILTER (WHERE b.status_type = 'paid')
+    FROM bills b
+    JOIN services s ON s.id = b.service_id
+    GROUP BY s.provider_id, b.period;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "provider_totals_bills_insert" AFTER INSERT ON "bills"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION provider_totals_on_bills('1');
+CREATE TRIGGER "provider_totals_bills_update" AFTER UPDATE ON "bills"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION provider_totals_on_bills_update();
+CREATE TRIGGER "provider_totals_bills_delete" AFTER DELETE ON "bills"
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION provider_totals_on_bills('-1');
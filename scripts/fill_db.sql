@@ -37,16 +37,16 @@ INSERT INTO providers (id, name, inn, ogrn, created_at) VALUES
 (5, 'ОАО "Свердловэнерго"', '660500567890', '1026600005678', '2024-01-01 11:00:00');
 
 -- 5. Услуги (service_name как BIGINT - код услуги)
-INSERT INTO services (service_name, provider_id, cost_per_unit) VALUES
-('ХВС', 1, 35.50), 
-('ГВС', 1, 185.20), 
-('ВО', 1, 28.75), 
-('ЭЭ', 2, 4.85),  
-('Отопление', 2, 2800.00),
-('Содержание жилья', 3, 25.00),
-('Капитальный ремонт', 3, 12.50),
-('Теплоснабжение СПб', 4, 3200.00),
-('ЭЭ Урал', 5, 5.20);
+INSERT INTO services (service_name, provider_id, cost_per_unit, calculation_method) VALUES
+('ХВС', 1, 35.50, 'metered'), 
+('ГВС', 1, 185.20, 'metered'), 
+('ВО', 1, 28.75, 'metered'), 
+('ЭЭ', 2, 4.85, 'metered'),  
+('Отопление', 2, 2800.00, 'fixed'),
+('Содержание жилья', 3, 25.00, 'area'),
+('Капитальный ремонт', 3, 12.50, 'area'),
+('Теплоснабжение СПб', 4, 3200.00, 'fixed'),
+('ЭЭ Урал', 5, 5.20, 'metered');
 
 -- 6. Лицевые счета (по 1-2 на пользователя)
 INSERT INTO accounts (id, user_id, account_number, address_id, provider_id, created_at, is_active, is_deleted) VALUES
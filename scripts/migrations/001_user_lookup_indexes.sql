@@ -0,0 +1,5 @@
+-- Индексы для разрешения keycloak_id -> users.id и выборки счетов по user_id
+ALTER TABLE
+    "users" ADD CONSTRAINT "users_keycloack_id_unique" UNIQUE("keycloack_id");
+CREATE INDEX IF NOT EXISTS "accounts_user_id_index" ON
+    "accounts"("user_id");
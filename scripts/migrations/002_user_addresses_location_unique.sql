@@ -0,0 +1,20 @@
+-- Уникальный ключ адреса для INSERT ... ON CONFLICT при создании счёта.
+-- Дубликаты сводятся к адресу с минимальным id.
+BEGIN;
+
+CREATE TEMPORARY TABLE "address_duplicates" ON COMMIT DROP AS
+SELECT "id", min("id") OVER (PARTITION BY "region", "city", "street", "house", "flat") AS "keep_id"
+FROM "user_addresses";
+
+UPDATE "accounts" SET "address_id" = d."keep_id"
+FROM "address_duplicates" d
+WHERE "accounts"."address_id" = d."id" AND d."id" <> d."keep_id";
+
+DELETE FROM "user_addresses" a
+USING "address_duplicates" d
+WHERE a."id" = d."id" AND d."id" <> d."keep_id";
+
+ALTER TABLE
+    "user_addresses" ADD CONSTRAINT "user_addresses_location_unique" UNIQUE("region", "city", "street", "house", "flat");
+
+COMMIT;
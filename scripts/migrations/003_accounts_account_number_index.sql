@@ -0,0 +1,3 @@
+-- Проверка дубликатов номеров лицевых счетов при массовом импорте
+CREATE INDEX IF NOT EXISTS "accounts_account_number_index" ON
+    "accounts"("account_number");
@@ -0,0 +1,126 @@
+-- Витрина account_summaries для чтения счетов одним индексным запросом
+BEGIN;
+
+CREATE TABLE "account_summaries"(
+    "account_id" BIGINT NOT NULL,
+    "user_id" BIGINT NOT NULL,
+    "account_number" TEXT NOT NULL,
+    "address_id" BIGINT NOT NULL,
+    "provider_id" BIGINT NOT NULL,
+    "address" TEXT NOT NULL,
+    "owner_name" TEXT NOT NULL,
+    "area" FLOAT(53) NOT NULL,
+    "residents_count" INTEGER NOT NULL,
+    "management_company" TEXT NOT NULL,
+    "is_active" BOOLEAN NOT NULL,
+    "created_at" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL
+);
+ALTER TABLE
+    "account_summaries" ADD PRIMARY KEY("account_id");
+CREATE INDEX "account_summaries_user_id_created_at_index" ON
+    "account_summaries"("user_id", "created_at", "account_id");
+CREATE INDEX "account_summaries_address_id_index" ON
+    "account_summaries"("address_id");
+CREATE INDEX "account_summaries_provider_id_index" ON
+    "account_summaries"("provider_id");
+
+-- Витрина account_summaries: готовые к выдаче строки AccountResponse.
+-- Обновляется триггерами уровня оператора на accounts, user_addresses,
+-- user_profiles и providers; удалённые счета в витрину не попадают.
+CREATE OR REPLACE FUNCTION refresh_account_summaries(account_ids BIGINT[]) RETURNS void AS $$
+BEGIN
+    DELETE FROM account_summaries WHERE account_id = ANY(account_ids);
+    INSERT INTO account_summaries (
+        account_id, user_id, account_number, address_id, provider_id, address, owner_name,
+        area, residents_count, management_company, is_active, created_at
+    )
+    SELECT
+        a.id,
+        a.user_id,
+        a.account_number,
+        a.address_id,
+        a.provider_id,
+        ad.city || ', ' || ad.street || ', ' || ad.house || ', кв. ' || ad.flat,
+        p.last_name || ' ' || p.first_name || ' ' || p.middle_name,
+        ad.area,
+        ad.residents_counts,
+        pr.name,
+        a.is_active,
+        a.created_at
+    FROM accounts a
+    JOIN user_addresses ad ON ad.id = a.address_id
+    JOIN user_profiles p ON p.user_id = a.user_id
+    JOIN providers pr ON pr.id = a.provider_id
+    WHERE a.id = ANY(account_ids) AND a.is_deleted = false;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_summaries_on_accounts() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_account_summaries(ARRAY(SELECT id FROM changed_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_summaries_on_addresses() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_account_summaries(ARRAY(
+        SELECT s.account_id
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        JOIN account_summaries s ON s.address_id = c.id
+        WHERE (c.city, c.street, c.house, c.flat, c.area, c.residents_counts)
+            IS DISTINCT FROM (o.city, o.street, o.house, o.flat, o.area, o.residents_counts)
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_summaries_on_profiles() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_account_summaries(ARRAY(
+        SELECT a.id
+        FROM changed_rows c
+        JOIN accounts a ON a.user_id = c.user_id
+        WHERE a.is_deleted = false
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_summaries_on_providers() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_account_summaries(ARRAY(
+        SELECT s.account_id
+        FROM changed_rows c
+        JOIN account_summaries s ON s.provider_id = c.id
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "account_summaries_accounts_insert" AFTER INSERT ON "accounts"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_accounts();
+CREATE TRIGGER "account_summaries_accounts_update" AFTER UPDATE ON "accounts"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_accounts();
+CREATE TRIGGER "account_summaries_accounts_delete" AFTER DELETE ON "accounts"
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_accounts();
+CREATE TRIGGER "account_summaries_addresses_update" AFTER UPDATE ON "user_addresses"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_addresses();
+CREATE TRIGGER "account_summaries_profiles_insert" AFTER INSERT ON "user_profiles"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_profiles();
+CREATE TRIGGER "account_summaries_profiles_update" AFTER UPDATE ON "user_profiles"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_profiles();
+CREATE TRIGGER "account_summaries_providers_update" AFTER UPDATE ON "providers"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_summaries_on_providers();
+
+SELECT refresh_account_summaries(ARRAY(SELECT id FROM accounts));
+
+COMMIT;
@@ -0,0 +1,72 @@
+-- Нормализованный ключ адреса вместо точного совпадения пяти колонок и
+-- триграммный индекс для автодополнения. Дубликаты по новому ключу сводятся
+-- к адресу с минимальным id.
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Нормализация адреса: регистр, ё -> е, пунктуация и пробелы, сокращения
+-- типов улиц и служебные слова (г., д., кв.). Используется в генерируемых
+-- колонках user_addresses и в поиске, поэтому должна оставаться IMMUTABLE.
+CREATE OR REPLACE FUNCTION normalize_address_text(value TEXT) RETURNS TEXT AS $$
+    SELECT btrim(regexp_replace(
+        regexp_replace(regexp_replace(regexp_replace(regexp_replace(regexp_replace(
+        regexp_replace(regexp_replace(regexp_replace(regexp_replace(regexp_replace(
+            ' ' || regexp_replace(lower(translate(value, 'Ёё', 'ее')), '[^0-9a-zа-я]+', ' ', 'g') || ' ',
+            '(?<= )(улица|ул)(?= )', 'ул', 'g'),
+            '(?<= )(проспект|просп|пр)(?= )', 'пр', 'g'),
+            '(?<= )(переулок|пер)(?= )', 'пер', 'g'),
+            '(?<= )(бульвар|бул)(?= )', 'бул', 'g'),
+            '(?<= )(шоссе|ш)(?= )', 'ш', 'g'),
+            '(?<= )(площадь|пл)(?= )', 'пл', 'g'),
+            '(?<= )(набережная|наб)(?= )', 'наб', 'g'),
+            '(?<= )(область|обл)(?= )', 'обл', 'g'),
+            '(?<= )(республика|респ)(?= )', 'респ', 'g'),
+            '(?<= )(город|г|дом|д|квартира|кв)(?= )', '', 'g'),
+        '\s+', ' ', 'g'
+    ))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+-- Слова в названии улицы сортируются: "ул. Ленина" и "Ленина ул." совпадают.
+CREATE OR REPLACE FUNCTION normalize_street(value TEXT) RETURNS TEXT AS $$
+    SELECT coalesce(string_agg(word, ' ' ORDER BY word), '')
+    FROM unnest(string_to_array(normalize_address_text(value), ' ')) AS word
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION normalize_address(
+    region TEXT, city TEXT, street TEXT, house TEXT, flat TEXT
+) RETURNS TEXT AS $$
+    SELECT normalize_address_text(region) || '|' || normalize_address_text(city) || '|'
+        || normalize_street(street) || '|' || normalize_address_text(house) || '|'
+        || normalize_address_text(flat)
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+ALTER TABLE
+    "user_addresses" ADD COLUMN "address_key" TEXT
+    GENERATED ALWAYS AS (md5(normalize_address("region", "city", "street", "house", "flat"))) STORED;
+ALTER TABLE
+    "user_addresses" ADD COLUMN "address_search" TEXT
+    GENERATED ALWAYS AS (normalize_address_text(
+        "region" || ' ' || "city" || ' ' || "street" || ' ' || "house" || ' ' || "flat"
+    )) STORED;
+
+CREATE TEMPORARY TABLE "address_duplicates" ON COMMIT DROP AS
+SELECT "id", min("id") OVER (PARTITION BY "address_key") AS "keep_id"
+FROM "user_addresses";
+
+UPDATE "accounts" SET "address_id" = d."keep_id"
+FROM "address_duplicates" d
+WHERE "accounts"."address_id" = d."id" AND d."id" <> d."keep_id";
+
+DELETE FROM "user_addresses" a
+USING "address_duplicates" d
+WHERE a."id" = d."id" AND d."id" <> d."keep_id";
+
+ALTER TABLE
+    "user_addresses" DROP CONSTRAINT IF EXISTS "user_addresses_location_unique";
+ALTER TABLE
+    "user_addresses" ADD CONSTRAINT "user_addresses_address_key_unique" UNIQUE("address_key");
+CREATE INDEX "user_addresses_address_search_trgm_index" ON
+    "user_addresses" USING GIN ("address_search" gin_trgm_ops);
+
+COMMIT;
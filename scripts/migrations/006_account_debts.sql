@@ -0,0 +1,76 @@
+-- Сводка задолженности account_debts для экрана неоплаченных периодов
+BEGIN;
+
+CREATE TABLE "account_debts"(
+    "account_id" BIGINT NOT NULL,
+    "unpaid_periods" DATE[] NOT NULL,
+    "outstanding_amount" DECIMAL(12, 2) NOT NULL,
+    "updated_at" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL DEFAULT now()
+);
+ALTER TABLE
+    "account_debts" ADD PRIMARY KEY("account_id");
+CREATE INDEX "bills_account_id_unpaid_index" ON
+    "bills"("account_id", "period") WHERE "status_type" <> 'paid';
+
+-- Сводка задолженности по счёту: неоплаченные периоды и сумма к оплате.
+-- Пересчитывается триггерами уровня оператора на bills только для затронутых
+-- счетов, в том числе когда payment_service отмечает счета оплаченными.
+CREATE OR REPLACE FUNCTION refresh_account_debts(account_ids BIGINT[]) RETURNS void AS $$
+BEGIN
+    INSERT INTO account_debts (account_id, unpaid_periods, outstanding_amount, updated_at)
+    SELECT
+        ids.account_id,
+        coalesce(unpaid.periods, '{}'),
+        coalesce(unpaid.total, 0),
+        now()
+    FROM (SELECT DISTINCT unnest(account_ids) AS account_id) ids
+    CROSS JOIN LATERAL (
+        SELECT array_agg(DISTINCT b.period ORDER BY b.period) AS periods, sum(b.amount) AS total
+        FROM bills b
+        WHERE b.account_id = ids.account_id AND b.status_type <> 'paid'
+    ) unpaid
+    ON CONFLICT (account_id) DO UPDATE SET
+        unpaid_periods = EXCLUDED.unpaid_periods,
+        outstanding_amount = EXCLUDED.outstanding_amount,
+        updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_debts_on_bills() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_account_debts(ARRAY(SELECT DISTINCT account_id FROM changed_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_debts_on_bills_update() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_account_debts(ARRAY(
+        SELECT c.account_id
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        WHERE (c.account_id, c.period, c.amount, c.status_type)
+            IS DISTINCT FROM (o.account_id, o.period, o.amount, o.status_type)
+        UNION
+        SELECT o.account_id
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        WHERE c.account_id <> o.account_id
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "account_debts_bills_insert" AFTER INSERT ON "bills"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_debts_on_bills();
+CREATE TRIGGER "account_debts_bills_update" AFTER UPDATE ON "bills"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_debts_on_bills_update();
+CREATE TRIGGER "account_debts_bills_delete" AFTER DELETE ON "bills"
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_debts_on_bills();
+
+SELECT refresh_account_debts(ARRAY(SELECT id FROM accounts));
+
+COMMIT;
@@ -0,0 +1,14 @@
+-- Способ расчёта объёма услуги для ежемесячного начисления (jobs/billing_run.py):
+-- metered - по разнице показаний, area - по площади, residents - по числу
+-- проживающих, fixed - объём предыдущего периода.
+BEGIN;
+
+ALTER TABLE "services" ADD COLUMN "calculation_method" TEXT NOT NULL DEFAULT 'metered'
+    CHECK ("calculation_method" IN ('metered', 'area', 'residents', 'fixed'));
+
+UPDATE "services" SET "calculation_method" = 'fixed'
+WHERE "service_name" IN ('Отопление', 'Теплоснабжение СПб');
+UPDATE "services" SET "calculation_method" = 'area'
+WHERE "service_name" IN ('Содержание жилья', 'Капитальный ремонт');
+
+COMMIT;
@@ -0,0 +1,71 @@
+-- Секционирование bills по месяцам, единый тип period (DATE, первое число
+-- месяца) и составные индексы под запросы billing_service и payment_service.
+BEGIN;
+
+ALTER TABLE "payment_bills" DROP CONSTRAINT "payment_bills_bill_id_foreign";
+ALTER TABLE "bills" RENAME TO "bills_unpartitioned";
+
+CREATE TABLE "bills"(
+    "id" INTEGER NOT NULL DEFAULT nextval('bills_id_seq'),
+    "account_id" BIGINT NOT NULL,
+    "service_id" BIGINT NOT NULL,
+    "period" DATE NOT NULL CHECK (EXTRACT(DAY FROM "period") = 1),
+    "amount" DECIMAL(8, 2) NOT NULL,
+    "status_type" TEXT NOT NULL,
+    "last_data" FLOAT(53) NOT NULL,
+    "units" FLOAT(53) NOT NULL
+) PARTITION BY RANGE("period");
+ALTER SEQUENCE "bills_id_seq" OWNED BY "bills"."id";
+CREATE TABLE "bills_default" PARTITION OF "bills" DEFAULT;
+
+CREATE OR REPLACE FUNCTION ensure_bills_partition(target DATE) RETURNS void AS $$
+DECLARE
+    start_date DATE := date_trunc('month', target)::date;
+    partition_name TEXT := 'bills_' || to_char(start_date, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF bills FOR VALUES FROM (%L) TO (%L)',
+            partition_name, start_date, (start_date + INTERVAL '1 month')::date
+        );
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_bills_partition(month::date)
+FROM generate_series(
+    (SELECT coalesce(date_trunc('month', min("period")), date_trunc('year', now())) FROM "bills_unpartitioned"),
+    date_trunc('year', now()) + INTERVAL '1 year 11 months',
+    INTERVAL '1 month'
+) AS month;
+
+-- Данные переносятся до создания индексов и триггеров: account_debts уже
+-- соответствует содержимому таблицы.
+INSERT INTO "bills" (id, account_id, service_id, period, amount, status_type, last_data, units)
+SELECT id, account_id, service_id, date_trunc('month', period)::date, amount, status_type, last_data, units
+FROM "bills_unpartitioned";
+
+DROP TABLE "bills_unpartitioned";
+
+ALTER TABLE
+    "bills" ADD PRIMARY KEY("id", "period");
+ALTER TABLE
+    "bills" ADD CONSTRAINT "bills_account_id_period_service_id_unique" UNIQUE("account_id", "period", "service_id");
+ALTER TABLE
+    "bills" ADD CONSTRAINT "bills_account_id_foreign" FOREIGN KEY("account_id") REFERENCES "accounts"("id");
+ALTER TABLE
+    "bills" ADD CONSTRAINT "bills_service_id_foreign" FOREIGN KEY("service_id") REFERENCES "services"("id");
+CREATE INDEX "bills_account_id_unpaid_index" ON
+    "bills"("account_id", "period") WHERE "status_type" <> 'paid';
+
+CREATE TRIGGER "account_debts_bills_insert" AFTER INSERT ON "bills"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_debts_on_bills();
+CREATE TRIGGER "account_debts_bills_update" AFTER UPDATE ON "bills"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_debts_on_bills_update();
+CREATE TRIGGER "account_debts_bills_delete" AFTER DELETE ON "bills"
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_debts_on_bills();
+
+COMMIT;
@@ -0,0 +1,107 @@
+-- Помесячная статистика потребления account_usage_monthly
+BEGIN;
+
+CREATE TABLE "account_usage_monthly"(
+    "account_id" BIGINT NOT NULL,
+    "period" DATE NOT NULL,
+    "service_id" BIGINT NOT NULL,
+    "units" FLOAT(53) NOT NULL,
+    "amount" DECIMAL(12, 2) NOT NULL,
+    "paid_amount" DECIMAL(12, 2) NOT NULL
+);
+ALTER TABLE
+    "account_usage_monthly" ADD PRIMARY KEY("account_id", "period", "service_id");
+
+-- Помесячный объём и стоимость услуг по счёту для статистики потребления.
+-- Пересчитывается триггерами уровня оператора на bills для затронутых пар
+-- (счёт, период): при начислении, оплате и удалении строк.
+CREATE OR REPLACE FUNCTION refresh_account_usage(account_ids BIGINT[], periods DATE[]) RETURNS void AS $$
+BEGIN
+    INSERT INTO account_usage_monthly (account_id, period, service_id, units, amount, paid_amount)
+    SELECT
+        b.account_id,
+        b.period,
+        b.service_id,
+        sum(b.units),
+        sum(b.amount),
+        coalesce(sum(b.amount) FILTER (WHERE b.status_type = 'paid'), 0)
+    FROM (SELECT DISTINCT * FROM unnest(account_ids, periods) AS k(account_id, period)) k
+    JOIN bills b ON b.account_id = k.account_id AND b.period = k.period
+    GROUP BY b.account_id, b.period, b.service_id
+    ON CONFLICT (account_id, period, service_id) DO UPDATE SET
+        units = EXCLUDED.units,
+        amount = EXCLUDED.amount,
+        paid_amount = EXCLUDED.paid_amount;
+
+    DELETE FROM account_usage_monthly u
+    USING unnest(account_ids, periods) AS k(account_id, period)
+    WHERE u.account_id = k.account_id
+      AND u.period = k.period
+      AND NOT EXISTS (
+          SELECT 1 FROM bills b
+          WHERE b.account_id = u.account_id AND b.period = u.period AND b.service_id = u.service_id
+      );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_usage_on_bills() RETURNS trigger AS $$
+DECLARE
+    account_ids BIGINT[];
+    periods DATE[];
+BEGIN
+    SELECT array_agg(k.account_id), array_agg(k.period) INTO account_ids, periods
+    FROM (SELECT DISTINCT account_id, period FROM changed_rows) k;
+    IF account_ids IS NOT NULL THEN
+        PERFORM refresh_account_usage(account_ids, periods);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION account_usage_on_bills_update() RETURNS trigger AS $$
+DECLARE
+    account_ids BIGINT[];
+    periods DATE[];
+BEGIN
+    SELECT array_agg(k.account_id), array_agg(k.period) INTO account_ids, periods
+    FROM (
+        SELECT c.account_id, c.period
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        WHERE (c.account_id, c.period, c.service_id, c.units, c.amount, c.status_type)
+            IS DISTINCT FROM (o.account_id, o.period, o.service_id, o.units, o.amount, o.status_type)
+        UNION
+        SELECT o.account_id, o.period
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        WHERE (c.account_id, c.period) IS DISTINCT FROM (o.account_id, o.period)
+    ) k;
+    IF account_ids IS NOT NULL THEN
+        PERFORM refresh_account_usage(account_ids, periods);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "account_usage_bills_insert" AFTER INSERT ON "bills"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_usage_on_bills();
+CREATE TRIGGER "account_usage_bills_update" AFTER UPDATE ON "bills"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_usage_on_bills_update();
+CREATE TRIGGER "account_usage_bills_delete" AFTER DELETE ON "bills"
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION account_usage_on_bills();
+
+INSERT INTO account_usage_monthly (account_id, period, service_id, units, amount, paid_amount)
+SELECT
+    account_id,
+    period,
+    service_id,
+    sum(units),
+    sum(amount),
+    coalesce(sum(amount) FILTER (WHERE status_type = 'paid'), 0)
+FROM bills
+GROUP BY account_id, period, service_id;
+
+COMMIT;
@@ -0,0 +1,112 @@
+-- Начисления и сборы по поставщикам provider_period_totals
+BEGIN;
+
+CREATE TABLE "provider_period_totals"(
+    "provider_id" BIGINT NOT NULL,
+    "period" DATE NOT NULL,
+    "billed_amount" DECIMAL(14, 2) NOT NULL,
+    "collected_amount" DECIMAL(14, 2) NOT NULL,
+    "bills_count" BIGINT NOT NULL,
+    "paid_bills_count" BIGINT NOT NULL
+);
+ALTER TABLE
+    "provider_period_totals" ADD PRIMARY KEY("provider_id", "period");
+
+-- Начислено и собрано по поставщику за период. Триггеры уровня оператора на
+-- bills прибавляют разницу, посчитанную по переходным таблицам, так что
+-- стоимость обновления зависит от числа затронутых пар (поставщик, период),
+-- а не от объёма bills. Полный пересчёт: jobs/rebuild_rollups.py.
+CREATE OR REPLACE FUNCTION provider_totals_on_bills() RETURNS trigger AS $$
+DECLARE
+    direction INTEGER := TG_ARGV[0]::INTEGER;
+BEGIN
+    INSERT INTO provider_period_totals AS t (
+        provider_id, period, billed_amount, collected_amount, bills_count, paid_bills_count
+    )
+    SELECT
+        s.provider_id,
+        c.period,
+        direction * sum(c.amount),
+        direction * coalesce(sum(c.amount) FILTER (WHERE c.status_type = 'paid'), 0),
+        direction * count(*),
+        direction * count(*) FILTER (WHERE c.status_type = 'paid')
+    FROM changed_rows c
+    JOIN services s ON s.id = c.service_id
+    GROUP BY s.provider_id, c.period
+    ON CONFLICT (provider_id, period) DO UPDATE SET
+        billed_amount = t.billed_amount + EXCLUDED.billed_amount,
+        collected_amount = t.collected_amount + EXCLUDED.collected_amount,
+        bills_count = t.bills_count + EXCLUDED.bills_count,
+        paid_bills_count = t.paid_bills_count + EXCLUDED.paid_bills_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION provider_totals_on_bills_update() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO provider_period_totals AS t (
+        provider_id, period, billed_amount, collected_amount, bills_count, paid_bills_count
+    )
+    SELECT
+        s.provider_id,
+        d.period,
+        sum(d.sign * d.amount),
+        coalesce(sum(d.sign * d.amount) FILTER (WHERE d.status_type = 'paid'), 0),
+        sum(d.sign),
+        coalesce(sum(d.sign) FILTER (WHERE d.status_type = 'paid'), 0)
+    FROM (
+        SELECT c.service_id, c.period, c.amount, c.status_type, 1 AS sign
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        WHERE (c.service_id, c.period, c.amount, c.status_type)
+            IS DISTINCT FROM (o.service_id, o.period, o.amount, o.status_type)
+        UNION ALL
+        SELECT o.service_id, o.period, o.amount, o.status_type, -1 AS sign
+        FROM changed_rows c
+        JOIN old_rows o ON o.id = c.id
+        WHERE (c.service_id, c.period, c.amount, c.status_type)
+            IS DISTINCT FROM (o.service_id, o.period, o.amount, o.status_type)
+    ) d
+    JOIN services s ON s.id = d.service_id
+    GROUP BY s.provider_id, d.period
+    ON CONFLICT (provider_id, period) DO UPDATE SET
+        billed_amount = t.billed_amount + EXCLUDED.billed_amount,
+        collected_amount = t.collected_amount + EXCLUDED.collected_amount,
+        bills_count = t.bills_count + EXCLUDED.bills_count,
+        paid_bills_count = t.paid_bills_count + EXCLUDED.paid_bills_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rebuild_provider_period_totals() RETURNS void AS $$
+BEGIN
+    DELETE FROM provider_period_totals;
+    INSERT INTO provider_period_totals (
+        provider_id, period, billed_amount, collected_amount, bills_count, paid_bills_count
+    )
+    SELECT
+        s.provider_id,
+        b.period,
+        sum(b.amount),
+        coalesce(sum(b.amount) FILTER (WHERE b.status_type = 'paid'), 0),
+        count(*),
+        count(*) FILTER (WHERE b.status_type = 'paid')
+    FROM bills b
+    JOIN services s ON s.id = b.service_id
+    GROUP BY s.provider_id, b.period;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER "provider_totals_bills_insert" AFTER INSERT ON "bills"
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION provider_totals_on_bills('1');
+CREATE TRIGGER "provider_totals_bills_update" AFTER UPDATE ON "bills"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION provider_totals_on_bills_update();
+CREATE TRIGGER "provider_totals_bills_delete" AFTER DELETE ON "bills"
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION provider_totals_on_bills('-1');
+
+SELECT rebuild_provider_period_totals();
+
+COMMIT;
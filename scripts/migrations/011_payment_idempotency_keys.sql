@@ -0,0 +1,18 @@
+-- Ключи идемпотентности для POST /api/payments/
+BEGIN;
+
+CREATE TABLE "payment_idempotency_keys"(
+    "user_key" TEXT NOT NULL,
+    "idempotency_key" TEXT NOT NULL,
+    "request_hash" TEXT NOT NULL,
+    "status_code" INTEGER,
+    "response" JSONB,
+    "created_at" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+    "expires_at" TIMESTAMP(0) WITHOUT TIME ZONE NOT NULL
+);
+ALTER TABLE
+    "payment_idempotency_keys" ADD PRIMARY KEY("user_key", "idempotency_key");
+CREATE INDEX "payment_idempotency_keys_expires_at_index" ON
+    "payment_idempotency_keys"("expires_at");
+
+COMMIT;
@@ -0,0 +1,3 @@
+-- Счета платежа: снятие брони со счетов брошенных платежей и GET /api/payments/{id}
+CREATE INDEX IF NOT EXISTS "payment_bills_payment_id_index" ON
+    "payment_bills"("payment_id");
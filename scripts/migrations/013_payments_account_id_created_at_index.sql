@@ -0,0 +1,4 @@
+-- История платежей (GET /api/payments/history): страница по ключу (created_at, id)
+-- читается одним диапазонным сканированием индекса без обращения к таблице
+CREATE INDEX IF NOT EXISTS "payments_account_id_created_at_index" ON
+    "payments"("account_id", "created_at" DESC, "id" DESC) INCLUDE ("amount", "status", "paid_at");
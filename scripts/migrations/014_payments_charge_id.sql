@@ -0,0 +1,9 @@
+-- Сверка платежей с реестром эквайера (jobs/reconcile.py):
+-- charge_id связывает платежи, оплаченные одним списанием, а сумма платежа
+-- хранится с копейками, как в реестре
+BEGIN;
+
+ALTER TABLE "payments" ADD COLUMN "charge_id" BIGINT;
+ALTER TABLE "payments" ALTER COLUMN "amount" TYPE DECIMAL(12, 2);
+
+COMMIT;
@@ -0,0 +1,33 @@
+-- Сводка account_debts: параллельные оплаты разных периодов одного счёта
+-- больше не перезаписывают строку устаревшим снимком
+BEGIN;
+
+-- Пересчёт счёта сериализуется advisory-блокировкой по account_id (в порядке
+-- возрастания, чтобы не было взаимоблокировок): INSERT выполняется уже после
+-- её получения, поэтому видит счета, оплаченные параллельной транзакцией,
+-- и не перезаписывает строку устаревшими данными.
+CREATE OR REPLACE FUNCTION refresh_account_debts(account_ids BIGINT[]) RETURNS void AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(ids.account_id)
+    FROM (SELECT DISTINCT unnest(account_ids) AS account_id ORDER BY 1) ids;
+
+    INSERT INTO account_debts (account_id, unpaid_periods, outstanding_amount, updated_at)
+    SELECT
+        ids.account_id,
+        coalesce(unpaid.periods, '{}'),
+        coalesce(unpaid.total, 0),
+        now()
+    FROM (SELECT DISTINCT unnest(account_ids) AS account_id) ids
+    CROSS JOIN LATERAL (
+        SELECT array_agg(DISTINCT b.period ORDER BY b.period) AS periods, sum(b.amount) AS total
+        FROM bills b
+        WHERE b.account_id = ids.account_id AND b.status_type <> 'paid'
+    ) unpaid
+    ON CONFLICT (account_id) DO UPDATE SET
+        unpaid_periods = EXCLUDED.unpaid_periods,
+        outstanding_amount = EXCLUDED.outstanding_amount,
+        updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
@@ -0,0 +1,44 @@
+-- Версия статистики счёта для сброса кэша статистики в billing_service
+BEGIN;
+
+CREATE TABLE "account_usage_versions"(
+    "account_id" BIGINT NOT NULL,
+    "version" BIGINT NOT NULL
+);
+ALTER TABLE
+    "account_usage_versions" ADD PRIMARY KEY("account_id");
+
+CREATE OR REPLACE FUNCTION refresh_account_usage(account_ids BIGINT[], periods DATE[]) RETURNS void AS $$
+BEGIN
+    INSERT INTO account_usage_monthly (account_id, period, service_id, units, amount, paid_amount)
+    SELECT
+        b.account_id,
+        b.period,
+        b.service_id,
+        sum(b.units),
+        sum(b.amount),
+        coalesce(sum(b.amount) FILTER (WHERE b.status_type = 'paid'), 0)
+    FROM (SELECT DISTINCT * FROM unnest(account_ids, periods) AS k(account_id, period)) k
+    JOIN bills b ON b.account_id = k.account_id AND b.period = k.period
+    GROUP BY b.account_id, b.period, b.service_id
+    ON CONFLICT (account_id, period, service_id) DO UPDATE SET
+        units = EXCLUDED.units,
+        amount = EXCLUDED.amount,
+        paid_amount = EXCLUDED.paid_amount;
+
+    DELETE FROM account_usage_monthly u
+    USING unnest(account_ids, periods) AS k(account_id, period)
+    WHERE u.account_id = k.account_id
+      AND u.period = k.period
+      AND NOT EXISTS (
+          SELECT 1 FROM bills b
+          WHERE b.account_id = u.account_id AND b.period = u.period AND b.service_id = u.service_id
+      );
+
+    INSERT INTO account_usage_versions (account_id, version)
+    SELECT DISTINCT unnest(account_ids), 1
+    ON CONFLICT (account_id) DO UPDATE SET version = account_usage_versions.version + 1;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
@@ -0,0 +1,46 @@
+-- Сводка account_debts: advisory-блокировка на каждый счёт заменена
+-- блокировкой строк, чтобы массовый пересчёт не исчерпывал таблицу блокировок
+BEGIN;
+
+-- Пересчёт счёта сериализуется блокировкой строки account_debts (FOR UPDATE в
+-- порядке возрастания account_id, чтобы не было взаимоблокировок; недостающие
+-- строки сначала вставляются пустыми). Блокировки строк не занимают общую
+-- таблицу блокировок, поэтому пересчёт большого числа счетов в одной
+-- транзакции (COPY в billing_run, rebuild_rollups) не упирается в её размер.
+-- Итоговый INSERT выполняется уже после получения блокировок, поэтому видит
+-- счета, оплаченные параллельной транзакцией, и не перезаписывает строку
+-- устаревшими данными.
+CREATE OR REPLACE FUNCTION refresh_account_debts(account_ids BIGINT[]) RETURNS void AS $$
+BEGIN
+    INSERT INTO account_debts (account_id, unpaid_periods, outstanding_amount, updated_at)
+    SELECT ids.account_id, '{}', 0, now()
+    FROM (SELECT DISTINCT unnest(account_ids) AS account_id) ids
+    ORDER BY ids.account_id
+    ON CONFLICT (account_id) DO NOTHING;
+
+    PERFORM 1
+    FROM account_debts
+    WHERE account_id = ANY(account_ids)
+    ORDER BY account_id
+    FOR UPDATE;
+
+    INSERT INTO account_debts (account_id, unpaid_periods, outstanding_amount, updated_at)
+    SELECT
+        ids.account_id,
+        coalesce(unpaid.periods, '{}'),
+        coalesce(unpaid.total, 0),
+        now()
+    FROM (SELECT DISTINCT unnest(account_ids) AS account_id) ids
+    CROSS JOIN LATERAL (
+        SELECT array_agg(DISTINCT b.period ORDER BY b.period) AS periods, sum(b.amount) AS total
+        FROM bills b
+        WHERE b.account_id = ids.account_id AND b.status_type <> 'paid'
+    ) unpaid
+    ON CONFLICT (account_id) DO UPDATE SET
+        unpaid_periods = EXCLUDED.unpaid_periods,
+        outstanding_amount = EXCLUDED.outstanding_amount,
+        updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;